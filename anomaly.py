@@ -0,0 +1,79 @@
+"""
+Streaming anomaly detection for incoming health records
+Keeps a short per-user, per-metric window and scores each new value against its median and MAD
+"""
+
+import os
+import json
+import logging
+from statistics import median
+from typing import List, Optional, Tuple
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Scale factor turning the MAD into a standard-deviation estimate for normal data
+MAD_TO_SIGMA = 1.4826
+
+
+class AnomalyDetector:
+    """Robust z-score test against a bounded window of recent values
+
+    Each (user, metric) keeps at most `window` recent values, so checking
+    and updating costs the same however long the user's history is. A
+    value is flagged when it lies more than `threshold` robust deviations
+    from the window median. The deviation never drops below the metric's
+    `min_spread` (an ordinary day-to-day change, in the metric's unit) or
+    `min_relative_spread` of the median, so a perfectly steady series
+    (MAD of zero) doesn't flag every small change; metrics on small
+    integer scales can also declare a higher threshold. Nothing is
+    flagged until `min_history` values have been seen.
+    """
+
+    def __init__(self, window: int = 15, min_history: int = 5, threshold: float = 6.0,
+                 min_relative_spread: float = 0.05):
+        self.window = window
+        self.min_history = min_history
+        self.threshold = threshold
+        self.min_relative_spread = min_relative_spread
+
+    @classmethod
+    def from_env(cls) -> 'AnomalyDetector':
+        return cls(
+            window=int(os.getenv("ANOMALY_WINDOW", "15")),
+            min_history=int(os.getenv("ANOMALY_MIN_HISTORY", "5")),
+            threshold=float(os.getenv("ANOMALY_THRESHOLD", "6"))
+        )
+
+    def score(self, history: List[float], value: float, min_spread: float = 0.0) -> Optional[float]:
+        """Robust z-score of value against history, or None with too little history"""
+        if len(history) < self.min_history:
+            return None
+        center = median(history)
+        mad = median(abs(x - center) for x in history)
+        spread = max(MAD_TO_SIGMA * mad, self.min_relative_spread * abs(center), min_spread, 1e-9)
+        return abs(value - center) / spread
+
+    def is_anomaly(self, history: List[float], value: float, record_type: str = None) -> bool:
+        metric = REGISTRY.get(record_type)
+        min_spread = metric.min_spread if metric else 0.0
+        threshold = metric.anomaly_threshold if metric and metric.anomaly_threshold else self.threshold
+        score = self.score(history, value, min_spread)
+        return score is not None and score > threshold
+
+    def observe(self, state: Optional[str], value: float, record_type: str = None) -> Tuple[bool, str]:
+        """Check value against a stored window and return (is_anomaly, updated window)
+
+        The window is kept as a JSON list so every backend can store it in
+        a text column. Flagged values still enter the window: the median
+        ignores a lone outlier, while a genuine lasting change becomes the
+        new baseline after a few entries.
+        """
+        history = json.loads(state) if state else []
+        flagged = self.is_anomaly(history, value, record_type)
+        history.append(value)
+        return flagged, json.dumps(history[-self.window:])
+
+
+detector = AnomalyDetector.from_env()
@@ -0,0 +1,270 @@
+"""
+Columnar archive of health records for Health Tracker Bot
+A periodic snapshot of health_records as per-column .npy files, sorted by user and date and memory-mapped by readers
+"""
+
+import os
+import json
+import shutil
+import logging
+import threading
+from datetime import date, datetime
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from storage import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+BUILD_BATCH = 10000
+# Users deleted since the kept builds were made; their rows are hidden until those builds age out
+DELETED_FILE = "deleted_users.json"
+
+# Column name -> dtype; record_type is stored as a code into the manifest's type list
+COLUMNS = (
+    ('user_id', np.int64),
+    ('date_for', 'datetime64[D]'),
+    ('record_type', np.uint16),
+    ('value', np.float64),
+    ('recorded_at', 'datetime64[s]'),
+    ('anomaly', np.bool_),
+)
+
+
+class ColumnarArchive:
+    """One archive build, memory-mapped read-only
+
+    Rows are sorted by (user_id, date_for, recorded_at) and users/offsets
+    index each user's contiguous run, so a user's history is a slice of
+    every column: no copy, no row objects, and only the touched pages are
+    read from disk. Users listed in the directory's deleted-users file
+    are left out of every read.
+    """
+
+    def __init__(self, path: str, manifest: dict):
+        self.path = path
+        self.build = manifest['current']
+        self.built_at = manifest['built_at']
+        self.watermark = manifest['watermark']
+        self.types: List[str] = manifest['types']
+        self.type_codes = {name: code for code, name in enumerate(self.types)}
+        self.columns: Dict[str, np.ndarray] = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r') for name, _ in COLUMNS
+        }
+        self.users = np.load(os.path.join(path, "users.npy"), mmap_mode='r')
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode='r')
+        self._deleted_path = os.path.join(os.path.dirname(path), DELETED_FILE)
+        self._deleted_stamp = None
+        self._deleted = np.empty(0, dtype=np.int64)
+
+    @property
+    def deleted(self) -> np.ndarray:
+        """Sorted ids of users deleted after this build, re-read whenever the list changes"""
+        try:
+            stamp = os.stat(self._deleted_path).st_mtime_ns
+        except OSError:
+            stamp = None
+        if stamp != self._deleted_stamp:
+            self._deleted = np.array(sorted(_read_deleted(os.path.dirname(self._deleted_path))),
+                                     dtype=np.int64)
+            self._deleted_stamp = stamp
+        return self._deleted
+
+    @classmethod
+    def open(cls, directory: str = ARCHIVE_DIR) -> Optional['ColumnarArchive']:
+        """The current build in directory, or None if none has been built"""
+        try:
+            with open(os.path.join(directory, "manifest.json"), encoding="utf-8") as f:
+                manifest = json.load(f)
+            return cls(os.path.join(directory, manifest['current']), manifest)
+        except (OSError, ValueError, KeyError) as e:
+            logger.debug("No usable archive in %s: %s", directory, e)
+            return None
+
+    def __len__(self) -> int:
+        return len(self.columns['user_id'])
+
+    def user_history(self, user_id: int, start_date: date = None,
+                     end_date: date = None) -> Dict[str, np.ndarray]:
+        """Views of every column for one user's records, optionally limited to a date range"""
+        index = int(np.searchsorted(self.users, user_id))
+        if index == len(self.users) or self.users[index] != user_id or user_id in self.deleted:
+            return {name: column[:0] for name, column in self.columns.items()}
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+
+        days = self.columns['date_for'][start:end]
+        if start_date is not None:
+            start += int(np.searchsorted(days, np.datetime64(start_date, 'D'), side='left'))
+        if end_date is not None:
+            end = start + int(np.searchsorted(
+                self.columns['date_for'][start:end], np.datetime64(end_date, 'D'), side='right'
+            ))
+        return {name: column[start:end] for name, column in self.columns.items()}
+
+    def daily_matrix(self, metrics: Sequence[str],
+                     user_id: int = None) -> Tuple[List[Tuple[int, str]], np.ndarray]:
+        """Unflagged records pivoted to one row per user-day, one column per metric
+
+        Same result as ml_model.build_daily_matrix (latest value of each
+        metric wins, missing values are NaN), computed with array
+        operations over the archive or one user's slice of it.
+        """
+        view = self.columns if user_id is None else self.user_history(user_id)
+        codes = [self.type_codes[name] for name in metrics if name in self.type_codes]
+        keep = ~np.asarray(view['anomaly']) & np.isin(view['record_type'], codes)
+        if user_id is None and len(self.deleted):
+            keep &= ~np.isin(view['user_id'], self.deleted)
+        users = np.asarray(view['user_id'])[keep]
+        days = np.asarray(view['date_for'])[keep]
+        types = np.asarray(view['record_type'])[keep]
+        values = np.asarray(view['value'])[keep]
+        if not len(users):
+            return [], np.empty((0, len(metrics)))
+
+        # Sorted by (user, day, recorded_at): each user-day is a contiguous run
+        boundary = np.empty(len(users), dtype=bool)
+        boundary[0] = True
+        boundary[1:] = (users[1:] != users[:-1]) | (days[1:] != days[:-1])
+        group = np.cumsum(boundary) - 1
+        starts = np.flatnonzero(boundary)
+
+        matrix = np.full((len(starts), len(metrics)), np.nan)
+        for column, name in enumerate(metrics):
+            code = self.type_codes.get(name)
+            if code is None:
+                continue
+            rows = np.flatnonzero(types == code)
+            if not len(rows):
+                continue
+            groups = group[rows]
+            last = np.empty(len(rows), dtype=bool)
+            last[-1] = True
+            last[:-1] = groups[1:] != groups[:-1]
+            matrix[groups[last], column] = values[rows[last]]
+
+        keys = list(zip(users[starts].tolist(), days[starts].astype(str).tolist()))
+        return keys, matrix
+
+
+def build_archive(storage: StorageBackend, directory: str = ARCHIVE_DIR,
+                  keep: int = 2) -> ColumnarArchive:
+    """Snapshot every record into a new build and make it current
+
+    Records are streamed in batches and only their numeric columns are
+    kept, so building never holds row objects for the whole table. The
+    manifest is switched atomically; older builds beyond `keep` are removed.
+    """
+    types: Dict[str, int] = {}
+    chunks: Dict[str, list] = {name: [] for name, _ in COLUMNS}
+    watermark = ""
+    for batch in storage.iter_record_batches(BUILD_BATCH):
+        batch = [row for row in batch if row[1] is not None]
+        if not batch:
+            continue
+        user_ids, days, record_types, values, recorded, anomalies = zip(*batch)
+        chunks['user_id'].append(np.array(user_ids, dtype=np.int64))
+        chunks['date_for'].append(np.array([str(day) for day in days], dtype='datetime64[D]'))
+        chunks['record_type'].append(np.array(
+            [types.setdefault(name, len(types)) for name in record_types], dtype=np.uint16
+        ))
+        chunks['value'].append(np.array(values, dtype=np.float64))
+        stamps = [str(stamp) for stamp in recorded]
+        chunks['recorded_at'].append(np.array([stamp[:19] for stamp in stamps], dtype='datetime64[s]'))
+        chunks['anomaly'].append(np.array(anomalies, dtype=np.bool_))
+        watermark = max(watermark, max(stamps))
+
+    columns = {
+        name: np.concatenate(chunks[name]) if chunks[name] else np.empty(0, dtype=dtype)
+        for name, dtype in COLUMNS
+    }
+    del chunks
+    # lexsort is stable, so ties keep id order and the latest record still comes last
+    order = np.lexsort((columns['recorded_at'], columns['date_for'], columns['user_id']))
+    users, offsets = np.unique(columns['user_id'][order], return_index=True)
+    offsets = np.append(offsets, len(order)).astype(np.int64)
+
+    build = f"build-{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+    path = os.path.join(directory, build)
+    os.makedirs(path, exist_ok=True)
+    for name, column in columns.items():
+        np.save(os.path.join(path, f"{name}.npy"), column[order])
+    np.save(os.path.join(path, "users.npy"), users)
+    np.save(os.path.join(path, "offsets.npy"), offsets)
+
+    manifest = {
+        'current': build,
+        'built_at': datetime.now().isoformat(timespec='seconds'),
+        'rows': int(len(order)),
+        'users': int(len(users)),
+        'types': sorted(types, key=types.get),
+        'watermark': watermark or None,
+    }
+    tmp_manifest = os.path.join(directory, "manifest.json.tmp")
+    with open(tmp_manifest, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_manifest, os.path.join(directory, "manifest.json"))
+
+    # Readers that still map an older build keep their pages until they reopen
+    builds = sorted(name for name in os.listdir(directory) if name.startswith("build-"))
+    for old in builds[:-keep]:
+        shutil.rmtree(os.path.join(directory, old), ignore_errors=True)
+    # Deleted users stay hidden only while a kept build still holds their rows
+    with _deleted_lock:
+        deleted = _read_deleted(directory)
+        if deleted:
+            present = set()
+            for name in builds[-keep:]:
+                present.update(np.load(os.path.join(directory, name, "users.npy")).tolist())
+            _write_deleted(directory, deleted & present)
+
+    logger.info("Built archive %s: %s records of %s users", build, manifest['rows'], manifest['users'])
+    return ColumnarArchive(path, manifest)
+
+
+_lock = threading.Lock()
+_current: Optional[ColumnarArchive] = None
+_deleted_lock = threading.Lock()
+
+
+def _read_deleted(directory: str) -> Set[int]:
+    try:
+        with open(os.path.join(directory, DELETED_FILE), encoding="utf-8") as f:
+            return set(json.load(f))
+    except (OSError, ValueError):
+        return set()
+
+
+def _write_deleted(directory: str, user_ids: Set[int]):
+    tmp_path = os.path.join(directory, f"{DELETED_FILE}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(sorted(user_ids), f)
+    os.replace(tmp_path, os.path.join(directory, DELETED_FILE))
+
+
+def forget_user(user_id: int, directory: str = ARCHIVE_DIR) -> bool:
+    """Hide a deleted user's rows in every kept build; False if there is no archive
+
+    The rows stay on disk until the builds holding them are replaced by
+    newer ones (the next `keep` builds), then leave the list again.
+    """
+    if not os.path.exists(os.path.join(directory, "manifest.json")):
+        return False
+    with _deleted_lock:
+        _write_deleted(directory, _read_deleted(directory) | {user_id})
+    return True
+
+
+def current_archive(directory: str = ARCHIVE_DIR) -> Optional[ColumnarArchive]:
+    """Latest build, mapped once and reused until a newer build replaces it"""
+    global _current
+    with _lock:
+        try:
+            with open(os.path.join(directory, "manifest.json"), encoding="utf-8") as f:
+                build = json.load(f).get('current')
+        except (OSError, ValueError):
+            return None
+        if _current is None or _current.build != build or os.path.dirname(_current.path) != directory:
+            _current = ColumnarArchive.open(directory)
+        return _current
@@ -0,0 +1,318 @@
+"""
+Online backups for Health Tracker Bot
+Snapshots the live SQLite file with the backup API in small paced steps, keeps the newest N and restores them
+"""
+
+import os
+import sys
+import gzip
+import time
+import shutil
+import sqlite3
+import logging
+import argparse
+import threading
+from dataclasses import dataclass, asdict, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))
+BACKUP_COMPRESS = os.getenv("BACKUP_COMPRESS", "1") not in ("0", "false", "no")
+# Pages copied per step and the pause after each; the writer can take the lock between steps
+BACKUP_PAGES = int(os.getenv("BACKUP_PAGES", "256"))
+BACKUP_PAUSE = float(os.getenv("BACKUP_PAUSE", "0.01"))
+# A write mid-copy restarts a stepped backup; after this many restarts it is taken in one step
+BACKUP_MAX_RESTARTS = int(os.getenv("BACKUP_MAX_RESTARTS", "3"))
+# Seconds between write-lock probes while measuring the backup's impact on writers
+PROBE_INTERVAL = 0.05
+
+
+def _percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+
+
+class WriteProbe:
+    """Times how long a writer waits for the write lock, in a background thread
+
+    Each probe is BEGIN IMMEDIATE followed by ROLLBACK, so it takes the
+    same lock a bot write needs without changing anything.
+    """
+
+    def __init__(self, db_path: str, interval: float = PROBE_INTERVAL):
+        self.db_path = db_path
+        self.interval = interval
+        self.samples: List[float] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def sample(self, count: int) -> List[float]:
+        """Take count probes in the calling thread (the no-backup baseline)"""
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            samples = []
+            for _ in range(count):
+                samples.append(self._probe(conn))
+                time.sleep(self.interval)
+            return samples
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _probe(conn: sqlite3.Connection) -> float:
+        started = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("ROLLBACK")
+        return (time.perf_counter() - started) * 1000
+
+    def start(self):
+        def worker():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            try:
+                while not self._stop.is_set():
+                    self.samples.append(self._probe(conn))
+                    self._stop.wait(self.interval)
+            finally:
+                conn.close()
+
+        self._thread = threading.Thread(target=worker, name="backup-write-probe", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> List[float]:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        return self.samples
+
+
+@dataclass
+class BackupReport:
+    """One backup: where it went, how long it took and what writers saw meanwhile"""
+    source: str
+    path: str = ""
+    seconds: float = 0.0
+    pages: int = 0
+    steps: int = 0
+    bytes: int = 0
+    stored_bytes: int = 0
+    check: str = ""
+    restarts: int = 0
+    one_step: bool = False          # gave up on stepping after too many restarts
+    removed: List[str] = field(default_factory=list)
+    write_wait_ms: Dict[str, float] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _snapshot_name(db_path: str, compress: bool) -> str:
+    stem = os.path.splitext(os.path.basename(db_path))[0]
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    return f"{stem}-{stamp}.db" + (".gz" if compress else "")
+
+
+def list_backups(db_path: str, directory: str = BACKUP_DIR) -> List[str]:
+    """Snapshots of db_path in directory, oldest first"""
+    stem = os.path.splitext(os.path.basename(db_path))[0]
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    # Names carry a sortable timestamp after the stem
+    return [
+        os.path.join(directory, name) for name in sorted(names)
+        if name.startswith(f"{stem}-") and (name.endswith(".db") or name.endswith(".db.gz"))
+        and name[len(stem) + 1:len(stem) + 16].replace('-', '').isdigit()
+    ]
+
+
+class _Restarted(Exception):
+    """Raised from the progress callback to abandon a stepped copy that keeps restarting"""
+
+
+def online_copy(src: sqlite3.Connection, dst: sqlite3.Connection, pages: int = BACKUP_PAGES,
+                pause: float = BACKUP_PAUSE, max_restarts: int = BACKUP_MAX_RESTARTS) -> Tuple[int, int, int, bool]:
+    """Copy src into dst with the backup API, `pages` pages per step and `pause` seconds between steps
+
+    A write to the source mid-copy sends SQLite back to the first page,
+    so a busy database may never let a stepped copy finish; after
+    `max_restarts` restarts the copy is taken in one step instead, which
+    in WAL mode only holds a read snapshot and still lets writers through.
+    Returns (steps, total pages, restarts, whether it fell back to one step).
+    """
+    steps, total_pages, restarts = 0, 0, 0
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal steps, total_pages, restarts, last_remaining
+        steps += 1
+        total_pages = total
+        # An OK step that made no headway means a write sent the copy back to the first page
+        if status == sqlite3.SQLITE_OK and last_remaining is not None and remaining >= last_remaining:
+            restarts += 1
+            if restarts >= max_restarts:
+                raise _Restarted()
+        last_remaining = remaining
+        time.sleep(pause)
+
+    try:
+        src.backup(dst, pages=pages, progress=progress)
+        return steps, total_pages, restarts, False
+    except _Restarted:
+        src.backup(dst)
+        return steps, total_pages, restarts, True
+
+
+def backup_database(db_path: str, directory: str = BACKUP_DIR, keep: int = BACKUP_KEEP,
+                    compress: bool = BACKUP_COMPRESS, pages: int = BACKUP_PAGES,
+                    pause: float = BACKUP_PAUSE, measure: bool = True) -> BackupReport:
+    """Take a consistent snapshot of a live database without blocking its writer
+
+    The backup API copies `pages` pages per step and sleeps `pause`
+    seconds between steps; if the source is written to mid-copy SQLite
+    restarts the copy, so the result is always a single consistent state.
+    A busy database may never let a stepped copy finish, so after
+    BACKUP_MAX_RESTARTS restarts it is taken in one step, which in WAL
+    mode only holds a read snapshot and still lets writers through.
+    The copy is checked, optionally gzipped, and only then given its final
+    name. With `measure`, write-lock waits are sampled before and during
+    the copy so the report shows the cost to writers.
+    """
+    os.makedirs(directory, exist_ok=True)
+    report = BackupReport(source=db_path)
+    final_path = os.path.join(directory, _snapshot_name(db_path, compress))
+    copy_path = final_path[:-3] if compress else final_path
+    tmp_path = f"{copy_path}.tmp"
+
+    probe = WriteProbe(db_path) if measure else None
+    baseline = probe.sample(10) if probe else []
+
+    started = time.perf_counter()
+    if probe:
+        probe.start()
+    try:
+        src = sqlite3.connect(db_path, timeout=30)
+        dst = sqlite3.connect(tmp_path)
+        try:
+            report.steps, report.pages, report.restarts, report.one_step = online_copy(src, dst, pages, pause)
+            dst.execute("PRAGMA journal_mode=DELETE")
+            report.check = dst.execute("PRAGMA quick_check").fetchone()[0]
+        finally:
+            dst.close()
+            src.close()
+    finally:
+        during = probe.stop() if probe else []
+    if report.check != "ok":
+        os.remove(tmp_path)
+        raise sqlite3.DatabaseError(f"Backup of {db_path} failed its integrity check: {report.check}")
+
+    report.bytes = os.path.getsize(tmp_path)
+    if compress:
+        gz_tmp = f"{final_path}.tmp"
+        with open(tmp_path, "rb") as f, gzip.open(gz_tmp, "wb", compresslevel=6) as out:
+            shutil.copyfileobj(f, out, 1024 * 1024)
+        os.remove(tmp_path)
+        os.replace(gz_tmp, final_path)
+    else:
+        os.replace(tmp_path, final_path)
+    report.path = final_path
+    report.stored_bytes = os.path.getsize(final_path)
+    report.seconds = round(time.perf_counter() - started, 3)
+
+    if measure:
+        report.write_wait_ms = {
+            'baseline_p50': _percentile(baseline, 0.5),
+            'baseline_max': _percentile(baseline, 1.0),
+            'during_p50': _percentile(during, 0.5),
+            'during_p95': _percentile(during, 0.95),
+            'during_max': _percentile(during, 1.0),
+            'samples': len(during),
+        }
+
+    for old in list_backups(db_path, directory)[:-keep] if keep > 0 else []:
+        try:
+            os.remove(old)
+            report.removed.append(old)
+        except OSError as e:
+            logger.warning("Could not remove old backup %s: %s", old, e)
+
+    logger.info(
+        "Backed up %s to %s in %.2f s (%s pages, %s steps, %s restarts%s, %s -> %s bytes); write wait %s",
+        db_path, final_path, report.seconds, report.pages, report.steps, report.restarts,
+        ", one step" if report.one_step else "",
+        report.bytes, report.stored_bytes, report.write_wait_ms or "not measured"
+    )
+    return report
+
+
+def restore_backup(backup_path: str, db_path: str, directory: str = BACKUP_DIR) -> str:
+    """Replace the contents of db_path with a snapshot; returns the safety snapshot taken first
+
+    The restore goes through the backup API into the live file, so open
+    connections see it as an ordinary write instead of a file swapped
+    under them. Stop the bot first all the same, or its writes may be
+    lost between the safety snapshot and the restore.
+    """
+    source = backup_path
+    if backup_path.endswith(".gz"):
+        source = f"{db_path}.restore.tmp"
+        with gzip.open(backup_path, "rb") as f, open(source, "wb") as out:
+            shutil.copyfileobj(f, out, 1024 * 1024)
+    try:
+        src = sqlite3.connect(f"file:{source}?mode=ro", uri=True)
+        try:
+            check = src.execute("PRAGMA quick_check").fetchone()[0]
+            if check != "ok":
+                raise sqlite3.DatabaseError(f"{backup_path} failed its integrity check: {check}")
+
+            safety = ""
+            if os.path.exists(db_path):
+                safety = backup_database(db_path, directory, keep=0, measure=False).path
+            dst = sqlite3.connect(db_path, timeout=30)
+            try:
+                src.backup(dst)
+            finally:
+                dst.close()
+        finally:
+            src.close()
+    finally:
+        if source != backup_path and os.path.exists(source):
+            os.remove(source)
+    logger.info("Restored %s from %s (previous contents saved to %s)", db_path, backup_path, safety or "nothing")
+    return safety
+
+
+def main(argv=None):
+    """Command line entry point: python backup.py [backup|list|restore SNAPSHOT] --db PATH"""
+    parser = argparse.ArgumentParser(description="Health Tracker database backups")
+    parser.add_argument("command", choices=["backup", "list", "restore"])
+    parser.add_argument("snapshot", nargs="?", help="snapshot to restore (restore only)")
+    parser.add_argument("--db", default=os.getenv("DATABASE_PATH", "health_tracker.db"))
+    parser.add_argument("--dir", default=BACKUP_DIR)
+    parser.add_argument("--keep", type=int, default=BACKUP_KEEP)
+    parser.add_argument("--no-compress", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.command == "backup":
+        report = backup_database(args.db, args.dir, keep=args.keep, compress=not args.no_compress)
+        print(f"{report.path}: {report.stored_bytes} bytes in {report.seconds} s, write wait {report.write_wait_ms}")
+    elif args.command == "list":
+        for path in list_backups(args.db, args.dir):
+            print(f"{path}  {os.path.getsize(path)} bytes")
+    else:
+        if not args.snapshot:
+            parser.error("restore needs the snapshot to restore from")
+        safety = restore_backup(args.snapshot, args.db, args.dir)
+        print(f"Restored {args.db} from {args.snapshot}; previous contents saved to {safety or 'nothing'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
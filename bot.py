@@ -3,29 +3,124 @@ Health Tracker Telegram Bot
 Complete health tracking functionality with database persistence
 """
 
+import os
 import asyncio
 import logging
 from datetime import datetime, timedelta
 from telegram import Update, ReplyKeyboardMarkup, KeyboardButton
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
 from config import Config
-from database import Database
+from storage import create_storage
 from handlers import HealthHandlers
+from scheduler import ReminderScheduler
+from outbox import Outbox
+from profiler import profiled
+from messages import catalog
+from startup import startup
 
 logger = logging.getLogger(__name__)
 
+
+def _http_version() -> str:
+    """HTTP/2 for Bot API calls when the h2 package is installed (BOT_HTTP_VERSION overrides)"""
+    configured = os.getenv("BOT_HTTP_VERSION")
+    if configured:
+        return configured
+    try:
+        import h2  # noqa: F401
+        return "2"
+    except ImportError:
+        return "1.1"
+
+
+def _train_mood_model(storage):
+    """Nightly job: fold the day's records into the mood model"""
+    # numpy and scikit-learn stay out of the startup path
+    from ml_model import train_incremental
+    version = train_incremental(storage)
+    if version:
+        logger.info("Mood model updated to v%s", version)
+
+
+def _build_archive(storage):
+    """Nightly job: rebuild the memory-mapped columnar archive"""
+    from archive import build_archive
+    build_archive(storage)
+
+
+def _maintain_database(storage):
+    """Nightly job: refresh statistics, reclaim free pages, checkpoint the WAL"""
+    # Each backend logs its own report (time taken, pages and bytes reclaimed)
+    storage.run_maintenance()
+
+
+def _backup_database(storage):
+    """Nightly job: paced online snapshot of the database"""
+    storage.run_backup()
+
+
+def _apply_retention(storage):
+    """Nightly job: summarize and prune raw records past RETENTION_DAYS"""
+    from retention import apply_retention
+    apply_retention(storage)
+
+
+def _build_digests(storage):
+    """Nightly job: weekly and monthly digests of every active user"""
+    from digests import build_all_digests
+    build_all_digests(storage)
+
+
+def _prune_inference_cache(storage):
+    """Nightly job: drop expired persisted analysis results"""
+    from inference_cache import inference_cache
+    removed = inference_cache.prune()
+    if removed:
+        logger.info("Pruned %s cached analysis results", removed)
+
+
 class HealthTrackerBot:
-    def __init__(self):
-        """Initialize the Health Tracker Bot"""
+    def __init__(self, polling: bool = True):
+        """Initialize the Health Tracker Bot
+        
+        With polling=False the application has no updater and is fed
+        updates by a cluster router instead of fetching them itself.
+        """
         self.config = Config()
-        self.db = Database()
-        self.handlers = HealthHandlers(self.db)
+        startup.mark("config loaded")
+        self.db = create_storage(
+            self.config.get_database_url(),
+            read_mode=self.config.READ_REPLICA_MODE,
+            read_staleness=self.config.READ_STALENESS_SECONDS
+        )
+        startup.mark("database ready")
         
         # Initialize the bot application
-        self.application = Application.builder().token(self.config.BOT_TOKEN).build()
+        builder = (
+            Application.builder()
+            .token(self.config.BOT_TOKEN)
+            .http_version(_http_version())
+            .connection_pool_size(self.config.BOT_CONNECTION_POOL_SIZE)
+            .post_init(self._post_init)
+            .post_stop(self._post_stop)
+        )
+        if not polling:
+            builder = builder.updater(None)
+        self.application = builder.build()
+        self.outbox = Outbox.from_env(self.application.bot)
+        self.handlers = HealthHandlers(self.db, self.outbox)
+        self.scheduler = ReminderScheduler(self.application.bot, self.db, outbox=self.outbox)
+        self.scheduler.add_daily_job("digests", self.config.DIGEST_TIME, _build_digests)
+        self.scheduler.add_daily_job("build_archive", self.config.ARCHIVE_BUILD_TIME, _build_archive)
+        self.scheduler.add_daily_job("train_mood_model", self.config.MODEL_TRAIN_TIME, _train_mood_model)
+        self.scheduler.add_daily_job("prune_inference_cache", "04:00", _prune_inference_cache)
+        self.scheduler.add_daily_job("backup", self.config.BACKUP_TIME, _backup_database)
+        self.scheduler.add_daily_job("retention", self.config.RETENTION_TIME, _apply_retention)
+        self.scheduler.add_daily_job("database_maintenance", self.config.MAINTENANCE_TIME, _maintain_database)
         
         # Setup handlers
         self._setup_handlers()
+        startup.mark("handlers registered")
         
         logger.info("Health Tracker Bot initialized successfully")
     
@@ -33,25 +128,26 @@ class HealthTrackerBot:
         """Setup all command and message handlers"""
         
         # Command handlers
-        self.application.add_handler(CommandHandler("start", self.handlers.start_command))
-        self.application.add_handler(CommandHandler("help", self.handlers.help_command))
-        self.application.add_handler(CommandHandler("profile", self.handlers.profile_command))
-        self.application.add_handler(CommandHandler("stats", self.handlers.stats_command))
-        self.application.add_handler(CommandHandler("reminder", self.handlers.reminder_command))
-        self.application.add_handler(CommandHandler("export", self.handlers.export_command))
+        self.application.add_handler(CommandHandler("start", self._profiled(self.handlers.start_command)))
+        self.application.add_handler(CommandHandler("help", self._profiled(self.handlers.help_command)))
+        self.application.add_handler(CommandHandler("profile", self._profiled(self.handlers.profile_command)))
+        self.application.add_handler(CommandHandler("stats", self._profiled(self.handlers.stats_command)))
+        self.application.add_handler(CommandHandler("trend", self._profiled(self.handlers.trend_command)))
+        self.application.add_handler(CommandHandler("week", self._profiled(self.handlers.week_command)))
+        self.application.add_handler(CommandHandler("month", self._profiled(self.handlers.month_command)))
+        self.application.add_handler(CommandHandler("reminder", self._profiled(self.handlers.reminder_command)))
+        self.application.add_handler(CommandHandler("export", self._profiled(self.handlers.export_command)))
+        self.application.add_handler(CommandHandler("deletedata", self._profiled(self.handlers.delete_data_command)))
         
         # Health tracking commands
-        self.application.add_handler(CommandHandler("weight", self.handlers.weight_command))
-        self.application.add_handler(CommandHandler("steps", self.handlers.steps_command))
-        self.application.add_handler(CommandHandler("water", self.handlers.water_command))
-        self.application.add_handler(CommandHandler("exercise", self.handlers.exercise_command))
-        self.application.add_handler(CommandHandler("sleep", self.handlers.sleep_command))
-        self.application.add_handler(CommandHandler("mood", self.handlers.mood_command))
+        for name, command in self.handlers.metric_commands.items():
+            self.application.add_handler(CommandHandler(name, self._profiled(command)))
+        self.application.add_handler(CommandHandler("log", self._profiled(self.handlers.log_command)))
         
         # Message handlers for interactive input
         self.application.add_handler(MessageHandler(
             filters.TEXT & ~filters.COMMAND, 
-            self.handlers.handle_message
+            self._profiled(self.handlers.handle_message)
         ))
         
         # Error handler
@@ -59,12 +155,33 @@ class HealthTrackerBot:
         
         logger.info("All handlers registered successfully")
     
+    async def _post_init(self, application: Application):
+        """Start background tasks once the application is initialized"""
+        self.start_background_tasks()
+    
+    async def _post_stop(self, application: Application):
+        """Deliver queued replies before the bot shuts down"""
+        await self.stop_background_tasks()
+    
+    def start_background_tasks(self):
+        """Start the outbox and the reminder scheduler on the running event loop"""
+        self.outbox.start()
+        self.scheduler.start()
+    
+    async def stop_background_tasks(self):
+        """Stop the scheduler (letting running daily jobs finish), then flush the outbox"""
+        await self.scheduler.stop()
+        await self.outbox.stop()
+    
+    def _profiled(self, callback):
+        """Route a handler callback through the sampling profiler"""
+        return profiled(f"handlers.{callback.__name__}")(callback)
+    
     async def error_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle errors that occur during bot operation"""
-        logger.error(f"Update {update} caused error: {context.error}")
+        logger.error("Update %s caused error: %s", update, context.error)
         
         if update and update.effective_message:
-            await update.effective_message.reply_text(
-                "❌ An error occurred while processing your request. Please try again later."
-            )
+            language = update.effective_user.language_code if update.effective_user else None
+            await update.effective_message.reply_text(catalog(language).text('error.update'))
     
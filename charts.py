@@ -0,0 +1,189 @@
+"""
+Trend charts for Health Tracker Bot
+Daily series are rendered to PNG in the offload pool and cached until the user's data changes, then reused by Telegram file_id
+"""
+
+import os
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from storage import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+# Ranges /trend accepts, in days; the first is the default and the one /stats draws
+TREND_DAYS = (30, 90)
+
+# (title, unit, day ordinals, daily means) for one panel of a chart
+Series = Tuple[str, str, List[int], List[float]]
+ChartKey = Tuple[int, str, int, int, str, str]
+
+
+def available() -> bool:
+    """Whether matplotlib is installed, i.e. whether charts can be drawn at all"""
+    try:
+        import matplotlib  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def daily_means(storage: StorageBackend, user_id: int, metrics: Sequence[str],
+                days: int) -> Dict[str, Tuple[List[int], List[float]]]:
+    """Mean unflagged value per day for each metric over the last `days` days
+
+    Returns metric -> (day ordinals, means), oldest first, omitting
+    metrics without data. Runs a blocking read, so call it from a thread.
+    """
+    totals: Dict[str, Dict[int, List[float]]] = {}
+    for row in storage.iter_user_records(user_id, start_date=date.today() - timedelta(days=days - 1),
+                                         record_types=list(metrics)):
+        if row.get('is_anomaly') or row.get('date_for') is None:
+            continue
+        day = date.fromisoformat(str(row['date_for'])[:10]).toordinal()
+        bucket = totals.setdefault(row['record_type'], {}).setdefault(day, [0.0, 0])
+        bucket[0] += row['value']
+        bucket[1] += 1
+    return {
+        metric: (sorted(by_day), [by_day[day][0] / by_day[day][1] for day in sorted(by_day)])
+        for metric, by_day in totals.items()
+    }
+
+
+def render_trend(series: Sequence[Series], days: int) -> bytes:
+    """PNG with one panel per series over the last `days` days (runs in the offload pool)
+
+    Takes plain lists so the arguments pickle cheaply; matplotlib is
+    imported here, in the worker, and never in the bot process.
+    """
+    import io
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+
+    end = date.today()
+    start = end - timedelta(days=days - 1)
+    figure, axes = plt.subplots(len(series), 1, figsize=(8, 2.4 * len(series) + 0.6),
+                                sharex=True, squeeze=False)
+    try:
+        for axis, (title, unit, ordinals, values) in zip(axes[:, 0], series):
+            points = [date.fromordinal(day) for day in ordinals]
+            axis.plot(points, values, marker='o', markersize=3, linewidth=1.5, color='#2f7ed8')
+            if len(values) >= 7:
+                # 7-day rolling mean over the logged days, to show the trend under day-to-day noise
+                rolling = [sum(values[max(0, i - 6):i + 1]) / len(values[max(0, i - 6):i + 1])
+                           for i in range(len(values))]
+                axis.plot(points, rolling, linewidth=2.5, color='#f45b5b', alpha=0.8)
+            axis.set_title(title, loc='left', fontsize=11)
+            axis.set_ylabel(unit)
+            axis.grid(True, alpha=0.3)
+            axis.set_xlim(start, end)
+        axes[-1, 0].xaxis.set_major_formatter(mdates.DateFormatter('%d %b'))
+        figure.autofmt_xdate()
+        figure.tight_layout()
+        buffer = io.BytesIO()
+        figure.savefig(buffer, format='png', dpi=100)
+        return buffer.getvalue()
+    finally:
+        plt.close(figure)
+
+
+class ChartCache:
+    """LRU of rendered charts keyed by (user, chart, days, last record id, day, locale)
+
+    A key holds the PNG until Telegram has stored it, then only its
+    file_id, so repeats are re-sent by reference without drawing or
+    uploading again. New data means a new last record id and a new key,
+    as do a new day (the window moves) and another language (the titles
+    change); stale entries simply age out. Concurrent requests for the
+    same key share one render.
+    """
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._pending: Dict[ChartKey, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.renders = 0
+        self.hits = 0
+
+    @classmethod
+    def from_env(cls) -> 'ChartCache':
+        return cls(max_entries=int(os.getenv("CHART_CACHE_SIZE", "512")))
+
+    def get(self, key: ChartKey) -> Optional[Union[str, bytes]]:
+        """Cached file_id (str) or PNG (bytes) for key, or None"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return value
+
+    def put(self, key: ChartKey, value: Union[str, bytes]):
+        """Cache a PNG, or the file_id that replaces it once uploaded"""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, key: ChartKey):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def evict_user(self, user_id: int) -> int:
+        """Drop every chart of a user (PNGs and file_ids); returns how many"""
+        with self._lock:
+            keys = [key for key in self._entries if key[0] == user_id]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    async def get_or_render(self, key: ChartKey,
+                            render: Callable[[], Awaitable[bytes]]) -> Union[str, bytes]:
+        """Cached file_id or PNG for key, rendering it once if neither is cached"""
+        value = self.get(key)
+        if value is not None:
+            return value
+        pending = self._pending.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            png = await render()
+            self.renders += 1
+            self.put(key, png)
+            future.set_result(png)
+            return png
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Waiters get the error; mark it retrieved in case there are none
+            future.exception()
+            raise
+        finally:
+            del self._pending[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            uploaded = sum(isinstance(value, str) for value in self._entries.values())
+            return {
+                'entries': len(self._entries),
+                'uploaded': uploaded,
+                'max_entries': self.max_entries,
+                'renders': self.renders,
+                'hits': self.hits,
+            }
+
+
+chart_cache = ChartCache.from_env()
@@ -0,0 +1,154 @@
+"""
+Multi-worker deployment for Health Tracker Bot
+A router process polls Telegram and hands each update to the worker that owns its user
+"""
+
+import os
+import asyncio
+import logging
+import multiprocessing
+from typing import Callable, List, Optional
+
+from storage import shard_for
+
+logger = logging.getLogger(__name__)
+
+# Sentinel telling a worker to shut down
+_STOP = None
+
+
+def _worker_main(index: int, updates: multiprocessing.Queue):
+    """Worker process: run the handlers for the users routed to this worker"""
+    # Each worker writes its own log file; rotating one file from several
+    # processes would corrupt it
+    from log_pipeline import setup_logging_from_env
+    base, ext = os.path.splitext(os.getenv("LOG_FILE", "bot.log"))
+    os.environ["LOG_FILE"] = f"{base}.worker{index}{ext}"
+    setup_logging_from_env()
+
+    from bot import HealthTrackerBot
+    from offload import offloader
+    bot = HealthTrackerBot(polling=False)
+    try:
+        asyncio.run(_serve_worker(index, bot, updates))
+    finally:
+        # atexit handlers don't run in a worker process; an idle pool would block its exit
+        offloader.shutdown(wait=True)
+
+
+async def _serve_worker(index: int, bot, updates: multiprocessing.Queue):
+    """Feed routed updates into the worker's application until told to stop"""
+    from telegram import Update
+
+    loop = asyncio.get_running_loop()
+    application = bot.application
+    async with application:
+        await application.start()
+        bot.start_background_tasks()
+        logger.info("Worker %s ready", index)
+        try:
+            while True:
+                data = await loop.run_in_executor(None, updates.get)
+                if data is _STOP:
+                    break
+                await application.update_queue.put(Update.de_json(data, application.bot))
+        finally:
+            await bot.stop_background_tasks()
+            await application.stop()
+    logger.info("Worker %s stopped", index)
+
+
+class ClusterRouter:
+    """Long-polls Telegram and routes updates to workers by user id hash
+
+    Users always land on the same worker, so per-user conversation state
+    can stay in worker memory. Queues are bounded: when a worker falls
+    behind, the router stops polling instead of buffering without limit.
+    Workers are regular (non-daemon) processes so they can start their
+    own offload pools; stop() shuts them down and joins them.
+    """
+
+    def __init__(self, token: str, worker_count: int, queue_size: int = 1000,
+                 target: Callable = _worker_main):
+        self.token = token
+        self.worker_count = worker_count
+        self.queue_size = queue_size
+        self.target = target
+        self._context = multiprocessing.get_context("spawn")
+        self.queues: List[multiprocessing.Queue] = []
+        self.workers: List[Optional[multiprocessing.Process]] = []
+
+    def start_workers(self):
+        """Spawn one process per worker"""
+        for index in range(self.worker_count):
+            self.queues.append(self._context.Queue(maxsize=self.queue_size))
+            self.workers.append(None)
+            self._spawn(index)
+
+    def _spawn(self, index: int):
+        process = self._context.Process(
+            target=self.target, args=(index, self.queues[index]),
+            name=f"bot-worker-{index}", daemon=False
+        )
+        process.start()
+        self.workers[index] = process
+        logger.info("Started worker %s (pid %s)", index, process.pid)
+
+    def _restart_dead_workers(self):
+        """Respawn any worker that exited; its queue keeps the pending updates"""
+        for index, process in enumerate(self.workers):
+            if process is not None and not process.is_alive():
+                logger.error("Worker %s exited with code %s, restarting", index, process.exitcode)
+                self._spawn(index)
+
+    async def route(self, drop_pending_updates: bool = True, poll_timeout: int = 30):
+        """Poll for updates forever and dispatch them to workers"""
+        from telegram import Bot, Update
+
+        loop = asyncio.get_running_loop()
+        async with Bot(self.token) as bot:
+            await bot.delete_webhook(drop_pending_updates=drop_pending_updates)
+            offset = None
+            while True:
+                self._restart_dead_workers()
+                try:
+                    updates = await bot.get_updates(
+                        offset=offset, timeout=poll_timeout, allowed_updates=Update.ALL_TYPES
+                    )
+                except Exception as e:
+                    logger.error("Error polling updates: %s", e)
+                    await asyncio.sleep(5)
+                    continue
+
+                for update in updates:
+                    offset = update.update_id + 1
+                    user = update.effective_user
+                    index = shard_for(user.id, self.worker_count) if user else 0
+                    # Blocks (off the loop) while the worker's queue is full
+                    await loop.run_in_executor(None, self.queues[index].put, update.to_dict())
+
+    def stop(self, timeout: float = 10):
+        """Ask every worker to finish and wait for them; terminate any that don't"""
+        for queue in self.queues:
+            try:
+                queue.put(_STOP, timeout=1)
+            except Exception:
+                pass
+        for index, process in enumerate(self.workers):
+            if process is None:
+                continue
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning("Worker %s did not stop within %s s, terminating it", index, timeout)
+                process.terminate()
+                process.join(timeout)
+
+
+def run_cluster(token: str, worker_count: int):
+    """Run the router in this process with worker_count worker processes"""
+    router = ClusterRouter(token, worker_count)
+    router.start_workers()
+    try:
+        asyncio.run(router.route())
+    finally:
+        router.stop()
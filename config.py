@@ -17,26 +17,47 @@ class Config:
         
         # Optional environment variables with defaults
         self.DATABASE_PATH = os.getenv("DATABASE_PATH", "health_tracker.db")
+        self.DATABASE_URL = os.getenv("DATABASE_URL")  # overrides DATABASE_PATH when set
         self.LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
         self.TIMEZONE = os.getenv("TIMEZONE", "UTC")
         
+        # Analytics reads: "wal" (live WAL snapshot) or "snapshot" (backup copy)
+        self.READ_REPLICA_MODE = os.getenv("READ_REPLICA_MODE", "wal")
+        self.READ_STALENESS_SECONDS = float(os.getenv("READ_STALENESS_SECONDS", "300"))
+        
         # Webhook settings (for production deployment)
         self.WEBHOOK_URL = os.getenv("WEBHOOK_URL")
         self.WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8000"))
         
+        # Outbound Bot API connections (one pool shared by all requests)
+        self.BOT_CONNECTION_POOL_SIZE = int(os.getenv("BOT_CONNECTION_POOL_SIZE", "16"))
+        
         # Keep-alive server settings
         self.KEEP_ALIVE_PORT = int(os.getenv("KEEP_ALIVE_PORT", "5000"))
         
-        # Health tracking limits and defaults
-        self.MAX_WEIGHT_KG = float(os.getenv("MAX_WEIGHT_KG", "500"))
-        self.MAX_STEPS = int(os.getenv("MAX_STEPS", "100000"))
-        self.MAX_WATER_ML = int(os.getenv("MAX_WATER_ML", "10000"))
-        self.MAX_EXERCISE_MINUTES = int(os.getenv("MAX_EXERCISE_MINUTES", "1440"))
-        self.MAX_SLEEP_HOURS = float(os.getenv("MAX_SLEEP_HOURS", "24"))
+        # Health tracking limits (MAX_WEIGHT_KG, MAX_STEPS, ...) are read once by metrics.REGISTRY
         
         # Daily reminder settings
         self.REMINDER_TIME = os.getenv("REMINDER_TIME", "20:00")  # 8 PM default
         
+        # Nightly incremental training of the mood model
+        self.MODEL_TRAIN_TIME = os.getenv("MODEL_TRAIN_TIME", "03:00")
+        
+        # Nightly weekly/monthly digests behind /week and /month (DIGEST_CHUNK, ... are read by digests.py)
+        self.DIGEST_TIME = os.getenv("DIGEST_TIME", "01:30")
+        
+        # Nightly columnar archive build (before training, which reads it for full rebuilds)
+        self.ARCHIVE_BUILD_TIME = os.getenv("ARCHIVE_BUILD_TIME", "02:30")
+        
+        # Nightly online backup (BACKUP_DIR, BACKUP_KEEP, ... are read by backup.py)
+        self.BACKUP_TIME = os.getenv("BACKUP_TIME", "03:30")
+        
+        # Nightly pruning of raw records past RETENTION_DAYS (before maintenance reclaims the space)
+        self.RETENTION_TIME = os.getenv("RETENTION_TIME", "04:15")
+        
+        # Nightly database maintenance (statistics, incremental vacuum, WAL checkpoint)
+        self.MAINTENANCE_TIME = os.getenv("MAINTENANCE_TIME", "04:30")
+        
         self._validate_config()
     
     def _get_required_env(self, key: str) -> str:
@@ -56,6 +77,9 @@ class Config:
         
         if not (1 <= self.WEBHOOK_PORT <= 65535):
             raise ValueError("WEBHOOK_PORT must be between 1 and 65535")
+        
+        if self.READ_REPLICA_MODE not in ("wal", "snapshot"):
+            raise ValueError("READ_REPLICA_MODE must be 'wal' or 'snapshot'")
     
     @property
     def is_production(self) -> bool:
@@ -64,4 +88,4 @@ class Config:
     
     def get_database_url(self) -> str:
         """Get database connection URL"""
-        return f"sqlite:///{self.DATABASE_PATH}"
+        return self.DATABASE_URL or f"sqlite:///{self.DATABASE_PATH}"
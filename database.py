@@ -3,95 +3,169 @@ Database module for Health Tracker Bot
 Handles all data persistence operations
 """
 
+import os
+import json
 import sqlite3
 import logging
-from datetime import datetime, date
-from typing import Dict, List, Optional, Any
+import threading
+import time
+from datetime import datetime, date, timedelta
+from typing import Dict, Iterator, List, Optional, Any, Sequence, Tuple
 from contextlib import contextmanager
+from profiler import profiler, format_caller_stack
+from migrations import MigrationRunner, SCHEMA_VERSION, rollup_records
+from storage import StorageBackend, decode_cursor, encode_cursor
+from anomaly import detector
+from backup import online_copy
+from sketches import HyperLogLog, QuantileSketch, sketch_slot
 
 logger = logging.getLogger(__name__)
 
-class Database:
-    """Database handler for health tracking data"""
+# Bucket expression per time-series resolution over the 'YYYY-MM-DD HH:00' rollup hour
+_BUCKETS = {
+    'hour': "hour",
+    'day': "substr(hour, 1, 10)",
+    'week': "date(hour, '-6 days', 'weekday 1')",
+    'month': "substr(hour, 1, 7) || '-01'",
+}
+
+class Database(StorageBackend):
+    """SQLite storage backend for health tracking data"""
     
-    def __init__(self, db_path: str = "health_tracker.db"):
-        """Initialize database with proper schema"""
+    def __init__(self, db_path: str = "health_tracker.db", read_mode: str = "wal",
+                 read_staleness: float = 300):
+        """Initialize database with proper schema
+
+        Heavy analytical reads (exports, analysis, dashboard) go through a
+        separate read-only connection. With read_mode "wal" they read the live
+        file as a WAL snapshot and never block the writer; with "snapshot" they
+        read a copy refreshed with the online backup API once it is older than
+        read_staleness seconds.
+        """
         self.db_path = db_path
+        self.read_mode = read_mode
+        self.read_staleness = read_staleness
+        self.replica_path = f"{db_path}.replica"
+        self._replica_lock = threading.Lock()
+        self._replica_refreshed_at = 0.0
         self._init_database()
-        logger.info(f"Database initialized at {db_path}")
+        self._enable_wal()
+        logger.info("Database initialized at %s", db_path)
     
     def _init_database(self):
-        """Create database tables if they don't exist"""
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Users table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    first_name TEXT,
-                    last_name TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    timezone TEXT DEFAULT 'UTC'
-                )
-            """)
-            
-            # Health records table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS health_records (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    record_type TEXT NOT NULL,
-                    value REAL NOT NULL,
-                    unit TEXT,
-                    notes TEXT,
-                    recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    date_for DATE,
-                    FOREIGN KEY (user_id) REFERENCES users (user_id)
-                )
-            """)
-            
-            # User preferences table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS user_preferences (
-                    user_id INTEGER PRIMARY KEY,
-                    reminder_enabled BOOLEAN DEFAULT TRUE,
-                    reminder_time TEXT DEFAULT '20:00',
-                    weight_unit TEXT DEFAULT 'kg',
-                    height_cm INTEGER,
-                    age INTEGER,
-                    gender TEXT,
-                    FOREIGN KEY (user_id) REFERENCES users (user_id)
-                )
-            """)
-            
-            # Create indexes for better performance
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_health_records_user_date 
-                ON health_records (user_id, date_for)
-            """)
-            
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_health_records_type 
-                ON health_records (record_type)
-            """)
-            
-            conn.commit()
+        """Bring the schema up to date, skipping all DDL when it already is"""
+        runner = MigrationRunner(self.db_path)
+        if runner.current_version() >= SCHEMA_VERSION and not runner.pending_backfills():
+            return
+        
+        # Schema changes are applied now; backfills of online migrations finish in the background
+        runner.migrate(background_online=True)
+    
+    def _enable_wal(self):
+        """Switch to WAL so readers and the writer don't block each other"""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning("Could not enable WAL mode: %s", e)
     
     @contextmanager
     def _get_connection(self):
         """Context manager for database connections"""
         conn = sqlite3.connect(self.db_path)
         conn.row_factory = sqlite3.Row  # Enable column access by name
+        start = time.perf_counter()
         try:
             yield conn
         except Exception as e:
             conn.rollback()
-            logger.error(f"Database error: {e}")
+            logger.error("Database error: %s", e)
+            raise
+        finally:
+            conn.close()
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if profiler.slow_query_ms > 0 and elapsed_ms >= profiler.slow_query_ms:
+                logger.warning("Slow query took %.1f ms\n%s", elapsed_ms, format_caller_stack(skip=3))
+    
+    @contextmanager
+    def _get_read_connection(self):
+        """Context manager for read-only analytics connections"""
+        path = self.db_path
+        if self.read_mode == "snapshot":
+            path = self._current_replica()
+        
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        start = time.perf_counter()
+        try:
+            # One read transaction so multi-statement reads see a single snapshot
+            conn.execute("BEGIN")
+            yield conn
+        except Exception as e:
+            logger.error("Database read error: %s", e)
             raise
         finally:
             conn.close()
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if profiler.slow_query_ms > 0 and elapsed_ms >= profiler.slow_query_ms:
+                logger.warning("Slow analytics query took %.1f ms\n%s", elapsed_ms, format_caller_stack(skip=3))
+    
+    def _current_replica(self) -> str:
+        """Path to read from in snapshot mode, refreshing the copy when stale"""
+        age = time.monotonic() - self._replica_refreshed_at
+        if not os.path.exists(self.replica_path):
+            # No copy yet: read the live file in WAL mode and build one meanwhile
+            self._start_replica_refresh()
+            return self.db_path
+        if age > self.read_staleness:
+            self._start_replica_refresh()
+        return self.replica_path
+    
+    def _start_replica_refresh(self):
+        """Refresh the snapshot copy in a background thread unless one is running"""
+        if not self._replica_lock.acquire(blocking=False):
+            return
+        
+        def worker():
+            try:
+                self.refresh_replica()
+            finally:
+                self._replica_lock.release()
+        
+        threading.Thread(target=worker, name="replica-refresh", daemon=True).start()
+    
+    def refresh_replica(self, pages: int = 1024, pause: float = 0.005) -> bool:
+        """Copy the live database to the snapshot file with the online backup API
+        
+        Pages are copied in small steps with a pause between them so the
+        writer is never locked out for long, falling back to a one-step
+        copy if writes keep restarting it (see backup.online_copy); the
+        finished copy atomically replaces the previous one, and open
+        readers keep their old snapshot.
+        """
+        tmp_path = f"{self.replica_path}.tmp"
+        start = time.perf_counter()
+        try:
+            src = sqlite3.connect(self.db_path)
+            dst = sqlite3.connect(tmp_path)
+            try:
+                steps, _, restarts, one_step = online_copy(src, dst, pages, pause)
+                dst.execute("PRAGMA journal_mode=DELETE")
+            finally:
+                dst.close()
+                src.close()
+            os.replace(tmp_path, self.replica_path)
+            self._replica_refreshed_at = time.monotonic()
+            logger.info("Read replica refreshed in %.1f ms (%s steps, %s restarts%s)",
+                        (time.perf_counter() - start) * 1000, steps, restarts,
+                        ", finished in one step" if one_step else "")
+            return True
+        except (sqlite3.Error, OSError) as e:
+            logger.error("Error refreshing read replica: %s", e)
+            return False
     
     def register_user(self, user_id: int, username: str = None, 
                      first_name: str = None, last_name: str = None) -> bool:
@@ -114,57 +188,135 @@ class Database:
                 conn.commit()
                 return True
         except Exception as e:
-            logger.error(f"Error registering user {user_id}: {e}")
+            logger.error("Error registering user %s: %s", user_id, e)
             return False
     
     def record_health_data(self, user_id: int, record_type: str, value: float,
                           unit: str = None, notes: str = None, date_for: date = None) -> bool:
         """Record health data for a user"""
+        return self.record_health_batch(user_id, [(record_type, value, unit)], notes, date_for)
+    
+    def record_health_batch(self, user_id: int, records: List[tuple], notes: str = None,
+                            date_for: date = None) -> bool:
+        """Record several (record_type, value, unit) entries in one transaction"""
         if date_for is None:
             date_for = date.today()
         
         try:
             with self._get_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute("""
-                    INSERT INTO health_records 
-                    (user_id, record_type, value, unit, notes, date_for)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (user_id, record_type, value, unit, notes, date_for))
+                # BEGIN IMMEDIATE so concurrent writes for the same metric can't
+                # both read the old baseline
+                cursor.execute("BEGIN IMMEDIATE")
+                flagged = [
+                    (record_type, value)
+                    for record_type, value, unit in records
+                    if self._insert_record(cursor, user_id, record_type, value, unit, notes, date_for)
+                ]
+                self._mark_active(cursor, user_id, date_for)
                 conn.commit()
+                
+                for record_type, value in flagged:
+                    logger.info("Flagged %s=%s for user %s as an anomaly", record_type, value, user_id)
                 return True
         except Exception as e:
-            logger.error(f"Error recording health data for user {user_id}: {e}")
+            logger.error("Error recording health data for user %s: %s", user_id, e)
             return False
     
+    def _insert_record(self, cursor: sqlite3.Cursor, user_id: int, record_type: str, value: float,
+                       unit: str, notes: str, date_for: date) -> bool:
+        """Insert one record with its anomaly check and sketch update; True if it was flagged"""
+        cursor.execute("""
+            SELECT recent_values FROM metric_baselines
+            WHERE user_id = ? AND record_type = ?
+        """, (user_id, record_type))
+        row = cursor.fetchone()
+        is_anomaly, recent_values = detector.observe(row[0] if row else None, value, record_type)
+        
+        cursor.execute("""
+            INSERT INTO health_records 
+            (user_id, record_type, value, unit, notes, date_for, is_anomaly)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (user_id, record_type, value, unit, notes, date_for, int(is_anomaly)))
+        rollup_records(cursor, cursor.lastrowid, cursor.lastrowid)
+        cursor.execute("""
+            INSERT INTO metric_baselines (user_id, record_type, recent_values, updated_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT (user_id, record_type) DO UPDATE
+            SET recent_values = excluded.recent_values, updated_at = excluded.updated_at
+        """, (user_id, record_type, recent_values))
+        if not is_anomaly:
+            self._add_to_sketch(cursor, user_id, record_type, date_for, value)
+        return is_anomaly
+    
+    def _add_to_sketch(self, cursor: sqlite3.Cursor, user_id: int, record_type: str, day: date,
+                       value: float):
+        """Fold a value into the user's slot of its metric's sketch for the day (inside the caller's transaction)"""
+        slot = sketch_slot(user_id)
+        cursor.execute("""
+            SELECT sketch FROM metric_sketches WHERE record_type = ? AND day = ? AND slot = ?
+        """, (record_type, day, slot))
+        row = cursor.fetchone()
+        sketch = QuantileSketch.from_json(row[0] if row else None)
+        sketch.add(value)
+        cursor.execute("""
+            INSERT OR REPLACE INTO metric_sketches (record_type, day, slot, sketch) VALUES (?, ?, ?, ?)
+        """, (record_type, day, slot, sketch.to_json()))
+    
+    def _mark_active(self, cursor: sqlite3.Cursor, user_id: int, day: date):
+        """Add the user to the day's active-user sketch; most calls change nothing and only read"""
+        cursor.execute("SELECT registers FROM active_user_sketches WHERE day = ?", (day,))
+        row = cursor.fetchone()
+        sketch = HyperLogLog.from_bytes(row[0] if row else None)
+        if sketch.add(user_id) or row is None:
+            cursor.execute("""
+                INSERT OR REPLACE INTO active_user_sketches (day, registers) VALUES (?, ?)
+            """, (day, sketch.to_bytes()))
+    
     def get_user_records(self, user_id: int, record_type: str = None, 
                         days: int = 30) -> List[Dict[str, Any]]:
-        """Get health records for a user"""
-        try:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-                
-                if record_type:
-                    query = """
-                        SELECT * FROM health_records 
-                        WHERE user_id = ? AND record_type = ? 
-                        AND date_for >= date('now', '-{} days')
-                        ORDER BY date_for DESC, recorded_at DESC
-                    """.format(days)
-                    cursor.execute(query, (user_id, record_type))
-                else:
-                    query = """
-                        SELECT * FROM health_records 
-                        WHERE user_id = ? 
-                        AND date_for >= date('now', '-{} days')
-                        ORDER BY date_for DESC, recorded_at DESC
-                    """.format(days)
-                    cursor.execute(query, (user_id,))
-                
-                return [dict(row) for row in cursor.fetchall()]
-        except Exception as e:
-            logger.error(f"Error getting user records: {e}")
-            return []
+        """Get health records for a user (served from the analytics connection)"""
+        return list(self.iter_user_records(
+            user_id,
+            start_date=date.today() - timedelta(days=days),
+            record_types=[record_type] if record_type else None
+        ))
+    
+    def get_records_page(self, user_id: int, start_date: date = None, end_date: date = None,
+                         record_types: Sequence[str] = None, limit: int = 500,
+                         cursor: str = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """One page of records, newest first (served from the analytics connection)
+
+        The (user_id, date_for, recorded_at) index plus the implicit rowid
+        covers both the range filter and the sort, so every page is a
+        bounded index scan.
+        """
+        conditions = ["user_id = ?"]
+        params: List[Any] = [user_id]
+        if start_date is not None:
+            conditions.append("date_for >= ?")
+            params.append(start_date.isoformat())
+        if end_date is not None:
+            conditions.append("date_for <= ?")
+            params.append(end_date.isoformat())
+        if record_types:
+            conditions.append("record_type IN ({})".format(", ".join("?" * len(record_types))))
+            params.extend(record_types)
+        if cursor:
+            conditions.append("(date_for, recorded_at, id) < (?, ?, ?)")
+            params.extend(decode_cursor(cursor))
+        params.append(limit)
+        
+        # Errors propagate: an empty last page here would silently cut short iter_user_records
+        with self._get_read_connection() as conn:
+            rows = conn.execute("""
+                SELECT * FROM health_records
+                WHERE {}
+                ORDER BY date_for DESC, recorded_at DESC, id DESC
+                LIMIT ?
+            """.format(" AND ".join(conditions)), params).fetchall()
+        records = [dict(row) for row in rows]
+        return records, encode_cursor(records[-1]) if len(records) == limit else None
     
     def get_daily_summary(self, user_id: int, target_date: date = None) -> Dict[str, Any]:
         """Get daily summary of health data"""
@@ -196,7 +348,7 @@ class Database:
                 
                 return summary
         except Exception as e:
-            logger.error(f"Error getting daily summary: {e}")
+            logger.error("Error getting daily summary: %s", e)
             return {}
     
     def update_user_preferences(self, user_id: int, **preferences) -> bool:
@@ -226,7 +378,7 @@ class Database:
                 
                 return False
         except Exception as e:
-            logger.error(f"Error updating user preferences: {e}")
+            logger.error("Error updating user preferences: %s", e)
             return False
     
     def get_user_preferences(self, user_id: int) -> Dict[str, Any]:
@@ -241,7 +393,7 @@ class Database:
                 row = cursor.fetchone()
                 return dict(row) if row else {}
         except Exception as e:
-            logger.error(f"Error getting user preferences: {e}")
+            logger.error("Error getting user preferences: %s", e)
             return {}
     
     def get_stats(self, user_id: int, days: int = 30) -> Dict[str, Any]:
@@ -252,31 +404,397 @@ class Database:
                 
                 # Get record counts by type
                 cursor.execute("""
-                    SELECT record_type, COUNT(*) as count, AVG(value) as avg_value
+                    SELECT record_type, COUNT(*) as count,
+                    AVG(CASE WHEN is_anomaly = 0 THEN value END) as avg_value
                     FROM health_records 
-                    WHERE user_id = ? AND date_for >= date('now', '-{} days')
+                    WHERE user_id = ? AND date_for >= ?
                     GROUP BY record_type
-                """.format(days), (user_id,))
+                """, (user_id, (date.today() - timedelta(days=days)).isoformat()))
                 
                 stats = {}
+                total = 0
                 for row in cursor.fetchall():
                     stats[row['record_type']] = {
                         'count': row['count'],
                         'average': round(row['avg_value'], 2) if row['avg_value'] else 0
                     }
+                    total += row['count']
                 
-                # Get total records
-                cursor.execute("""
-                    SELECT COUNT(*) as total_records 
-                    FROM health_records 
-                    WHERE user_id = ? AND date_for >= date('now', '-{} days')
-                """.format(days), (user_id,))
-                
-                total = cursor.fetchone()['total_records']
                 stats['total_records'] = total
                 stats['days_period'] = days
                 
                 return stats
         except Exception as e:
-            logger.error(f"Error getting user stats: {e}")
+            logger.error("Error getting user stats: %s", e)
             return {}
+    
+    def acquire_lease(self, name: str, owner: str, ttl_seconds: float) -> bool:
+        """Take or renew a named lease; False while another owner holds it"""
+        now = time.time()
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    INSERT INTO scheduler_leases (name, owner, expires_at)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT (name) DO UPDATE
+                    SET owner = excluded.owner, expires_at = excluded.expires_at
+                    WHERE scheduler_leases.owner = excluded.owner
+                    OR scheduler_leases.expires_at < ?
+                """, (name, owner, now + ttl_seconds, now))
+                conn.commit()
+                return cursor.rowcount == 1
+        except Exception as e:
+            logger.error("Error acquiring lease %s: %s", name, e)
+            return False
+    
+    def get_reminder_candidates(self, reminder_time: str, target_date: date) -> List[int]:
+        """Users with reminders enabled at reminder_time and no records for target_date"""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT p.user_id FROM user_preferences p
+                    WHERE p.reminder_enabled AND p.reminder_time = ?
+                    AND NOT EXISTS (
+                        SELECT 1 FROM health_records r
+                        WHERE r.user_id = p.user_id AND r.date_for = ?
+                    )
+                """, (reminder_time, target_date))
+                return [row[0] for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error("Error getting reminder candidates: %s", e)
+            return []
+    
+    def claim_reminder(self, user_id: int, target_date: date) -> bool:
+        """Mark a user's reminder for target_date as sent; False if already claimed"""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    INSERT OR IGNORE INTO reminders_sent (user_id, reminder_date)
+                    VALUES (?, ?)
+                """, (user_id, target_date))
+                conn.commit()
+                return cursor.rowcount == 1
+        except Exception as e:
+            logger.error("Error claiming reminder for user %s: %s", user_id, e)
+            return False
+    
+    def get_metric_rows_touched_since(self, since: str = None) -> List[tuple]:
+        """Unflagged records of every (user, day) that received a record after `since`"""
+        with self._get_read_connection() as conn:
+            cursor = conn.cursor()
+            if since is None:
+                cursor.execute("""
+                    SELECT user_id, date_for, record_type, value, recorded_at
+                    FROM health_records
+                    WHERE is_anomaly = 0
+                """)
+            else:
+                cursor.execute("""
+                    SELECT user_id, date_for, record_type, value, recorded_at
+                    FROM health_records
+                    WHERE is_anomaly = 0 AND (user_id, date_for) IN (
+                        SELECT DISTINCT user_id, date_for FROM health_records
+                        WHERE recorded_at > ?
+                    )
+                """, (since,))
+            return [tuple(row) for row in cursor.fetchall()]
+    
+    def iter_record_batches(self, batch_size: int = 10000) -> Iterator[List[tuple]]:
+        """Every record in id-ordered batches (served from the analytics connection)"""
+        last_id = 0
+        while True:
+            with self._get_read_connection() as conn:
+                rows = conn.execute("""
+                    SELECT id, user_id, date_for, record_type, value, recorded_at, is_anomaly
+                    FROM health_records
+                    WHERE id > ?
+                    ORDER BY id LIMIT ?
+                """, (last_id, batch_size)).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1]['id']
+            yield [tuple(row)[1:] for row in rows]
+    
+    def get_metric_rows_for_day(self, user_ids: List[int], target_date: date) -> List[tuple]:
+        """Unflagged records of the given users for one day"""
+        if not user_ids:
+            return []
+        with self._get_read_connection() as conn:
+            cursor = conn.cursor()
+            placeholders = ", ".join("?" * len(user_ids))
+            cursor.execute(f"""
+                SELECT user_id, date_for, record_type, value, recorded_at
+                FROM health_records
+                WHERE date_for = ? AND user_id IN ({placeholders}) AND is_anomaly = 0
+            """, (target_date, *user_ids))
+            return [tuple(row) for row in cursor.fetchall()]
+    
+    def get_metric_rows_between(self, user_ids: List[int], start_date: date, end_date: date) -> List[tuple]:
+        """Unflagged records of the given users over a date range (one keyset index range per user)"""
+        if not user_ids:
+            return []
+        with self._get_read_connection() as conn:
+            placeholders = ", ".join("?" * len(user_ids))
+            rows = conn.execute(f"""
+                SELECT user_id, date_for, record_type, value, recorded_at
+                FROM health_records
+                WHERE user_id IN ({placeholders}) AND date_for BETWEEN ? AND ? AND is_anomaly = 0
+            """, (*user_ids, start_date.isoformat(), end_date.isoformat())).fetchall()
+            return [tuple(row) for row in rows]
+    
+    def get_active_user_ids(self, start_date: date, end_date: date, after: int = 0,
+                            limit: int = 1000) -> List[int]:
+        """Users with records in a date range, walking the keyset index in user order"""
+        with self._get_read_connection() as conn:
+            rows = conn.execute("""
+                SELECT DISTINCT user_id FROM health_records
+                WHERE user_id > ? AND date_for BETWEEN ? AND ?
+                ORDER BY user_id
+                LIMIT ?
+            """, (after, start_date.isoformat(), end_date.isoformat(), limit)).fetchall()
+            return [row[0] for row in rows]
+    
+    def save_digests(self, period: str, period_end: date, digests: Dict[int, Dict[str, Any]],
+                     last_user_id: int, completed: bool = False) -> bool:
+        """Upsert a chunk of digests and the job position in one short write transaction
+
+        The completing call also deletes digests of earlier periods, so a
+        user who was inactive this period gets no digest rather than an
+        old one.
+        """
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.executemany("""
+                    INSERT INTO user_digests (user_id, period, period_end, payload, computed_at)
+                    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                    ON CONFLICT (user_id, period) DO UPDATE SET
+                        period_end = excluded.period_end,
+                        payload = excluded.payload,
+                        computed_at = excluded.computed_at
+                """, [
+                    (user_id, period, period_end.isoformat(), json.dumps(digest))
+                    for user_id, digest in digests.items()
+                ])
+                cursor.execute("""
+                    INSERT OR REPLACE INTO digest_progress (period, period_end, last_user_id, completed)
+                    VALUES (?, ?, ?, ?)
+                """, (period, period_end.isoformat(), last_user_id, int(completed)))
+                if completed:
+                    # Users the finished run did not cover were inactive: drop their older digests
+                    cursor.execute("DELETE FROM user_digests WHERE period = ? AND period_end < ?",
+                                   (period, period_end.isoformat()))
+                conn.commit()
+                return True
+        except Exception as e:
+            logger.error("Error saving %s digests: %s", period, e)
+            return False
+    
+    def get_digest_progress(self, period: str) -> Optional[Tuple[date, int, bool]]:
+        with self._get_connection() as conn:
+            row = conn.execute(
+                "SELECT period_end, last_user_id, completed FROM digest_progress WHERE period = ?", (period,)
+            ).fetchone()
+        if row is None:
+            return None
+        return date.fromisoformat(row['period_end']), row['last_user_id'], bool(row['completed'])
+    
+    def get_digest(self, user_id: int, period: str) -> Optional[Dict[str, Any]]:
+        """A user's precomputed digest: one primary-key lookup"""
+        try:
+            with self._get_connection() as conn:
+                row = conn.execute(
+                    "SELECT payload FROM user_digests WHERE user_id = ? AND period = ?", (user_id, period)
+                ).fetchone()
+            return json.loads(row['payload']) if row else None
+        except Exception as e:
+            logger.error("Error getting %s digest for %s: %s", period, user_id, e)
+            return None
+    
+    def count_records_before(self, before: date) -> int:
+        """Records dated before `before` (served from the analytics connection)"""
+        with self._get_read_connection() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM health_records WHERE date_for < ?", (before.isoformat(),)
+            ).fetchone()[0]
+    
+    def prune_records_batch(self, before: date, limit: int) -> int:
+        """Summarize and delete the oldest records before a date, in one short write transaction"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            # Oldest first by id; every matching row in [first, last] is part of the batch
+            first, last, count = cursor.execute("""
+                SELECT MIN(id), MAX(id), COUNT(*) FROM (
+                    SELECT id FROM health_records WHERE date_for < ? ORDER BY id LIMIT ?
+                )
+            """, (before.isoformat(), limit)).fetchone()
+            if not count:
+                conn.rollback()
+                return 0
+            cursor.execute("""
+                INSERT INTO daily_summaries
+                (user_id, date_for, record_type, records, samples, total, minimum, maximum)
+                SELECT user_id, date_for, record_type, COUNT(*),
+                       SUM(is_anomaly = 0),
+                       TOTAL(CASE WHEN is_anomaly = 0 THEN value END),
+                       MIN(CASE WHEN is_anomaly = 0 THEN value END),
+                       MAX(CASE WHEN is_anomaly = 0 THEN value END)
+                FROM health_records
+                WHERE id BETWEEN ? AND ? AND date_for < ?
+                GROUP BY user_id, date_for, record_type
+                ON CONFLICT (user_id, date_for, record_type) DO UPDATE SET
+                    records = records + excluded.records,
+                    samples = samples + excluded.samples,
+                    total = total + excluded.total,
+                    minimum = CASE WHEN minimum IS NULL OR excluded.minimum < minimum
+                                   THEN excluded.minimum ELSE minimum END,
+                    maximum = CASE WHEN maximum IS NULL OR excluded.maximum > maximum
+                                   THEN excluded.maximum ELSE maximum END
+            """, (first, last, before.isoformat()))
+            cursor.execute(
+                "DELETE FROM health_records WHERE id BETWEEN ? AND ? AND date_for < ?",
+                (first, last, before.isoformat())
+            )
+            conn.commit()
+            return count
+    
+    def count_user_records(self, user_id: int) -> int:
+        """Records stored for one user"""
+        with self._get_connection() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM health_records WHERE user_id = ?", (user_id,)
+            ).fetchone()[0]
+    
+    def get_last_record_id(self, user_id: int) -> Optional[int]:
+        """Id of the user's newest record (a scan of their index entries, which carry the rowid)"""
+        try:
+            with self._get_read_connection() as conn:
+                return conn.execute(
+                    "SELECT MAX(id) FROM health_records WHERE user_id = ?", (user_id,)
+                ).fetchone()[0]
+        except Exception as e:
+            logger.error("Error getting last record id: %s", e)
+            return None
+    
+    def delete_user_batch(self, user_id: int, limit: int) -> int:
+        """Delete a chunk of a user's records, then the rest of their data once none are left"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("""
+                DELETE FROM health_records WHERE id IN (
+                    SELECT id FROM health_records WHERE user_id = ? LIMIT ?
+                )
+            """, (user_id, limit))
+            deleted = cursor.rowcount
+            if deleted == 0:
+                for table in ('daily_summaries', 'user_digests', 'metric_baselines', 'reminders_sent',
+                              'user_preferences', 'users'):
+                    cursor.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+            conn.commit()
+            return deleted
+    
+    def get_quantile_sketch(self, record_type: str, start_date: date, end_date: date) -> QuantileSketch:
+        """Merged sketch of a metric's per-day, per-slot sketches between two dates"""
+        with self._get_read_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT sketch FROM metric_sketches
+                WHERE record_type = ? AND day BETWEEN ? AND ?
+            """, (record_type, start_date, end_date))
+            return QuantileSketch.merged(QuantileSketch.from_json(row[0]) for row in cursor.fetchall())
+    
+    def get_active_users_sketch(self, start_date: date, end_date: date) -> HyperLogLog:
+        """Union of the per-day active-user sketches between two dates"""
+        with self._get_read_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT registers FROM active_user_sketches WHERE day BETWEEN ? AND ?
+            """, (start_date, end_date))
+            return HyperLogLog.union(HyperLogLog.from_bytes(row[0]) for row in cursor.fetchall())
+    
+    def get_dashboard_summary(self) -> Dict[str, Any]:
+        """User count and records from the last week for the health check"""
+        with self._get_read_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM users")
+            user_count = cursor.fetchone()[0]
+            
+            cursor.execute("SELECT COUNT(*) FROM health_records WHERE date_for >= date('now', '-7 days')")
+            recent_records = cursor.fetchone()[0]
+            
+            return {'users': user_count, 'recent_records': recent_records}
+    
+    def get_global_stats(self) -> Dict[str, Any]:
+        """Bot-wide statistics for the dashboard"""
+        with self._get_read_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("SELECT COUNT(*) FROM users")
+            total_users = cursor.fetchone()[0]
+            
+            cursor.execute("SELECT COUNT(*) FROM health_records")
+            total_records = cursor.fetchone()[0]
+            
+            cursor.execute("""
+                SELECT record_type, COUNT(*) as count 
+                FROM health_records 
+                GROUP BY record_type
+            """)
+            record_types = {row[0]: row[1] for row in cursor.fetchall()}
+            
+            # Approximate, from the day sketches instead of a DISTINCT scan
+            today = date.today()
+            active_users = self.get_active_users_sketch(today - timedelta(days=7), today).count()
+            
+            return {
+                'total_users': total_users,
+                'total_records': total_records,
+                'active_users_week': active_users,
+                'record_types': record_types
+            }
+    
+    def get_time_series(self, metric: Optional[str], start_date: date, end_date: date,
+                        resolution: str = 'day') -> List[Dict[str, Any]]:
+        """Downsampled series from the hourly rollups (served from the analytics connection)"""
+        bucket = _BUCKETS[resolution]
+        condition = "hour BETWEEN ? AND ?"
+        params: List[Any] = [f"{start_date.isoformat()} 00:00", f"{end_date.isoformat()} 23:00"]
+        if metric:
+            condition = "record_type = ? AND " + condition
+            params.insert(0, metric)
+        with self._get_read_connection() as conn:
+            rows = conn.execute("""
+                SELECT {} AS bucket, SUM(records), SUM(samples), SUM(total), MIN(minimum), MAX(maximum)
+                FROM metric_rollups
+                WHERE {}
+                GROUP BY bucket
+                ORDER BY bucket
+            """.format(bucket, condition), params).fetchall()
+        return [
+            {'bucket': row[0], 'records': row[1], 'samples': row[2], 'total': row[3],
+             'min': row[4], 'max': row[5]}
+            for row in rows
+        ]
+    
+    def run_maintenance(self) -> Dict[str, Any]:
+        """ANALYZE/optimize, bounded incremental vacuum and WAL checkpoint of the live file"""
+        from maintenance import maintain_sqlite
+        try:
+            return maintain_sqlite(self.db_path).to_dict()
+        except sqlite3.Error as e:
+            logger.error("Database maintenance failed: %s", e)
+            return {'path': self.db_path, 'error': str(e)}
+    
+    def run_backup(self) -> Dict[str, Any]:
+        """Paced online backup of the live file into BACKUP_DIR, keeping the newest BACKUP_KEEP"""
+        from backup import backup_database
+        try:
+            return backup_database(self.db_path).to_dict()
+        except (sqlite3.Error, OSError) as e:
+            logger.error("Database backup failed: %s", e)
+            return {'source': self.db_path, 'error': str(e)}
@@ -0,0 +1,234 @@
+"""
+Weekly and monthly digests for Health Tracker Bot
+An off-peak batch job summarizes every active user's period in vectorized chunks and stores it for /week and /month
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+from dataclasses import dataclass, asdict
+from datetime import date, timedelta
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+from metrics import REGISTRY
+from storage import StorageBackend, create_storage, database_url_from_env
+
+logger = logging.getLogger(__name__)
+
+# Period name -> length in days; each run covers the days up to and including yesterday
+PERIODS = {'week': 7, 'month': 30}
+
+# Users summarized per chunk (one read, one array pass and one write transaction each)
+DIGEST_CHUNK = int(os.getenv("DIGEST_CHUNK", "500"))
+# Pause between chunks so bot writes are never queued behind the job
+DIGEST_PAUSE = float(os.getenv("DIGEST_PAUSE", "0.05"))
+# Stop after this many seconds and resume from the saved position on the next run; 0 means no limit
+DIGEST_MAX_SECONDS = float(os.getenv("DIGEST_MAX_SECONDS", "0"))
+
+METRICS = tuple(REGISTRY)
+_METRIC_INDEX = {name: index for index, name in enumerate(METRICS)}
+# Metrics whose link to mood the digest reports, and the days both must be logged on
+CORRELATED = ('sleep', 'exercise', 'steps', 'water')
+MIN_CORRELATION_DAYS = 5
+
+
+@dataclass
+class DigestRun:
+    """Progress of one period's digest job"""
+    period: str
+    period_end: str
+    status: str = 'running'        # running, done, paused (time budget spent) or failed
+    resumed_after: int = 0         # user id the run continued after, 0 for a fresh run
+    users: int = 0
+    chunks: int = 0
+    seconds: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def daily_means(rows: Sequence[tuple], user_ids: Sequence[int], start: date, days: int) -> np.ndarray:
+    """Pivot (user_id, date_for, record_type, value, recorded_at) rows into a users x days x metrics cube
+
+    Each cell is the mean of that day's values, NaN where nothing was
+    logged; user_ids must be sorted. Rows of unknown record types or
+    outside the window are ignored.
+    """
+    sums = np.zeros((len(user_ids), days, len(METRICS)))
+    counts = np.zeros(sums.shape)
+    known = [row for row in rows if row[2] in _METRIC_INDEX]
+    if known:
+        users = np.searchsorted(np.asarray(user_ids), [row[0] for row in known])
+        offsets = (np.array([str(row[1])[:10] for row in known], dtype='datetime64[D]')
+                   - np.datetime64(start, 'D')).astype(np.int64)
+        metrics = np.array([_METRIC_INDEX[row[2]] for row in known])
+        values = np.array([row[3] for row in known], dtype=np.float64)
+        inside = (offsets >= 0) & (offsets < days)
+        index = (users[inside], offsets[inside], metrics[inside])
+        np.add.at(sums, index, values[inside])
+        np.add.at(counts, index, 1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / counts
+
+
+def _runs(logged: np.ndarray) -> np.ndarray:
+    """Length of the run of True ending at each position, per row"""
+    total = np.cumsum(logged, axis=1)
+    at_gap = np.maximum.accumulate(np.where(logged, 0, total), axis=1)
+    return total - at_gap
+
+
+def summarize(cube: np.ndarray, user_ids: Sequence[int], start: date,
+              period: str) -> Dict[int, Dict[str, Any]]:
+    """Digest per user from a daily_means cube; every statistic is one array operation over the chunk"""
+    days = cube.shape[1]
+    present = ~np.isnan(cube)
+    logged_days = present.sum(axis=1)                                   # users x metrics
+    filled = np.where(present, cube, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        averages = filled.sum(axis=1) / logged_days
+    highs = np.where(present, cube, -np.inf).argmax(axis=1)
+    lows = np.where(present, cube, np.inf).argmin(axis=1)
+
+    runs = _runs(present.any(axis=2))
+    longest, current = runs.max(axis=1), runs[:, -1]
+    days_logged = present.any(axis=2).sum(axis=1)
+
+    # Pearson r of each metric against mood over the days both were logged
+    mood = _METRIC_INDEX['mood']
+    correlations = {}
+    for name in CORRELATED:
+        x, y = cube[:, :, _METRIC_INDEX[name]], cube[:, :, mood]
+        both = present[:, :, _METRIC_INDEX[name]] & present[:, :, mood]
+        n = both.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            dx = np.where(both, x - np.where(both, x, 0).sum(axis=1, keepdims=True) / n[:, None], 0)
+            dy = np.where(both, y - np.where(both, y, 0).sum(axis=1, keepdims=True) / n[:, None], 0)
+            r = (dx * dy).sum(axis=1) / np.sqrt((dx * dx).sum(axis=1) * (dy * dy).sum(axis=1))
+        correlations[name] = np.where((n >= MIN_CORRELATION_DAYS) & np.isfinite(r), r, np.nan)
+
+    end = start + timedelta(days=days - 1)
+    digests = {}
+    for row, user_id in enumerate(user_ids):
+        metrics = {}
+        for column, name in enumerate(METRICS):
+            if not logged_days[row, column]:
+                continue
+            high, low = int(highs[row, column]), int(lows[row, column])
+            metrics[name] = {
+                'average': round(float(averages[row, column]), 2),
+                'days': int(logged_days[row, column]),
+                'high': [(start + timedelta(days=high)).isoformat(), round(float(cube[row, high, column]), 2)],
+                'low': [(start + timedelta(days=low)).isoformat(), round(float(cube[row, low, column]), 2)],
+            }
+        digests[int(user_id)] = {
+            'period': period,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'days_logged': int(days_logged[row]),
+            'metrics': metrics,
+            'streak': {'current': int(current[row]), 'longest': int(longest[row])},
+            'correlations': {
+                name: round(float(values[row]), 2)
+                for name, values in correlations.items() if not np.isnan(values[row])
+            },
+        }
+    return digests
+
+
+def build_digests(storage: StorageBackend, period: str, end: date = None, chunk: int = DIGEST_CHUNK,
+                  pause: float = DIGEST_PAUSE, max_seconds: float = DIGEST_MAX_SECONDS) -> DigestRun:
+    """Compute and store the digest of every user active in the period ending on `end` (yesterday)
+
+    Users are taken in id order, `chunk` at a time; each chunk's digests
+    and the last user id are committed together, so an interrupted or
+    paused run for the same period picks up after the last full chunk.
+    An unfinished run for an earlier end is completed first; if that
+    one pauses or fails its run is returned and `end` waits for the
+    next call.
+    """
+    days = PERIODS[period]
+    end = end or date.today() - timedelta(days=1)
+    start = end - timedelta(days=days - 1)
+    run = DigestRun(period, end.isoformat())
+    started = time.monotonic()
+
+    progress = storage.get_digest_progress(period)
+    if progress is not None and not progress[2] and progress[0] < end:
+        earlier = build_digests(storage, period, progress[0], chunk, pause, max_seconds)
+        if earlier.status != 'done':
+            return earlier
+        if max_seconds:
+            max_seconds -= earlier.seconds
+            if max_seconds <= 0:
+                run.status = 'paused'
+                return run
+        started = time.monotonic()
+        progress = storage.get_digest_progress(period)
+
+    if progress is not None and progress[0] == end:
+        if progress[2]:
+            run.status = 'done'
+            return run
+        run.resumed_after = progress[1]
+
+    after = run.resumed_after
+    try:
+        while True:
+            users = storage.get_active_user_ids(start, end, after, chunk)
+            if not users:
+                storage.save_digests(period, end, {}, after, completed=True)
+                run.status = 'done'
+                break
+            rows = storage.get_metric_rows_between(users, start, end)
+            digests = summarize(daily_means(rows, users, start, days), users, start, period)
+            if not storage.save_digests(period, end, digests, users[-1]):
+                run.status = 'failed'
+                break
+            after = users[-1]
+            run.users += len(users)
+            run.chunks += 1
+            if max_seconds and time.monotonic() - started >= max_seconds:
+                run.status = 'paused'
+                break
+            time.sleep(pause)
+    except Exception as e:
+        run.status = 'failed'
+        logger.error("%s digests failed after %s users: %s", period.title(), run.users, e)
+
+    run.seconds = round(time.monotonic() - started, 3)
+    logger.info("%s digests to %s %s: %s users in %s chunks, %.1f s%s", period.title(), run.period_end,
+                run.status, run.users, run.chunks, run.seconds,
+                f" (resumed after user {run.resumed_after})" if run.resumed_after else "")
+    return run
+
+
+def build_all_digests(storage: StorageBackend, end: date = None) -> List[DigestRun]:
+    """Nightly job: weekly and monthly digests for every active user"""
+    return [build_digests(storage, period, end) for period in PERIODS]
+
+
+def main(argv=None):
+    """Command line entry point: python digests.py [--period week|month] [--end YYYY-MM-DD] [--url URL]"""
+    parser = argparse.ArgumentParser(description="Build (or resume) weekly and monthly digests")
+    parser.add_argument("--url", default=database_url_from_env(), help="storage URL (default: DATABASE_URL)")
+    parser.add_argument("--period", choices=sorted(PERIODS), help="one period only (default: all)")
+    parser.add_argument("--end", type=date.fromisoformat, help="last day covered (default: yesterday)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    storage = create_storage(args.url)
+    periods = [args.period] if args.period else list(PERIODS)
+    runs = [build_digests(storage, period, args.end) for period in periods]
+    for run in runs:
+        print(run.to_dict())
+    return 0 if all(run.status in ('done', 'paused') for run in runs) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
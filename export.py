@@ -0,0 +1,38 @@
+"""
+Data export serialization for Health Tracker Bot
+Records are packed into columns for the offload pool and rendered to CSV there
+"""
+
+import csv
+import io
+from array import array
+from typing import Any, Dict, Iterable, Tuple
+
+EXPORT_HEADER = ("Date", "Type", "Value", "Unit", "Notes", "Recorded At")
+
+
+def pack_records(records: Iterable[Dict[str, Any]]) -> Tuple:
+    """Split records into per-column sequences; values go in a compact float array
+
+    Records are consumed in one pass, so a lazy iterator of pages is
+    packed without ever holding the row dicts all at once.
+    """
+    dates, types, units, notes, recorded = [], [], [], [], []
+    values = array('d')
+    for r in records:
+        dates.append(str(r['date_for']))
+        types.append(r['record_type'])
+        values.append(r['value'])
+        units.append(r['unit'] or '')
+        notes.append(r['notes'] or '')
+        recorded.append(str(r['recorded_at']))
+    return tuple(dates), tuple(types), values, tuple(units), tuple(notes), tuple(recorded)
+
+
+def records_to_csv(columns: Tuple) -> bytes:
+    """Render packed records as UTF-8 CSV (offload entry point)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(EXPORT_HEADER)
+    writer.writerows(zip(*columns))
+    return buffer.getvalue().encode('utf-8')
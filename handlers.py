@@ -2,21 +2,55 @@
 Message and command handlers for Health Tracker Bot
 """
 
+import asyncio
 import logging
-import json
-from datetime import datetime, date
-from telegram import Update, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
+from datetime import datetime, date, timedelta
+from typing import List, Optional
+from telegram import Update
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
-from database import Database
+from storage import StorageBackend
+from offload import offloader, OffloadBusy
+from outbox import Outbox
+from export import pack_records, records_to_csv
+from log_parser import parse_log, looks_like_log
+from metrics import ALIASES, BY_STATE, REGISTRY, InvalidValue, Metric
+from messages import Catalog, button_actions, catalog
+from retention import retention
+from inference_cache import inference_cache, fingerprint
+import charts
 
 logger = logging.getLogger(__name__)
 
 class HealthHandlers:
     """Handler class for all bot commands and messages"""
     
-    def __init__(self, database: Database):
+    def __init__(self, database: StorageBackend, outbox: Outbox = None):
         self.db = database
+        self.outbox = outbox
         self.user_states = {}  # Track user conversation states
+        self.metric_commands = {name: self.metric_command(metric) for name, metric in REGISTRY.items()}
+        commands = {'stats': self.stats_command, 'profile': self.profile_command, 'help': self.help_command}
+        commands.update(self.metric_commands)
+        # Button text in every locale -> handler
+        self._buttons = {text: commands[action] for text, action in button_actions().items()}
+    
+    async def _reply(self, update: Update, text: str, parse_mode: str = None, reply_markup=None):
+        """Reply through the outbox, which merges back-to-back replies into one message
+
+        Returns the outbox future for the delivery (or None without an
+        outbox), for callers that must send something else after it.
+        """
+        if self.outbox is not None and self.outbox.running:
+            return await self.outbox.send(update.effective_chat.id, text, parse_mode=parse_mode,
+                                          reply_markup=reply_markup)
+        await update.message.reply_text(text, parse_mode=parse_mode, reply_markup=reply_markup)
+        return None
+    
+    @staticmethod
+    def _messages(update: Update) -> Catalog:
+        """Templates in the user's Telegram language"""
+        return catalog(update.effective_user.language_code)
     
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /start command"""
@@ -24,354 +58,323 @@ class HealthHandlers:
         user_id = user.id
         
         # Register user in database
-        self.db.register_user(
+        await asyncio.to_thread(
+            self.db.register_user,
             user_id=user_id,
             username=user.username,
             first_name=user.first_name,
             last_name=user.last_name
         )
         
-        welcome_text = f"""
-🏥 **Welcome to Health Tracker Bot!** 🏥
-
-Hi {user.first_name}! I'm here to help you track your daily health metrics.
-
-**Available Commands:**
-📊 /stats - View your health statistics
-👤 /profile - Manage your profile
-⚖️ /weight - Log your weight
-👣 /steps - Log daily steps
-💧 /water - Log water intake
-🏃 /exercise - Log exercise time
-😴 /sleep - Log sleep hours
-😊 /mood - Log your mood
-🔔 /reminder - Set daily reminders
-📤 /export - Export your data
-❓ /help - Show detailed help
-
-Start tracking your health journey today! 🌟
-        """
-        
-        keyboard = [
-            [KeyboardButton("📊 Stats"), KeyboardButton("👤 Profile")],
-            [KeyboardButton("⚖️ Weight"), KeyboardButton("👣 Steps")],
-            [KeyboardButton("💧 Water"), KeyboardButton("🏃 Exercise")],
-            [KeyboardButton("❓ Help")]
-        ]
-        reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+        messages = self._messages(update)
+        welcome_text = messages.render(
+            'welcome', first_name=user.first_name, metric_commands=messages.metric_commands
+        )
         
-        await update.message.reply_text(welcome_text, reply_markup=reply_markup, parse_mode='Markdown')
+        await self._reply(update, welcome_text, reply_markup=messages.keyboard('main'), parse_mode='Markdown')
     
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /help command"""
-        help_text = """
-🔍 **Detailed Help Guide**
-
-**Health Tracking Commands:**
-⚖️ `/weight [value]` - Log weight (kg)
-   Example: /weight 70.5
-
-👣 `/steps [value]` - Log daily steps
-   Example: /steps 8500
-
-💧 `/water [value]` - Log water intake (ml)
-   Example: /water 2000
-
-🏃 `/exercise [minutes]` - Log exercise time
-   Example: /exercise 45
-
-😴 `/sleep [hours]` - Log sleep duration
-   Example: /sleep 8
-
-😊 `/mood [1-10]` - Rate your mood (1=sad, 10=happy)
-   Example: /mood 8
-
-**Data Management:**
-📊 `/stats` - View your statistics
-👤 `/profile` - Manage profile settings
-📤 `/export` - Export your data as CSV
-🔔 `/reminder` - Set daily reminders
-
-**Tips:**
-• You can use the keyboard buttons for quick access
-• Data is automatically saved with timestamp
-• Use /stats to track your progress over time
-• Set reminders to maintain consistency
-
-Need more help? Just type your question! 🤔
-        """
+        messages = self._messages(update)
+        help_text = messages.render('help', metric_help=messages.metric_help)
         
-        await update.message.reply_text(help_text, parse_mode='Markdown')
+        await self._reply(update, help_text, parse_mode='Markdown')
     
-    async def weight_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle /weight command"""
-        user_id = update.effective_user.id
-        
-        if context.args:
-            try:
-                weight = float(context.args[0])
-                if 20 <= weight <= 500:  # Reasonable weight range
-                    success = self.db.record_health_data(
-                        user_id=user_id,
-                        record_type='weight',
-                        value=weight,
-                        unit='kg'
-                    )
-                    
-                    if success:
-                        await update.message.reply_text(
-                            f"✅ Weight recorded: {weight} kg\n"
-                            f"📅 Date: {date.today().strftime('%Y-%m-%d')}"
-                        )
-                    else:
-                        await update.message.reply_text("❌ Failed to record weight. Please try again.")
-                else:
-                    await update.message.reply_text("❌ Please enter a realistic weight between 20-500 kg")
-            except ValueError:
-                await update.message.reply_text("❌ Please enter a valid number for weight")
-        else:
-            self.user_states[user_id] = 'waiting_weight'
-            await update.message.reply_text(
-                "⚖️ Please send your current weight in kg:\n"
-                "Example: 70.5"
-            )
+    def metric_command(self, metric: Metric):
+        """Build the /<metric> command handler from its registry entry"""
+        async def command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            if context.args:
+                await self._record_metric(update, metric, context.args[0], show_date=True)
+            else:
+                await self._ask_metric(update, metric)
+        
+        command.__name__ = f"{metric.name}_command"
+        command.__doc__ = f"Handle /{metric.name} command"
+        return command
     
-    async def steps_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle /steps command"""
-        user_id = update.effective_user.id
-        
-        if context.args:
-            try:
-                steps = int(context.args[0])
-                if 0 <= steps <= 100000:  # Reasonable steps range
-                    success = self.db.record_health_data(
-                        user_id=user_id,
-                        record_type='steps',
-                        value=steps,
-                        unit='steps'
-                    )
-                    
-                    if success:
-                        await update.message.reply_text(
-                            f"✅ Steps recorded: {steps:,} steps\n"
-                            f"📅 Date: {date.today().strftime('%Y-%m-%d')}"
-                        )
-                    else:
-                        await update.message.reply_text("❌ Failed to record steps. Please try again.")
-                else:
-                    await update.message.reply_text("❌ Please enter a realistic step count (0-100,000)")
-            except ValueError:
-                await update.message.reply_text("❌ Please enter a valid number for steps")
+    async def _ask_metric(self, update: Update, metric: Metric):
+        """Prompt for a value and wait for it in handle_message"""
+        self.user_states[update.effective_user.id] = metric.state
+        messages = self._messages(update)
+        prompt = messages.text(f"prompt.{metric.name}")
+        choices = messages.keyboard(f"choices.{metric.name}")
+        if choices:
+            await self._reply(update, messages.render('prompt.choices', icon=metric.icon, prompt=prompt),
+                              reply_markup=choices)
         else:
-            self.user_states[user_id] = 'waiting_steps'
-            await update.message.reply_text(
-                "👣 Please send your daily step count:\n"
-                "Example: 8500"
-            )
+            await self._reply(update, messages.render(
+                'prompt.example', icon=metric.icon, prompt=prompt, example=metric.example
+            ))
     
-    async def water_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle /water command"""
-        user_id = update.effective_user.id
-        
-        if context.args:
-            try:
-                water = float(context.args[0])
-                if 0 <= water <= 10000:  # Reasonable water intake range
-                    success = self.db.record_health_data(
-                        user_id=user_id,
-                        record_type='water',
-                        value=water,
-                        unit='ml'
-                    )
-                    
-                    if success:
-                        await update.message.reply_text(
-                            f"✅ Water intake recorded: {water} ml\n"
-                            f"📅 Date: {date.today().strftime('%Y-%m-%d')}"
-                        )
-                    else:
-                        await update.message.reply_text("❌ Failed to record water intake. Please try again.")
-                else:
-                    await update.message.reply_text("❌ Please enter a realistic water amount (0-10,000 ml)")
-            except ValueError:
-                await update.message.reply_text("❌ Please enter a valid number for water intake")
-        else:
-            self.user_states[user_id] = 'waiting_water'
-            await update.message.reply_text(
-                "💧 Please send your water intake in ml:\n"
-                "Example: 2000"
-            )
+    async def _record_metric(self, update: Update, metric: Metric, text: str, show_date: bool = False) -> bool:
+        """Validate and store one value; True once it is saved"""
+        messages = self._messages(update)
+        try:
+            value = metric.parse(text)
+        except InvalidValue as e:
+            await self._reply(update, messages.render(f"value.{e.reason}", **messages.metric_values(metric)))
+            return False
+        
+        if not await asyncio.to_thread(self.db.record_health_data, update.effective_user.id,
+                                       metric.name, value, metric.unit):
+            await self._reply(update, messages.render('metric.failed', **messages.metric_values(metric)))
+            return False
+        
+        message = messages.render(
+            'metric.recorded', label=messages.label(metric), value=messages.format_value(metric, value)
+        )
+        if show_date:
+            message += "\n" + messages.render('date_line', date=date.today().strftime('%Y-%m-%d'))
+        await self._reply(update, message)
+        return True
     
-    async def exercise_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle /exercise command"""
-        user_id = update.effective_user.id
-        
-        if context.args:
-            try:
-                exercise = int(context.args[0])
-                if 0 <= exercise <= 1440:  # Max 24 hours
-                    success = self.db.record_health_data(
-                        user_id=user_id,
-                        record_type='exercise',
-                        value=exercise,
-                        unit='minutes'
-                    )
-                    
-                    if success:
-                        hours, minutes = divmod(exercise, 60)
-                        time_str = f"{hours}h {minutes}m" if hours else f"{minutes}m"
-                        await update.message.reply_text(
-                            f"✅ Exercise recorded: {time_str}\n"
-                            f"📅 Date: {date.today().strftime('%Y-%m-%d')}"
-                        )
-                    else:
-                        await update.message.reply_text("❌ Failed to record exercise. Please try again.")
-                else:
-                    await update.message.reply_text("❌ Please enter exercise time between 0-1440 minutes")
-            except ValueError:
-                await update.message.reply_text("❌ Please enter a valid number for exercise minutes")
-        else:
-            self.user_states[user_id] = 'waiting_exercise'
-            await update.message.reply_text(
-                "🏃 Please send your exercise time in minutes:\n"
-                "Example: 45"
-            )
+    async def log_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /log command: several metrics in one message"""
+        if not context.args:
+            await self._reply(update, self._messages(update).text('log.usage'))
+            return
+        await self._record_log(update, " ".join(context.args))
     
-    async def sleep_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle /sleep command"""
+    async def _record_log(self, update: Update, text: str):
+        """Validate every metric in text and store them together, or none at all"""
         user_id = update.effective_user.id
+        messages = self._messages(update)
+        parsed = parse_log(text)
+        if not parsed.ok:
+            errors = []
+            for key, fields in parsed.errors:
+                if 'metric' in fields:
+                    fields = {**fields, 'label': messages.label(REGISTRY[fields['metric']])}
+                errors.append(messages.render('log.error_line', error=messages.render(key, **fields)))
+            await self._reply(update, messages.render('log.rejected', errors="\n".join(errors)))
+            return
         
-        if context.args:
-            try:
-                sleep = float(context.args[0])
-                if 0 <= sleep <= 24:  # Reasonable sleep range
-                    success = self.db.record_health_data(
-                        user_id=user_id,
-                        record_type='sleep',
-                        value=sleep,
-                        unit='hours'
-                    )
-                    
-                    if success:
-                        await update.message.reply_text(
-                            f"✅ Sleep recorded: {sleep} hours\n"
-                            f"📅 Date: {date.today().strftime('%Y-%m-%d')}"
-                        )
-                    else:
-                        await update.message.reply_text("❌ Failed to record sleep. Please try again.")
-                else:
-                    await update.message.reply_text("❌ Please enter sleep hours between 0-24")
-            except ValueError:
-                await update.message.reply_text("❌ Please enter a valid number for sleep hours")
-        else:
-            self.user_states[user_id] = 'waiting_sleep'
-            await update.message.reply_text(
-                "😴 Please send your sleep duration in hours:\n"
-                "Example: 8"
-            )
-    
-    async def mood_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle /mood command"""
-        user_id = update.effective_user.id
+        if not await asyncio.to_thread(self.db.record_health_batch, user_id, parsed.records()):
+            await self._reply(update, messages.text('log.failed'))
+            return
         
-        if context.args:
-            try:
-                mood = int(context.args[0])
-                if 1 <= mood <= 10:
-                    success = self.db.record_health_data(
-                        user_id=user_id,
-                        record_type='mood',
-                        value=mood,
-                        unit='scale'
-                    )
-                    
-                    if success:
-                        mood_emoji = "😢" if mood <= 3 else "😐" if mood <= 6 else "😊"
-                        await update.message.reply_text(
-                            f"✅ Mood recorded: {mood}/10 {mood_emoji}\n"
-                            f"📅 Date: {date.today().strftime('%Y-%m-%d')}"
-                        )
-                    else:
-                        await update.message.reply_text("❌ Failed to record mood. Please try again.")
-                else:
-                    await update.message.reply_text("❌ Please rate your mood from 1 to 10")
-            except ValueError:
-                await update.message.reply_text("❌ Please enter a valid number from 1 to 10")
-        else:
-            self.user_states[user_id] = 'waiting_mood'
-            keyboard = [
-                [KeyboardButton("1😢"), KeyboardButton("2"), KeyboardButton("3")],
-                [KeyboardButton("4"), KeyboardButton("5😐"), KeyboardButton("6")],
-                [KeyboardButton("7"), KeyboardButton("8😊"), KeyboardButton("9")],
-                [KeyboardButton("10🎉")]
-            ]
-            reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=True)
-            await update.message.reply_text(
-                "😊 Please rate your mood from 1 (sad) to 10 (happy):",
-                reply_markup=reply_markup
-            )
+        lines = [
+            messages.render('log.line', label=messages.label(REGISTRY[metric]),
+                            value=messages.format_value(REGISTRY[metric], value))
+            for metric, value, unit in parsed.records()
+        ]
+        lines.append(messages.render('date_line', date=date.today().strftime('%Y-%m-%d')))
+        await self._reply(update, "\n".join(lines))
     
     async def stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /stats command"""
         user_id = update.effective_user.id
         
         # Get statistics for last 30 days
-        stats = self.db.get_stats(user_id, days=30)
+        stats = await asyncio.to_thread(self.db.get_stats, user_id, days=30)
         
+        messages = self._messages(update)
         if not stats or stats.get('total_records', 0) == 0:
-            await update.message.reply_text(
-                "📊 No health data found!\n\n"
-                "Start tracking your health with commands like:\n"
-                "⚖️ /weight\n👣 /steps\n💧 /water\n🏃 /exercise"
-            )
+            await self._reply(update, messages.render('stats.empty', metric_commands=messages.metric_commands))
             return
         
         # Format statistics message
-        stats_text = f"📊 **Your Health Statistics (Last 30 days)**\n\n"
+        parts = [messages.text('stats.header')]
         
         for record_type, data in stats.items():
             if record_type in ['total_records', 'days_period']:
                 continue
-                
-            icon = {
-                'weight': '⚖️',
-                'steps': '👣',
-                'water': '💧',
-                'exercise': '🏃',
-                'sleep': '😴',
-                'mood': '😊'
-            }.get(record_type, '📝')
             
-            unit = {
-                'weight': 'kg',
-                'steps': 'steps',
-                'water': 'ml',
-                'exercise': 'min',
-                'sleep': 'hours',
-                'mood': '/10'
-            }.get(record_type, '')
-            
-            stats_text += f"{icon} **{record_type.title()}**: {data['count']} entries, avg {data['average']} {unit}\n"
+            metric = REGISTRY.get(record_type)
+            if metric is None:
+                parts.append(messages.render(
+                    'stats.other_line', name=record_type.title(), count=data['count'], average=data['average']
+                ))
+                continue
+            parts.append(messages.render(
+                'stats.line', icon=metric.icon, label=messages.label(metric), count=data['count'],
+                aggregation=messages.text(f"aggregation.{metric.aggregation}"),
+                average=data['average'], unit=messages.units[metric.name]
+            ))
         
-        stats_text += f"\n📈 Total records: {stats['total_records']}"
+        parts.append(messages.render('stats.total', total=stats['total_records']))
         
         # Get today's summary
-        today_summary = self.db.get_daily_summary(user_id)
+        today_summary = await asyncio.to_thread(self.db.get_daily_summary, user_id)
         if today_summary:
-            stats_text += "\n\n**Today's Data:**\n"
+            parts.append(messages.text('stats.today_header'))
             for record_type, data in today_summary.items():
-                icon = {
-                    'weight': '⚖️',
-                    'steps': '👣',
-                    'water': '💧',
-                    'exercise': '🏃',
-                    'sleep': '😴',
-                    'mood': '😊'
-                }.get(record_type, '📝')
-                
-                stats_text += f"{icon} {data['value']} {data['unit'] or ''}\n"
+                metric = REGISTRY.get(record_type)
+                if metric is None:
+                    value = f"{data['value']} {data['unit'] or ''}"
+                    parts.append(messages.render('stats.today_line', icon='📝', value=value))
+                else:
+                    parts.append(messages.render(
+                        'stats.today_line', icon=metric.icon, value=messages.format_value(metric, data['value'])
+                    ))
+            
+            if 'mood' not in today_summary:
+                predicted = await self._predict_mood(user_id)
+                if predicted is not None:
+                    parts.append(messages.render('stats.prediction', value=predicted))
+        
+        delivered = await self._reply(update, "".join(parts), parse_mode='Markdown')
+        
+        # Chart of every metric with data; the photo goes out after the text it belongs to
+        if charts.available():
+            if delivered is not None:
+                await delivered
+            await self._send_chart(update, messages, [
+                metric for metric in REGISTRY.values() if metric.name in stats
+            ], charts.TREND_DAYS[0])
+    
+    async def trend_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /trend <metric> [days]: chart one metric over 30 or 90 days"""
+        messages = self._messages(update)
+        args = [arg.lower() for arg in context.args or []]
+        name = ALIASES.get(args[0]) if args else None
+        days = int(args[1]) if len(args) > 1 and args[1].isdigit() else charts.TREND_DAYS[0]
+        if name is None or days not in charts.TREND_DAYS:
+            await self._reply(update, messages.render(
+                'trend.usage', metrics=", ".join(REGISTRY), days=" / ".join(map(str, charts.TREND_DAYS))
+            ), parse_mode='Markdown')
+            return
+        if not charts.available():
+            await self._reply(update, messages.text('trend.unavailable'))
+            return
+        
+        if not await self._send_chart(update, messages, [REGISTRY[name]], days):
+            await self._reply(update, messages.render('trend.empty', days=days))
+    
+    async def _send_chart(self, update: Update, messages: Catalog, metrics: List[Metric], days: int) -> bool:
+        """Send a trend chart of metrics over the last `days` days; False when there was nothing to draw
+
+        The chart is keyed on the user's last record id, the day (the
+        window ends today) and the locale of its titles, so it is drawn
+        and uploaded once per data change, day and language; after the
+        first upload the cached Telegram file_id is sent instead.
+        """
+        user_id = update.effective_user.id
+        last_id = await asyncio.to_thread(self.db.get_last_record_id, user_id)
+        if last_id is None or not metrics:
+            return False
+        key = (user_id, ",".join(metric.name for metric in metrics), days, last_id,
+               date.today().isoformat(), messages.locale)
+        
+        async def render() -> bytes:
+            means = await asyncio.to_thread(
+                charts.daily_means, self.db, user_id, [metric.name for metric in metrics], days
+            )
+            series = [
+                (messages.label(metric), messages.units[metric.name], *means[metric.name])
+                for metric in metrics if metric.name in means
+            ]
+            if not series:
+                return b""
+            return await offloader.run(charts.render_trend, series, days)
+        
+        caption = messages.render(
+            'trend.caption', days=days, metrics=", ".join(messages.label(metric) for metric in metrics)
+        )
+        try:
+            chart = await charts.chart_cache.get_or_render(key, render)
+            if not chart:
+                return False
+            if isinstance(chart, str):
+                try:
+                    await update.message.reply_photo(photo=chart, caption=caption)
+                    return True
+                except BadRequest as e:
+                    # The stored file is gone on Telegram's side; draw and upload it again
+                    logger.warning("Cached chart file_id rejected, re-uploading: %s", e)
+                    charts.chart_cache.discard(key)
+                    chart = await charts.chart_cache.get_or_render(key, render)
+            
+            from io import BytesIO
+            sent = await update.message.reply_photo(photo=BytesIO(chart), caption=caption)
+            if sent is not None and sent.photo:
+                charts.chart_cache.put(key, sent.photo[-1].file_id)
+            return True
+        except (OffloadBusy, asyncio.TimeoutError):
+            await self._reply(update, messages.text('trend.busy'))
+            return True
+        except Exception as e:
+            logger.error("Error sending trend chart for %s: %s", user_id, e)
+            await self._reply(update, messages.text('error'))
+            return True
+    
+    async def week_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /week command: the digest precomputed overnight for the last 7 days"""
+        await self._send_digest(update, 'week')
+    
+    async def month_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /month command: the digest precomputed overnight for the last 30 days"""
+        await self._send_digest(update, 'month')
+    
+    async def _send_digest(self, update: Update, period: str):
+        """Render a stored digest; the reply costs one primary-key lookup"""
+        messages = self._messages(update)
+        digest = await asyncio.to_thread(self.db.get_digest, update.effective_user.id, period)
+        if not digest or not digest['metrics']:
+            await self._reply(update, messages.text('digest.empty'))
+            return
         
-        await update.message.reply_text(stats_text, parse_mode='Markdown')
+        parts = [messages.render(f"digest.header.{period}", start=digest['start'], end=digest['end'],
+                                 days_logged=digest['days_logged'])]
+        for name, data in digest['metrics'].items():
+            metric = REGISTRY.get(name)
+            if metric is None:
+                continue
+            parts.append(messages.render(
+                'digest.line', icon=metric.icon, label=messages.label(metric), days=data['days'],
+                aggregation=messages.text(f"aggregation.{metric.aggregation}"),
+                average=messages.format_value(metric, data['average'])
+            ))
+        
+        mood = digest['metrics'].get('mood')
+        if mood and mood['high'][1] != mood['low'][1]:
+            metric = REGISTRY['mood']
+            parts.append(messages.render('digest.best', day=mood['high'][0],
+                                         value=messages.format_value(metric, mood['high'][1])))
+            parts.append(messages.render('digest.worst', day=mood['low'][0],
+                                         value=messages.format_value(metric, mood['low'][1])))
+        
+        parts.append(messages.render('digest.streak', **digest['streak']))
+        
+        # Only links worth mentioning: |r| of 0.3 or more over at least a handful of shared days
+        links = [(name, r) for name, r in digest['correlations'].items() if abs(r) >= 0.3 and name in REGISTRY]
+        if links:
+            parts.append(messages.text('digest.links_header'))
+            for name, r in sorted(links, key=lambda link: -abs(link[1])):
+                parts.append(messages.render(
+                    'digest.link', label=messages.label(REGISTRY[name]), r=f"{r:+.2f}",
+                    strength=messages.text('digest.strong' if abs(r) >= 0.6 else 'digest.moderate'),
+                    direction=messages.text('digest.together' if r > 0 else 'digest.opposite')
+                ))
+        
+        await self._reply(update, "".join(parts), parse_mode='Markdown')
+    
+    async def _predict_mood(self, user_id: int) -> Optional[float]:
+        """Model estimate of today's mood from today's other metrics, if a model is ready
+
+        Memoized by (model version, user, day, last record id): the
+        prediction only changes when a new model is saved or the user
+        logs something.
+        """
+        try:
+            from ml_model import predict_mood, default_store
+            version, last_id = await asyncio.to_thread(
+                lambda: (default_store.latest_version(), self.db.get_last_record_id(user_id))
+            )
+            if not version:
+                return None
+            
+            async def compute() -> str:
+                predictions = await asyncio.to_thread(predict_mood, self.db, [user_id])
+                value = predictions.get(user_id)
+                return "" if value is None else repr(value)
+            
+            key = fingerprint("mood", version, user_id, date.today(), last_id)
+            value = await inference_cache.get_or_compute(key, compute, user_id)
+            return float(value) if value else None
+        except Exception as e:
+            logger.error("Error predicting mood for %s: %s", user_id, e)
+            return None
     
     async def profile_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /profile command"""
@@ -379,33 +382,34 @@ Need more help? Just type your question! 🤔
         user = update.effective_user
         
         # Get user preferences
-        prefs = self.db.get_user_preferences(user_id)
+        prefs = await asyncio.to_thread(self.db.get_user_preferences, user_id)
         
-        profile_text = f"👤 **Profile: {user.first_name}**\n\n"
-        profile_text += f"🆔 User ID: {user_id}\n"
-        profile_text += f"👥 Username: @{user.username or 'Not set'}\n"
-        profile_text += f"🔔 Reminders: {'Enabled' if prefs.get('reminder_enabled', True) else 'Disabled'}\n"
-        profile_text += f"⏰ Reminder time: {prefs.get('reminder_time', '20:00')}\n"
-        profile_text += f"⚖️ Weight unit: {prefs.get('weight_unit', 'kg')}\n"
+        messages = self._messages(update)
+        profile_text = messages.render(
+            'profile',
+            first_name=user.first_name,
+            user_id=user_id,
+            username=user.username or messages.text('profile.not_set'),
+            reminders=messages.text(
+                'profile.enabled' if prefs.get('reminder_enabled', True) else 'profile.disabled'
+            ),
+            reminder_time=prefs.get('reminder_time', '20:00'),
+            weight_unit=prefs.get('weight_unit', 'kg')
+        )
         
         if prefs.get('height_cm'):
-            profile_text += f"📏 Height: {prefs['height_cm']} cm\n"
+            profile_text += messages.render('profile.height', height=prefs['height_cm'])
         if prefs.get('age'):
-            profile_text += f"🎂 Age: {prefs['age']} years\n"
+            profile_text += messages.render('profile.age', age=prefs['age'])
         if prefs.get('gender'):
-            profile_text += f"👤 Gender: {prefs['gender']}\n"
-        
-        keyboard = [
-            [KeyboardButton("Set Height"), KeyboardButton("Set Age")],
-            [KeyboardButton("Toggle Reminders"), KeyboardButton("Set Reminder Time")]
-        ]
-        reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=True)
+            profile_text += messages.render('profile.gender', gender=prefs['gender'])
         
-        await update.message.reply_text(profile_text, reply_markup=reply_markup, parse_mode='Markdown')
+        await self._reply(update, profile_text, reply_markup=messages.keyboard('profile'), parse_mode='Markdown')
     
     async def reminder_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /reminder command"""
         user_id = update.effective_user.id
+        messages = self._messages(update)
         
         if context.args:
             time_str = context.args[0]
@@ -413,198 +417,116 @@ Need more help? Just type your question! 🤔
                 # Validate time format (HH:MM)
                 datetime.strptime(time_str, '%H:%M')
                 
-                success = self.db.update_user_preferences(
+                success = await asyncio.to_thread(
+                    self.db.update_user_preferences,
                     user_id=user_id,
                     reminder_time=time_str,
                     reminder_enabled=True
                 )
                 
                 if success:
-                    await update.message.reply_text(
-                        f"✅ Daily reminder set for {time_str}\n"
-                        "You'll receive a daily health tracking reminder at this time."
-                    )
+                    await self._reply(update, messages.render('reminder.set', time=time_str))
                 else:
-                    await update.message.reply_text("❌ Failed to set reminder. Please try again.")
+                    await self._reply(update, messages.text('reminder.failed'))
             except ValueError:
-                await update.message.reply_text("❌ Please use HH:MM format (24-hour)\nExample: /reminder 20:00")
+                await self._reply(update, messages.text('reminder.invalid'))
         else:
-            await update.message.reply_text(
-                "🔔 **Daily Reminder Setup**\n\n"
-                "Send your preferred reminder time in HH:MM format (24-hour)\n"
-                "Example: /reminder 20:00 (8:00 PM)\n\n"
-                "Or use buttons below:",
-                reply_markup=ReplyKeyboardMarkup([
-                    [KeyboardButton("08:00"), KeyboardButton("12:00")],
-                    [KeyboardButton("18:00"), KeyboardButton("20:00")],
-                    [KeyboardButton("Disable Reminders")]
-                ], resize_keyboard=True, one_time_keyboard=True)
+            await self._reply(
+                update,
+                messages.text('reminder.setup'),
+                reply_markup=messages.keyboard('reminder')
             )
     
     async def export_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /export command"""
         user_id = update.effective_user.id
+        messages = self._messages(update)
         
-        # Get all user records
-        records = self.db.get_user_records(user_id, days=365)  # Last year
-        
-        if not records:
-            await update.message.reply_text(
-                "📤 No data to export!\n\n"
-                "Start tracking your health first, then you can export your data."
-            )
+        # Pack the last year of records page by page, off the event loop
+        try:
+            columns = await asyncio.to_thread(lambda: pack_records(
+                self.db.iter_user_records(user_id, start_date=date.today() - timedelta(days=365))
+            ))
+        except Exception as e:
+            logger.error("Error reading records to export for %s: %s", user_id, e)
+            await self._reply(update, messages.text('error'))
             return
+        count = len(columns[0])
         
-        # Create CSV content
-        csv_content = "Date,Type,Value,Unit,Notes,Recorded At\n"
+        if not count:
+            await self._reply(update, messages.text('export.empty'))
+            return
         
-        for record in records:
-            csv_content += f"{record['date_for']},{record['record_type']},{record['value']},"
-            csv_content += f"{record['unit'] or ''},{record['notes'] or ''},{record['recorded_at']}\n"
+        # Create CSV content in the offload pool
+        try:
+            csv_content = await offloader.run(records_to_csv, columns)
+        except (OffloadBusy, asyncio.TimeoutError):
+            await self._reply(update, messages.text('export.busy'))
+            return
         
         # Send as document
         from io import BytesIO
-        csv_file = BytesIO(csv_content.encode('utf-8'))
+        csv_file = BytesIO(csv_content)
         csv_file.name = f"health_data_{user_id}_{date.today().strftime('%Y%m%d')}.csv"
         
         await update.message.reply_document(
             document=csv_file,
-            caption=f"📤 Your health data export\n📅 Records: {len(records)}\n🗓️ Generated: {date.today()}"
+            caption=messages.render('export.caption', count=count, date=date.today())
         )
     
+    async def delete_data_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /deletedata command: erase the user's data after confirmation"""
+        user_id = update.effective_user.id
+        messages = self._messages(update)
+        
+        if not context.args or context.args[0].lower() != 'confirm':
+            count = await asyncio.to_thread(self.db.count_user_records, user_id)
+            await self._reply(update, messages.render('delete.confirm', count=count), parse_mode='Markdown')
+            return
+        
+        self.user_states.pop(user_id, None)
+        await self._reply(update, messages.text('delete.started'))
+        # Chunked and paced in a worker thread, so other users' writes keep flowing
+        job = await asyncio.to_thread(retention.delete_user, self.db, user_id)
+        if job.status == 'done':
+            await self._reply(update, messages.render('delete.done', count=job.processed))
+        else:
+            await self._reply(update, messages.text('delete.failed'))
+    
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle text messages based on user state"""
         user_id = update.effective_user.id
         text = update.message.text.strip()
         
         # Handle keyboard button presses
-        if text in ["📊 Stats", "Stats"]:
-            await self.stats_command(update, context)
-            return
-        elif text in ["👤 Profile", "Profile"]:
-            await self.profile_command(update, context)
-            return
-        elif text in ["❓ Help", "Help"]:
-            await self.help_command(update, context)
-            return
-        elif text in ["⚖️ Weight", "Weight"]:
-            await self.weight_command(update, context)
-            return
-        elif text in ["👣 Steps", "Steps"]:
-            await self.steps_command(update, context)
-            return
-        elif text in ["💧 Water", "Water"]:
-            await self.water_command(update, context)
-            return
-        elif text in ["🏃 Exercise", "Exercise"]:
-            await self.exercise_command(update, context)
+        button = self._buttons.get(text)
+        if button is not None:
+            await button(update, context)
             return
         
         # Handle state-based input
         if user_id not in self.user_states:
-            await update.message.reply_text(
-                "I didn't understand that. Use /help to see available commands or use the keyboard buttons below."
-            )
+            if looks_like_log(text):
+                await self._record_log(update, text)
+                return
+            await self._reply(update, self._messages(update).text('unknown_input'))
             return
         
-        state = self.user_states[user_id]
+        metric = BY_STATE.get(self.user_states[user_id])
+        if metric is None:
+            del self.user_states[user_id]
+            await self._reply(update, self._messages(update).text('unknown_input'))
+            return
         
         try:
-            if state == 'waiting_weight':
-                weight = float(text)
-                if 20 <= weight <= 500:
-                    success = self.db.record_health_data(user_id, 'weight', weight, 'kg')
-                    if success:
-                        await update.message.reply_text(f"✅ Weight recorded: {weight} kg")
-                    else:
-                        await update.message.reply_text("❌ Failed to record weight")
-                else:
-                    await update.message.reply_text("❌ Please enter a weight between 20-500 kg")
-                    return
-                
-            elif state == 'waiting_steps':
-                steps = int(text)
-                if 0 <= steps <= 100000:
-                    success = self.db.record_health_data(user_id, 'steps', steps, 'steps')
-                    if success:
-                        await update.message.reply_text(f"✅ Steps recorded: {steps:,}")
-                    else:
-                        await update.message.reply_text("❌ Failed to record steps")
-                else:
-                    await update.message.reply_text("❌ Please enter steps between 0-100,000")
-                    return
-                
-            elif state == 'waiting_water':
-                water = float(text)
-                if 0 <= water <= 10000:
-                    success = self.db.record_health_data(user_id, 'water', water, 'ml')
-                    if success:
-                        await update.message.reply_text(f"✅ Water intake recorded: {water} ml")
-                    else:
-                        await update.message.reply_text("❌ Failed to record water intake")
-                else:
-                    await update.message.reply_text("❌ Please enter water amount between 0-10,000 ml")
-                    return
-                
-            elif state == 'waiting_exercise':
-                exercise = int(text)
-                if 0 <= exercise <= 1440:
-                    success = self.db.record_health_data(user_id, 'exercise', exercise, 'minutes')
-                    if success:
-                        hours, minutes = divmod(exercise, 60)
-                        time_str = f"{hours}h {minutes}m" if hours else f"{minutes}m"
-                        await update.message.reply_text(f"✅ Exercise recorded: {time_str}")
-                    else:
-                        await update.message.reply_text("❌ Failed to record exercise")
-                else:
-                    await update.message.reply_text("❌ Please enter exercise time between 0-1440 minutes")
-                    return
-                
-            elif state == 'waiting_sleep':
-                sleep = float(text)
-                if 0 <= sleep <= 24:
-                    success = self.db.record_health_data(user_id, 'sleep', sleep, 'hours')
-                    if success:
-                        await update.message.reply_text(f"✅ Sleep recorded: {sleep} hours")
-                    else:
-                        await update.message.reply_text("❌ Failed to record sleep")
-                else:
-                    await update.message.reply_text("❌ Please enter sleep hours between 0-24")
-                    return
-                
-            elif state == 'waiting_mood':
-                # Handle both number and emoji button format
-                if text.startswith(('1', '2', '3', '4', '5', '6', '7', '8', '9')) and text[0].isdigit():
-                    mood = int(text[0])
-                else:
-                    mood = int(text)
-                
-                if 1 <= mood <= 10:
-                    success = self.db.record_health_data(user_id, 'mood', mood, 'scale')
-                    if success:
-                        mood_emoji = "😢" if mood <= 3 else "😐" if mood <= 6 else "😊"
-                        await update.message.reply_text(f"✅ Mood recorded: {mood}/10 {mood_emoji}")
-                    else:
-                        await update.message.reply_text("❌ Failed to record mood")
-                else:
-                    await update.message.reply_text("❌ Please rate your mood from 1 to 10")
-                    return
+            if not await self._record_metric(update, metric, text):
+                return
             
-            # Clear state after successful input
+            # Clear state after successful input and show the main keyboard
             del self.user_states[user_id]
+            messages = self._messages(update)
+            await self._reply(update, messages.text('track_next'), reply_markup=messages.keyboard('main'))
             
-            # Show main keyboard
-            keyboard = [
-                [KeyboardButton("📊 Stats"), KeyboardButton("👤 Profile")],
-                [KeyboardButton("⚖️ Weight"), KeyboardButton("👣 Steps")],
-                [KeyboardButton("💧 Water"), KeyboardButton("🏃 Exercise")],
-                [KeyboardButton("❓ Help")]
-            ]
-            reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-            await update.message.reply_text("What would you like to track next?", reply_markup=reply_markup)
-            
-        except ValueError:
-            await update.message.reply_text("❌ Please enter a valid number")
         except Exception as e:
-            logger.error(f"Error handling message: {e}")
-            await update.message.reply_text("❌ An error occurred. Please try again.")
+            logger.error("Error handling message: %s", e)
+            await self._reply(update, self._messages(update).text('error'))
@@ -0,0 +1,223 @@
+"""
+Memoization for analysis and recommendation results
+A bounded in-memory LRU, optionally backed by a SQLite table that survives restarts
+"""
+
+import os
+import time
+import asyncio
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def fingerprint(*parts) -> str:
+    """Stable digest of the inputs that determine a cached result
+
+    Arrays and bytes are hashed by content, everything else by repr.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        if hasattr(part, 'tobytes'):
+            part = part.tobytes()
+        elif not isinstance(part, bytes):
+            part = repr(part).encode('utf-8')
+        digest.update(len(part).to_bytes(8, 'little'))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class InferenceCache:
+    """LRU of rendered results keyed by input fingerprint
+
+    Lookups hit memory first and fall back to the SQLite table when
+    `db_path` is set; persisted entries older than `ttl` seconds are
+    ignored and eventually pruned. Async callers use aget/aput (or
+    get_or_compute), which run the SQLite side in a worker thread.
+    Entries stored with a user_id can be dropped with evict_user when
+    that user's data is deleted.
+    """
+
+    def __init__(self, max_entries: int = 1024, db_path: str = None, ttl: float = 7 * 86400):
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+        self._owners: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if db_path:
+            self._init_table()
+
+    @classmethod
+    def from_env(cls) -> 'InferenceCache':
+        return cls(
+            max_entries=int(os.getenv("INFERENCE_CACHE_SIZE", "1024")),
+            db_path=os.getenv("INFERENCE_CACHE_DB") or None,
+            ttl=float(os.getenv("INFERENCE_CACHE_TTL", str(7 * 86400)))
+        )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _init_table(self):
+        try:
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS inference_cache (
+                        key TEXT PRIMARY KEY,
+                        value TEXT NOT NULL,
+                        created_at REAL NOT NULL,
+                        user_id INTEGER
+                    )
+                """)
+                columns = [row[1] for row in conn.execute("PRAGMA table_info(inference_cache)")]
+                if 'user_id' not in columns:
+                    conn.execute("ALTER TABLE inference_cache ADD COLUMN user_id INTEGER")
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_inference_cache_user ON inference_cache (user_id)")
+        except sqlite3.Error as e:
+            logger.warning("Inference cache persistence disabled: %s", e)
+            self.db_path = None
+
+    def _load(self, key: str) -> Optional[str]:
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT value FROM inference_cache WHERE key = ? AND created_at >= ?",
+                    (key, time.time() - self.ttl)
+                ).fetchone()
+            return row[0] if row else None
+        except sqlite3.Error as e:
+            logger.error("Error reading inference cache: %s", e)
+            return None
+
+    def _store(self, key: str, value: str, user_id: int = None):
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO inference_cache (key, value, created_at, user_id) VALUES (?, ?, ?, ?)",
+                    (key, value, time.time(), user_id)
+                )
+        except sqlite3.Error as e:
+            logger.error("Error writing inference cache: %s", e)
+
+    def _remember(self, key: str, value: str, user_id: int = None):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if user_id is not None:
+                self._owners[key] = user_id
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._owners.pop(evicted, None)
+
+    def _recall(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return value
+
+    def _loaded(self, key: str, value: Optional[str]) -> Optional[str]:
+        """Count a lookup that missed memory and keep what the table returned"""
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._remember(key, value)
+        return value
+
+    def get(self, key: str) -> Optional[str]:
+        """Cached value for key, or None"""
+        value = self._recall(key)
+        if value is not None:
+            return value
+        return self._loaded(key, self._load(key) if self.db_path else None)
+
+    async def aget(self, key: str) -> Optional[str]:
+        """get() for the event loop: a memory miss reads the table in a worker thread"""
+        value = self._recall(key)
+        if value is not None:
+            return value
+        return self._loaded(key, await asyncio.to_thread(self._load, key) if self.db_path else None)
+
+    def put(self, key: str, value: str, user_id: int = None):
+        """Cache value under key in memory and, if enabled, on disk"""
+        self._remember(key, value, user_id)
+        if self.db_path:
+            self._store(key, value, user_id)
+
+    async def aput(self, key: str, value: str, user_id: int = None):
+        """put() for the event loop: the table write runs in a worker thread"""
+        self._remember(key, value, user_id)
+        if self.db_path:
+            await asyncio.to_thread(self._store, key, value, user_id)
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[str]],
+                             user_id: int = None) -> str:
+        """Return the cached value or await compute() and cache its result"""
+        value = await self.aget(key)
+        if value is None:
+            value = await compute()
+            await self.aput(key, value, user_id)
+        return value
+
+    def evict_user(self, user_id: int) -> int:
+        """Drop every entry stored for a user, in memory and on disk; returns how many"""
+        with self._lock:
+            keys = [key for key, owner in self._owners.items() if owner == user_id]
+            for key in keys:
+                self._entries.pop(key, None)
+                del self._owners[key]
+        removed = len(keys)
+        if self.db_path:
+            try:
+                with self._connect() as conn:
+                    removed += conn.execute(
+                        "DELETE FROM inference_cache WHERE user_id = ?", (user_id,)
+                    ).rowcount
+            except sqlite3.Error as e:
+                logger.error("Error evicting inference cache entries: %s", e)
+        return removed
+
+    def prune(self) -> int:
+        """Delete expired persisted entries"""
+        if not self.db_path:
+            return 0
+        try:
+            with self._connect() as conn:
+                cursor = conn.execute(
+                    "DELETE FROM inference_cache WHERE created_at < ?", (time.time() - self.ttl,)
+                )
+                return cursor.rowcount
+        except sqlite3.Error as e:
+            logger.error("Error pruning inference cache: %s", e)
+            return 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'persistent': bool(self.db_path),
+            }
+
+
+inference_cache = InferenceCache.from_env()
@@ -3,16 +3,31 @@ Keep-alive server for Replit deployment
 Ensures the bot stays active 24/7
 """
 
-from flask import Flask, render_template, jsonify
+from flask import Flask, render_template, jsonify, request
 import os
 import logging
-import sqlite3
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date
+from storage import RESOLUTIONS, StorageBackend, create_storage, database_url_from_env, pick_resolution
+from profiler import profiler
+from sketches import percentile_summary
 
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__, static_folder='static', template_folder='static')
 
+_database = None
+
+def get_database() -> StorageBackend:
+    """Dashboard storage handle; SQLite backends serve it from read-only analytics connections"""
+    global _database
+    if _database is None:
+        _database = create_storage(
+            database_url_from_env(),
+            read_mode=os.getenv('READ_REPLICA_MODE', 'wal'),
+            read_staleness=float(os.getenv('READ_STALENESS_SECONDS', '300'))
+        )
+    return _database
+
 # Health check endpoint
 @app.route('/')
 def home():
@@ -24,25 +39,17 @@ def health_check():
     """Health check endpoint for monitoring"""
     try:
         # Check database connection
-        conn = sqlite3.connect('health_tracker.db')
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM users")
-        user_count = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM health_records WHERE date_for >= date('now', '-7 days')")
-        recent_records = cursor.fetchone()[0]
-        
-        conn.close()
+        summary = get_database().get_dashboard_summary()
         
         return jsonify({
             'status': 'healthy',
             'timestamp': datetime.now().isoformat(),
-            'users': user_count,
-            'recent_records': recent_records,
+            'users': summary['users'],
+            'recent_records': summary['recent_records'],
             'uptime': True
         })
     except Exception as e:
-        logger.error(f"Health check failed: {e}")
+        logger.error("Health check failed: %s", e)
         return jsonify({
             'status': 'unhealthy',
             'timestamp': datetime.now().isoformat(),
@@ -53,67 +60,151 @@ def health_check():
 def bot_stats():
     """Bot statistics endpoint"""
     try:
-        conn = sqlite3.connect('health_tracker.db')
-        cursor = conn.cursor()
-        
-        # Get comprehensive stats
-        cursor.execute("SELECT COUNT(*) FROM users")
-        total_users = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM health_records")
-        total_records = cursor.fetchone()[0]
-        
-        cursor.execute("""
-            SELECT record_type, COUNT(*) as count 
-            FROM health_records 
-            GROUP BY record_type
-        """)
-        record_types = dict(cursor.fetchall())
-        
-        cursor.execute("""
-            SELECT COUNT(DISTINCT user_id) 
-            FROM health_records 
-            WHERE date_for >= date('now', '-7 days')
-        """)
-        active_users = cursor.fetchone()[0]
-        
-        conn.close()
-        
-        return jsonify({
-            'total_users': total_users,
-            'total_records': total_records,
-            'active_users_week': active_users,
-            'record_types': record_types,
-            'timestamp': datetime.now().isoformat()
-        })
+        stats = get_database().get_global_stats()
+        stats['timestamp'] = datetime.now().isoformat()
+        return jsonify(stats)
     except Exception as e:
-        logger.error(f"Stats endpoint failed: {e}")
+        logger.error("Stats endpoint failed: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/recent-activity')
 def recent_activity():
     """Get recent activity for dashboard"""
     try:
-        conn = sqlite3.connect('health_tracker.db')
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT DATE(recorded_at) as date, COUNT(*) as count
-            FROM health_records 
-            WHERE recorded_at >= datetime('now', '-30 days')
-            GROUP BY DATE(recorded_at)
-            ORDER BY date DESC
-            LIMIT 30
-        """)
-        
-        activity_data = [{'date': row[0], 'count': row[1]} for row in cursor.fetchall()]
-        conn.close()
-        
-        return jsonify(activity_data)
+        return jsonify(get_database().get_recent_activity(days=30))
     except Exception as e:
-        logger.error(f"Recent activity endpoint failed: {e}")
+        logger.error("Recent activity endpoint failed: %s", e)
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/timeseries')
+def time_series():
+    """A metric (or all records) over a date range, downsampled on the server
+
+    Query: metric=steps (omit for records of every type)  days=365 or from/to=YYYY-MM-DD
+           resolution=hour|day|week|month|auto  points=400 (upper bound for auto)
+    Returns one array per field so a year of data stays a small response.
+    """
+    try:
+        metric = request.args.get('metric') or None
+        end = date.fromisoformat(request.args['to']) if 'to' in request.args else date.today()
+        if 'from' in request.args:
+            start = date.fromisoformat(request.args['from'])
+        else:
+            start = end - timedelta(days=max(1, min(int(request.args.get('days', 30)), 3660)) - 1)
+        if start > end:
+            return jsonify({'error': 'from must not be after to'}), 400
+        points = max(10, min(int(request.args.get('points', 400)), 2000))
+        resolution = request.args.get('resolution', 'auto')
+        if resolution == 'auto':
+            resolution = pick_resolution(start, end, points)
+        elif resolution not in RESOLUTIONS:
+            return jsonify({'error': f'resolution must be one of {", ".join(RESOLUTIONS)} or auto'}), 400
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        series = get_database().get_time_series(metric, start, end, resolution)
+        result = {
+            'metric': metric,
+            'resolution': resolution,
+            'from': start.isoformat(),
+            'to': end.isoformat(),
+            'buckets': [point['bucket'] for point in series],
+            'records': [point['records'] for point in series],
+        }
+        if metric:
+            result['mean'] = [
+                round(point['total'] / point['samples'], 2) if point['samples'] else None for point in series
+            ]
+            result['min'] = [point['min'] for point in series]
+            result['max'] = [point['max'] for point in series]
+        return jsonify(result)
+    except Exception as e:
+        logger.error("Time series endpoint failed: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/retention')
+def retention_status():
+    """Progress of running and recent retention prunes and account deletions"""
+    from retention import retention
+    return jsonify(retention.status())
+
+@app.route('/api/percentiles')
+def metric_percentiles():
+    """Population percentiles per metric from the per-day quantile sketches
+
+    Query: metrics=steps,sleep,mood  days=1 (1 = today)  q=50,90
+    """
+    try:
+        metrics = request.args.get('metrics', 'steps,sleep,mood').split(',')
+        days = max(1, min(int(request.args.get('days', 1)), 366))
+        quantiles = [float(q) / 100 for q in request.args.get('q', '50,90').split(',')]
+        if any(not 0 <= q <= 1 for q in quantiles):
+            return jsonify({'error': 'q must be between 0 and 100'}), 400
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    end = date.today()
+    start = end - timedelta(days=days - 1)
+    try:
+        result = {}
+        for metric in metrics:
+            sketch = get_database().get_quantile_sketch(metric.strip(), start, end)
+            result[metric.strip()] = {'count': sketch.count, **percentile_summary(sketch, quantiles)}
+        return jsonify({'from': start.isoformat(), 'to': end.isoformat(), 'metrics': result})
+    except Exception as e:
+        logger.error("Percentiles endpoint failed: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/active-users')
+def active_users():
+    """Approximate DAU/WAU/MAU from the per-day HyperLogLog sketches"""
+    try:
+        day = date.fromisoformat(request.args['date']) if 'date' in request.args else date.today()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        database = get_database()
+        windows = {'dau': 1, 'wau': 7, 'mau': 30}
+        result = {
+            name: database.get_active_users_sketch(day - timedelta(days=days - 1), day).count()
+            for name, days in windows.items()
+        }
+        result['date'] = day.isoformat()
+        return jsonify(result)
+    except Exception as e:
+        logger.error("Active users endpoint failed: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/debug/profiler', methods=['GET', 'POST'])
+def profiler_control():
+    """Inspect or toggle the sampling profiler at runtime
+
+    Requires PROFILER_TOKEN to be set and sent as the X-Profiler-Token header.
+    POST body: {"action": "enable"|"disable", "handler": "...", "user_id": 123}
+    """
+    token = os.getenv('PROFILER_TOKEN')
+    if not token or request.headers.get('X-Profiler-Token') != token:
+        return jsonify({'error': 'forbidden'}), 403
+    
+    if request.method == 'POST':
+        payload = request.get_json(silent=True) or {}
+        action = payload.get('action', 'enable')
+        handler = payload.get('handler')
+        user_id = payload.get('user_id')
+        try:
+            if action == 'enable':
+                profiler.enable(target=handler, user_id=user_id)
+            elif action == 'disable':
+                profiler.disable(target=handler, user_id=user_id)
+            else:
+                return jsonify({'error': f'unknown action {action}'}), 400
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+    
+    return jsonify(profiler.status())
+
 def keep_alive():
     """Start the keep-alive server"""
     port = int(os.getenv('KEEP_ALIVE_PORT', 5000))
@@ -0,0 +1,72 @@
+"""
+Parser for multi-metric log messages
+Turns text like "w 72.5 s 8000 water 2000 sleep 7.5 mood 8" into validated records
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Tuple
+
+from metrics import ALIASES, REGISTRY, validate_many
+
+# "name value" pairs, also accepting "name=value" and "name: value"
+_PAIR = re.compile(r"([a-z]+)\s*[=:]?\s*(-?\d+(?:\.\d+)?)")
+
+
+@dataclass
+class ParsedLog:
+    """Validated values by metric, plus one (message key, fields) pair per problem found
+
+    Error keys name templates in the message catalog (log.unknown,
+    log.range, ...), so the reply can be rendered in the user's language.
+    """
+    values: Dict[str, float] = field(default_factory=dict)
+    errors: List[Tuple[str, Dict[str, Any]]] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return bool(self.values) and not self.errors
+
+    def records(self) -> List[Tuple[str, float, str]]:
+        """(record_type, value, unit) tuples ready for storage"""
+        return [(metric, value, REGISTRY[metric].unit) for metric, value in self.values.items()]
+
+
+def looks_like_log(text: str) -> bool:
+    """Cheap check that text consists only of metric/value pairs"""
+    text = text.strip().lower()
+    pairs = _PAIR.findall(text)
+    return bool(pairs) and all(name in ALIASES for name, _ in pairs) and not _PAIR.sub("", text).strip(" ,;")
+
+
+def parse_log(text: str) -> ParsedLog:
+    """Parse and validate every metric in the message; nothing is stored on any error"""
+    result = ParsedLog()
+    text = text.strip().lower()
+
+    leftover = _PAIR.sub("", text).strip(" ,;")
+    if leftover:
+        result.errors.append(('log.unreadable', {'text': leftover}))
+
+    found: Dict[str, float] = {}
+    for name, raw in _PAIR.findall(text):
+        metric = ALIASES.get(name)
+        if metric is None:
+            result.errors.append(('log.unknown', {'name': name}))
+        elif metric in found:
+            result.errors.append(('log.duplicate', {'metric': metric}))
+        else:
+            found[metric] = float(raw)
+
+    for (metric, value), reason in zip(found.items(), validate_many(list(found), list(found.values()))):
+        if reason:
+            limits = REGISTRY[metric]
+            result.errors.append(
+                (f"log.{reason}", {'metric': metric, 'low': f"{limits.low:g}", 'high': f"{limits.high:g}"})
+            )
+        else:
+            result.values[metric] = int(value) if REGISTRY[metric].integer else value
+
+    if not result.values and not result.errors:
+        result.errors.append(('log.empty', {}))
+    return result
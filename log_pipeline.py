@@ -0,0 +1,196 @@
+"""
+Non-blocking structured logging pipeline for Health Tracker Bot
+Records are queued on the calling thread and formatted/written by a background listener
+"""
+
+import os
+import copy
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+# Attributes present on every LogRecord; anything else was passed via `extra=`
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'module': record.module,
+            'line': record.lineno,
+            'thread': record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                payload[key] = value
+        if record.exc_info:
+            payload['exc'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            payload['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class SizedTimedRotatingFileHandler(logging.handlers.TimedRotatingFileHandler):
+    """Rotate the log file on a time schedule or when it grows past max_bytes"""
+
+    def __init__(self, filename: str, max_bytes: int = 0, **kwargs):
+        super().__init__(filename, **kwargs)
+        self.max_bytes = max_bytes
+
+    def shouldRollover(self, record: logging.LogRecord) -> int:
+        if super().shouldRollover(record):
+            return 1
+        if self.max_bytes > 0 and self.stream is not None:
+            self.stream.seek(0, 2)
+            if self.stream.tell() >= self.max_bytes:
+                return 1
+        return 0
+
+
+class DuplicateSuppressionFilter(logging.Filter):
+    """Rate-limit repeated records from the same call site
+
+    Keyed on the unformatted message template, so the check never formats
+    the record. At most `burst` records per key pass within each `window`
+    seconds; the number suppressed is reported when the key passes again.
+    """
+
+    def __init__(self, burst: int = 5, window: float = 60.0):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self._lock = threading.Lock()
+        self._seen: Dict[Tuple, list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.burst <= 0:
+            return True
+
+        key = (record.name, record.levelno, record.pathname, record.lineno, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._seen.get(key)
+            if entry is None or now - entry[0] >= self.window:
+                suppressed = entry[2] if entry else 0
+                self._seen[key] = [now, 1, 0]
+                if len(self._seen) > 10000:
+                    self._prune(now)
+                if suppressed:
+                    record.suppressed_duplicates = suppressed
+                return True
+
+            if entry[1] < self.burst:
+                entry[1] += 1
+                return True
+
+            entry[2] += 1
+            return False
+
+    def _prune(self, now: float):
+        """Drop expired keys so the table stays bounded"""
+        for key in [k for k, v in self._seen.items() if now - v[0] >= self.window]:
+            del self._seen[key]
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks and defers formatting to the listener"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The default implementation formats the message here, on the caller's
+        # thread; a shallow copy is enough because the queue never leaves the process.
+        return copy.copy(record)
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[NonBlockingQueueHandler] = None
+
+
+def setup_logging(level: str = "INFO", log_file: str = "bot.log", json_logs: bool = True,
+                  max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5,
+                  rotate_when: str = "midnight", queue_size: int = 10000,
+                  dedup_burst: int = 5, dedup_window: float = 60.0) -> logging.handlers.QueueListener:
+    """Install the queue-based logging pipeline on the root logger"""
+    global _listener, _queue_handler
+
+    if _listener is not None:
+        return _listener
+
+    text_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    file_handler = SizedTimedRotatingFileHandler(
+        log_file, max_bytes=max_bytes, when=rotate_when,
+        backupCount=backup_count, encoding='utf-8', delay=True
+    )
+    file_handler.setFormatter(JsonFormatter() if json_logs else text_format)
+
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(text_format)
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    _queue_handler = NonBlockingQueueHandler(log_queue)
+    _queue_handler.addFilter(DuplicateSuppressionFilter(burst=dedup_burst, window=dedup_window))
+
+    root = logging.getLogger()
+    root.setLevel(getattr(logging, level.upper(), logging.INFO))
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+
+    _listener = logging.handlers.QueueListener(
+        log_queue, file_handler, console_handler, respect_handler_level=True
+    )
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return _listener
+
+
+def setup_logging_from_env() -> logging.handlers.QueueListener:
+    """Install the logging pipeline using LOG_* environment variables"""
+    return setup_logging(
+        level=os.getenv("LOG_LEVEL", "INFO"),
+        log_file=os.getenv("LOG_FILE", "bot.log"),
+        json_logs=os.getenv("LOG_FORMAT", "json").lower() == "json",
+        max_bytes=int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+        backup_count=int(os.getenv("LOG_BACKUP_COUNT", "5")),
+        rotate_when=os.getenv("LOG_ROTATE_WHEN", "midnight"),
+        queue_size=int(os.getenv("LOG_QUEUE_SIZE", "10000")),
+        dedup_burst=int(os.getenv("LOG_DEDUP_BURST", "5")),
+        dedup_window=float(os.getenv("LOG_DEDUP_WINDOW", "60")),
+    )
+
+
+def dropped_records() -> int:
+    """Number of records dropped because the queue was full"""
+    return _queue_handler.dropped if _queue_handler else 0
+
+
+def shutdown_logging():
+    """Flush queued records and stop the background writer"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
@@ -3,37 +3,71 @@ Health Tracker Telegram Bot - Main Entry Point
 Designed for deployment on Replit with keep-alive functionality
 """
 
-import asyncio
+import sys
+import argparse
 import logging
 import os
 from threading import Thread
-from keep_alive import keep_alive
-from bot import HealthTrackerBot
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bot.log'),
-        logging.StreamHandler()
-    ]
-)
+from startup import startup
+
+# Must be installed before anything else is imported to see the full tree
+if "--startup-report" in sys.argv:
+    startup.enable_import_report()
+
+from log_pipeline import setup_logging_from_env
 
 logger = logging.getLogger(__name__)
 
+def run_keep_alive():
+    """Import and serve the Flask dashboard off the main thread"""
+    from keep_alive import keep_alive
+    keep_alive()
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Health Tracker Telegram Bot")
+    parser.add_argument(
+        "--startup-report", action="store_true",
+        help="print per-phase and per-module import timings once the bot is initialized"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=int(os.getenv("BOT_WORKERS", "1")),
+        help="number of worker processes; above 1, this process only routes updates"
+    )
+    return parser.parse_args(argv)
+
 def main():
     """Main function to start the bot with keep-alive functionality"""
+    args = parse_args()
+    
+    # Records are queued on the caller's thread and written by a background
+    # listener. Configured here rather than at import time because worker
+    # processes re-import this module.
+    setup_logging_from_env()
     try:
-        # Start the keep-alive server in a separate thread
+        # Start the keep-alive server in a separate thread; Flask is imported there
+        # so it does not delay the bot
         logger.info("Starting keep-alive server...")
-        keep_alive_thread = Thread(target=keep_alive)
+        keep_alive_thread = Thread(target=run_keep_alive)
         keep_alive_thread.daemon = True
         keep_alive_thread.start()
         
+        if args.workers > 1:
+            from config import Config
+            from cluster import run_cluster
+            logger.info("Starting %s bot workers...", args.workers)
+            run_cluster(Config().BOT_TOKEN, args.workers)
+            return
+        
         # Initialize and start the bot
         logger.info("Initializing Health Tracker Bot...")
+        from bot import HealthTrackerBot
+        startup.mark("bot modules imported")
         bot = HealthTrackerBot()
+        startup.mark("bot initialized")
+        startup.check_budget()
+        if args.startup_report:
+            print(startup.report(), file=sys.stderr)
         
         # Run the bot
         logger.info("Starting bot polling...")
@@ -42,7 +76,7 @@ def main():
     except KeyboardInterrupt:
         logger.info("Bot stopped by user")
     except Exception as e:
-        logger.error(f"Critical error: {e}")
+        logger.error("Critical error: %s", e)
         raise
 
 if __name__ == "__main__":
@@ -0,0 +1,137 @@
+"""
+Database maintenance for Health Tracker Bot
+Off-peak statistics refresh, bounded incremental vacuum and size-triggered WAL checkpoints for SQLite files
+"""
+
+import os
+import time
+import sqlite3
+import logging
+from dataclasses import dataclass, asdict
+from typing import Any, Dict
+
+logger = logging.getLogger(__name__)
+
+# Pages released per incremental_vacuum step, and the time budget for all steps
+VACUUM_STEP_PAGES = int(os.getenv("VACUUM_STEP_PAGES", "2000"))
+VACUUM_MAX_SECONDS = float(os.getenv("VACUUM_MAX_SECONDS", "30"))
+# A WAL larger than this is checkpointed with TRUNCATE so the file shrinks back
+WAL_TRUNCATE_MB = float(os.getenv("WAL_TRUNCATE_MB", "64"))
+# Rows sampled per index by ANALYZE; keeps the statistics refresh cheap on big tables
+ANALYSIS_LIMIT = int(os.getenv("ANALYSIS_LIMIT", "1000"))
+# Opt-in one-off conversion of an older file to incremental auto_vacuum. It runs a full VACUUM,
+# which rewrites the whole file under the write lock and needs about twice its size in free disk
+VACUUM_CONVERT = os.getenv("VACUUM_CONVERT", "0") in ("1", "true", "yes")
+
+_AUTO_VACUUM_MODES = {0: 'none', 1: 'full', 2: 'incremental'}
+_AUTO_VACUUM_INCREMENTAL = 2
+
+
+@dataclass
+class MaintenanceReport:
+    """What one maintenance run did and how long it took"""
+    path: str
+    seconds: float = 0.0
+    statistics: str = ""            # 'analyze' on the first run, 'optimize' afterwards
+    auto_vacuum: str = ""           # the file's mode; free pages are only reclaimed in 'incremental'
+    converted: bool = False         # auto_vacuum was switched to incremental (one full VACUUM, opt-in)
+    pages_freed: int = 0
+    free_pages_left: int = 0
+    checkpoint: str = ""            # 'passive' or 'truncate'
+    wal_bytes_before: int = 0
+    wal_bytes_after: int = 0
+    file_bytes_before: int = 0
+    file_bytes_after: int = 0
+
+    @property
+    def bytes_reclaimed(self) -> int:
+        return (self.file_bytes_before + self.wal_bytes_before) - (self.file_bytes_after + self.wal_bytes_after)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**asdict(self), 'bytes_reclaimed': self.bytes_reclaimed}
+
+
+def _size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _pragma(conn: sqlite3.Connection, name: str) -> int:
+    return conn.execute(f"PRAGMA {name}").fetchone()[0]
+
+
+def maintain_sqlite(db_path: str, vacuum_step_pages: int = VACUUM_STEP_PAGES,
+                    vacuum_max_seconds: float = VACUUM_MAX_SECONDS,
+                    wal_truncate_mb: float = WAL_TRUNCATE_MB,
+                    convert: bool = VACUUM_CONVERT) -> MaintenanceReport:
+    """Refresh planner statistics, reclaim free pages and checkpoint the WAL
+
+    Every step runs in autocommit mode and the vacuum works in
+    vacuum_step_pages chunks until the free list is empty or the time
+    budget is spent, so writers only ever wait for one short step. A file
+    created before incremental auto_vacuum was enabled skips the vacuum
+    and reports auto_vacuum='none'; it is only converted (with one full
+    VACUUM, blocking writers) when `convert` is set.
+    """
+    report = MaintenanceReport(path=db_path)
+    wal_path = f"{db_path}-wal"
+    report.file_bytes_before = _size(db_path)
+    report.wal_bytes_before = _size(wal_path)
+    started = time.perf_counter()
+
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    try:
+        # Statistics: a full (sampled) ANALYZE the first time, then only where they have drifted
+        conn.execute(f"PRAGMA analysis_limit = {int(ANALYSIS_LIMIT)}")
+        has_stats = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'"
+        ).fetchone()
+        if has_stats:
+            conn.execute("PRAGMA optimize")
+            report.statistics = 'optimize'
+        else:
+            conn.execute("ANALYZE")
+            report.statistics = 'analyze'
+
+        # Free pages: incremental vacuum needs auto_vacuum=INCREMENTAL, which an old file only gets via VACUUM
+        mode = _pragma(conn, "auto_vacuum")
+        if mode != _AUTO_VACUUM_INCREMENTAL and convert:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+            report.converted = True
+            mode = _pragma(conn, "auto_vacuum")
+        report.auto_vacuum = _AUTO_VACUUM_MODES.get(mode, str(mode))
+
+        free_before = _pragma(conn, "freelist_count")
+        deadline = time.monotonic() + vacuum_max_seconds
+        free = free_before
+        while mode == _AUTO_VACUUM_INCREMENTAL and free > 0 and time.monotonic() < deadline:
+            conn.execute(f"PRAGMA incremental_vacuum({int(vacuum_step_pages)})").fetchall()
+            remaining = _pragma(conn, "freelist_count")
+            if remaining >= free:
+                break
+            free = remaining
+        report.pages_freed = free_before - free
+        report.free_pages_left = free
+
+        # WAL: copy it back into the database; truncate the file when it has grown too big
+        if report.wal_bytes_before > wal_truncate_mb * 1024 * 1024:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+            report.checkpoint = 'truncate'
+        else:
+            conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+            report.checkpoint = 'passive'
+    finally:
+        conn.close()
+
+    report.seconds = round(time.perf_counter() - started, 3)
+    report.file_bytes_after = _size(db_path)
+    report.wal_bytes_after = _size(wal_path)
+    logger.info(
+        "Maintained %s in %.2f s: %s, auto_vacuum=%s, %s pages freed (%s left), %s checkpoint, "
+        "%s bytes reclaimed", db_path, report.seconds, report.statistics, report.auto_vacuum,
+        report.pages_freed, report.free_pages_left, report.checkpoint, report.bytes_reclaimed
+    )
+    return report
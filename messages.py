@@ -0,0 +1,255 @@
+"""
+Reply templates and keyboards for Health Tracker Bot
+Each locale is loaded and compiled once; keyboards are serialized to Bot API JSON up front and reused
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+from pathlib import Path
+from string import Formatter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from metrics import REGISTRY, Metric, keyboard_rows
+
+logger = logging.getLogger(__name__)
+
+LOCALES_DIR = Path(__file__).with_name("locales")
+DEFAULT_LOCALE = os.getenv("BOT_LOCALE", "en")
+
+# Translations may use either spelling of the metric label
+_INTERCHANGEABLE = {'lower': 'label'}
+
+
+class Template:
+    """A message template parsed and checked once, at load time
+
+    Templates without fields are returned as-is, so static replies cost
+    no formatting or allocation at all.
+    """
+
+    __slots__ = ('key', 'text', 'fields', '_format')
+
+    def __init__(self, key: str, text: str):
+        self.key = key
+        self.text = text
+        self.fields = frozenset(
+            field.split('.')[0].split('[')[0]
+            for _, field, _, _ in Formatter().parse(text) if field
+        )
+        self._format = text.format if self.fields else None
+
+    def render(self, **values) -> str:
+        if self._format is None:
+            return self.text
+        return self._format(**values)
+
+
+class Keyboard(str):
+    """Reply keyboard pre-serialized to the Bot API JSON
+
+    python-telegram-bot passes string parameters through untouched, so a
+    Keyboard can be given as reply_markup directly and is never rebuilt
+    or re-serialized per reply.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def build(cls, rows: Iterable[Iterable[str]], one_time: bool = False) -> 'Keyboard':
+        markup = {'keyboard': [[{'text': text} for text in row] for row in rows], 'resize_keyboard': True}
+        if one_time:
+            markup['one_time_keyboard'] = True
+        return cls(json.dumps(markup, ensure_ascii=False, separators=(',', ':')))
+
+
+class Catalog:
+    """Compiled templates, metric wording and keyboards for one locale"""
+
+    def __init__(self, locale: str, texts: Dict[str, str]):
+        self.locale = locale
+        self.templates = {key: Template(key, text) for key, text in texts.items()}
+        self.renders = 0
+        self.render_seconds = 0.0
+
+        self.labels = {name: self.text(f"metric.{name}") for name in REGISTRY}
+        self.units = {name: self.text(f"unit.{name}") for name in REGISTRY}
+        self.buttons = {name: f"{metric.icon} {self.labels[name]}" for name, metric in REGISTRY.items()}
+        self.metric_commands = "\n".join(
+            self.render('metric_command_line', **self.metric_values(metric)) for metric in REGISTRY.values()
+        )
+        self.metric_help = "\n\n".join(
+            self.render('metric_help_line', **self.metric_values(metric)) for metric in REGISTRY.values()
+        )
+        self.keyboards = self._build_keyboards()
+
+    def metric_values(self, metric: Metric) -> dict:
+        """Fields shared by every metric template"""
+        label = self.labels[metric.name]
+        return {
+            'name': metric.name, 'icon': metric.icon, 'label': label, 'lower': label.lower(),
+            'range': metric.range_text(self.units[metric.name]), 'example': metric.example,
+        }
+
+    def _build_keyboards(self) -> Dict[str, Keyboard]:
+        metric_rows = [[self.buttons[name] for name in row] for row in keyboard_rows()]
+        keyboards = {
+            'main': Keyboard.build([
+                [self.text('button.stats'), self.text('button.profile')],
+                *metric_rows,
+                [self.text('button.help')],
+            ]),
+            'profile': Keyboard.build([
+                [self.text('button.set_height'), self.text('button.set_age')],
+                [self.text('button.toggle_reminders'), self.text('button.set_reminder_time')],
+            ], one_time=True),
+            'reminder': Keyboard.build([
+                ["08:00", "12:00"],
+                ["18:00", "20:00"],
+                [self.text('button.disable_reminders')],
+            ], one_time=True),
+        }
+        for name, metric in REGISTRY.items():
+            if metric.choices:
+                keyboards[f"choices.{name}"] = Keyboard.build(metric.choices, one_time=True)
+        return keyboards
+
+    def text(self, key: str) -> str:
+        """A template's raw text (for templates without fields)"""
+        return self.templates[key].text
+
+    def render(self, key: str, **values) -> str:
+        started = time.perf_counter()
+        try:
+            return self.templates[key].render(**values)
+        finally:
+            self.renders += 1
+            self.render_seconds += time.perf_counter() - started
+
+    def keyboard(self, name: str) -> Optional[Keyboard]:
+        return self.keyboards.get(name)
+
+    def label(self, metric: Metric) -> str:
+        return self.labels[metric.name]
+
+    def format_value(self, metric: Metric, value: float) -> str:
+        return metric.format(value, self.units[metric.name])
+
+
+def _template_fields(template: Template) -> frozenset:
+    return frozenset(_INTERCHANGEABLE.get(field, field) for field in template.fields)
+
+
+def load_catalogs(directory: Path = LOCALES_DIR, reference: str = "en") -> Dict[str, Catalog]:
+    """Load and compile every locale file, checking each against the reference locale
+
+    A translation must define exactly the reference keys and use only the
+    fields its reference template receives, so a bad translation fails at
+    startup instead of on the reply that needs it.
+    """
+    texts: Dict[str, Dict[str, str]] = {}
+    for path in sorted(directory.glob("*.json")):
+        with open(path, encoding="utf-8") as f:
+            texts[path.stem] = json.load(f)
+    if reference not in texts:
+        raise ValueError(f"Reference locale {reference!r} not found in {directory}")
+
+    catalogs = {}
+    expected = {key: Template(key, text) for key, text in texts[reference].items()}
+    for locale, entries in texts.items():
+        missing = expected.keys() - entries.keys()
+        extra = entries.keys() - expected.keys()
+        if missing or extra:
+            raise ValueError(f"Locale {locale!r}: missing {sorted(missing)}, unexpected {sorted(extra)}")
+        for key, text in entries.items():
+            unknown = _template_fields(Template(key, text)) - _template_fields(expected[key])
+            if unknown:
+                raise ValueError(f"Locale {locale!r}: template {key!r} uses unknown fields {sorted(unknown)}")
+        catalogs[locale] = Catalog(locale, entries)
+    return catalogs
+
+
+CATALOGS: Dict[str, Catalog] = load_catalogs()
+
+if DEFAULT_LOCALE not in CATALOGS:
+    logger.warning("BOT_LOCALE %r is not available, using English", DEFAULT_LOCALE)
+    DEFAULT_LOCALE = "en"
+
+
+def catalog(language_code: Optional[str] = None) -> Catalog:
+    """Catalog for a Telegram language code such as 'uz' or 'en-US', else the default locale"""
+    if language_code:
+        found = CATALOGS.get(language_code.split('-')[0].lower())
+        if found is not None:
+            return found
+    return CATALOGS[DEFAULT_LOCALE]
+
+
+def button_actions() -> Dict[str, str]:
+    """Keyboard button text in any locale -> action ('stats', 'profile', 'help' or a metric name)"""
+    actions = {}
+    for loaded in CATALOGS.values():
+        for action in ('stats', 'profile', 'help'):
+            text = loaded.text(f"button.{action}")
+            actions[text] = action
+            actions[text.split(' ', 1)[-1]] = action
+        for name in REGISTRY:
+            actions[loaded.buttons[name]] = name
+            actions[loaded.labels[name]] = name
+    return actions
+
+
+def stats() -> dict:
+    """Render counts and time per locale"""
+    return {
+        locale: {
+            'renders': loaded.renders,
+            'render_ms': round(loaded.render_seconds * 1000, 3),
+            'keyboards': len(loaded.keyboards),
+        }
+        for locale, loaded in CATALOGS.items()
+    }
+
+
+def measure(iterations: int = 10000) -> List[Tuple[str, float, float]]:
+    """(case, microseconds per reply, bytes allocated per reply) for cached vs. rebuilt markup"""
+    import tracemalloc
+    from telegram import KeyboardButton, ReplyKeyboardMarkup
+
+    english = CATALOGS["en"]
+    rows = json.loads(english.keyboard('main'))['keyboard']
+
+    def rebuilt():
+        markup = ReplyKeyboardMarkup(
+            [[KeyboardButton(button['text']) for button in row] for row in rows], resize_keyboard=True
+        )
+        return json.dumps(markup.to_dict())
+
+    def cached():
+        return english.keyboard('main')
+
+    def template():
+        return english.render('metric.recorded', label="Weight", value="70.5 kg")
+
+    results = []
+    for name, func in (("keyboard rebuilt", rebuilt), ("keyboard cached", cached), ("template render", template)):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        elapsed = (time.perf_counter() - started) / iterations * 1e6
+
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        kept = [func() for _ in range(100)]
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        allocated = sum(stat.size_diff for stat in after.compare_to(before, 'filename')) / len(kept)
+        results.append((name, elapsed, allocated))
+    return results
+
+
+if __name__ == "__main__":
+    for case, micros, allocated in measure(int(sys.argv[1]) if len(sys.argv) > 1 else 10000):
+        print(f"{case:<18} {micros:8.2f} us/reply  {allocated:8.0f} B/reply")
@@ -0,0 +1,164 @@
+"""
+Registry of tracked health metrics
+One declaration per metric drives commands, keyboards, validation, storage units and rendering
+"""
+
+import os
+import re
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+_NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+
+# Batches at least this large are validated with numpy
+VECTORIZE_MIN = 64
+
+
+class InvalidValue(ValueError):
+    """A value a metric does not accept; reason is 'number', 'whole' or 'range'"""
+
+    def __init__(self, metric: 'Metric', reason: str):
+        super().__init__(f"{metric.name}: {reason}")
+        self.metric = metric
+        self.reason = reason
+
+
+def _plain(value: float) -> str:
+    return f"{value:g}"
+
+
+def _thousands(value: float) -> str:
+    return f"{value:,.0f}"
+
+
+def _duration(minutes: float) -> str:
+    hours, minutes = divmod(int(minutes), 60)
+    return f"{hours}h {minutes}m" if hours else f"{minutes}m"
+
+
+def _mood(value: float) -> str:
+    emoji = "😢" if value <= 3 else "😐" if value <= 6 else "😊"
+    return f"{value:g}/10 {emoji}"
+
+
+@dataclass(frozen=True)
+class Metric:
+    """Everything the bot needs to know about one tracked metric"""
+    name: str
+    label: str
+    icon: str
+    unit: str                     # stored with each record
+    low: float
+    high: float
+    integer: bool
+    example: str
+    aliases: Tuple[str, ...] = ()
+    aggregation: str = 'mean'     # how /stats summarizes entries over the period
+    formatter: Callable[[float], str] = _plain
+    with_unit: bool = True        # formatter output already carries the unit when False
+    choices: Tuple[Tuple[str, ...], ...] = ()   # preset answer buttons, one tuple per row
+    min_spread: float = 0.0       # smallest deviation the anomaly check assumes, in the metric's unit
+    anomaly_threshold: Optional[float] = None   # robust z-score that flags a value (None: detector default)
+
+    @property
+    def state(self) -> str:
+        return f"waiting_{self.name}"
+
+    def range_text(self, unit: str) -> str:
+        unit = "" if unit.startswith("/") else f" {unit}"
+        return f"{self.low:,g}-{self.high:,g}{unit}"
+
+    def reject(self, value: float) -> Optional[str]:
+        """Why value is not accepted ('whole' or 'range'), or None if it is"""
+        if self.integer and not float(value).is_integer():
+            return 'whole'
+        if not self.low <= value <= self.high:
+            return 'range'
+        return None
+
+    def parse(self, text: str) -> float:
+        """Value typed by the user (leading number, so preset buttons like "8😊" work)
+
+        Raises InvalidValue when there is no number or it is not accepted.
+        """
+        match = _NUMBER.match(text.strip())
+        if not match:
+            raise InvalidValue(self, 'number')
+        value = float(match.group())
+        reason = self.reject(value)
+        if reason:
+            raise InvalidValue(self, reason)
+        return int(value) if self.integer else value
+
+    def format(self, value: float, unit: str) -> str:
+        text = self.formatter(value)
+        return f"{text} {unit}" if self.with_unit else text
+
+
+def _limit(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+
+def _build_registry() -> Dict[str, Metric]:
+    metrics = [
+        Metric('weight', 'Weight', '⚖️', 'kg', 20, _limit("MAX_WEIGHT_KG", 500), False, "70.5",
+               aliases=('w', 'kg'), min_spread=1.0),
+        Metric('steps', 'Steps', '👣', 'steps', 0, _limit("MAX_STEPS", 100000), True, "8500",
+               aliases=('s', 'step'), formatter=_thousands, min_spread=2000),
+        Metric('water', 'Water', '💧', 'ml', 0, _limit("MAX_WATER_ML", 10000), False, "2000",
+               aliases=('wa', 'ml'), min_spread=500),
+        Metric('exercise', 'Exercise', '🏃', 'minutes', 0, _limit("MAX_EXERCISE_MINUTES", 1440), True, "45",
+               aliases=('e', 'ex'), formatter=_duration, with_unit=False, min_spread=30),
+        Metric('sleep', 'Sleep', '😴', 'hours', 0, _limit("MAX_SLEEP_HOURS", 24), False, "8",
+               aliases=('sl',), min_spread=1.0),
+        Metric('mood', 'Mood', '😊', 'scale', 1, 10, True, "8",
+               aliases=('m',), formatter=_mood, with_unit=False, min_spread=1.0,
+               # Every point of a 1-10 scale is a plausible answer; only a full swing is suspect
+               anomaly_threshold=8.0,
+               choices=(("1😢", "2", "3"), ("4", "5😐", "6"), ("7", "8😊", "9"), ("10🎉",))),
+    ]
+    return {metric.name: metric for metric in metrics}
+
+
+REGISTRY: Dict[str, Metric] = _build_registry()
+
+# Lookup tables derived once so the per-message path is a dict hit
+BY_STATE: Dict[str, Metric] = {metric.state: metric for metric in REGISTRY.values()}
+ALIASES: Dict[str, str] = {
+    alias: metric.name for metric in REGISTRY.values() for alias in (metric.name, *metric.aliases)
+}
+
+
+def keyboard_rows(per_row: int = 2) -> List[List[str]]:
+    """Metric names in the order and rows their keyboard buttons are laid out"""
+    names = list(REGISTRY)
+    return [names[i:i + per_row] for i in range(0, len(names), per_row)]
+
+
+def validate_many(names: Sequence[str], values: Sequence[float]) -> List[Optional[str]]:
+    """Check many (metric, value) pairs at once; a Metric.reject reason or None per pair
+
+    Large batches gather the bounds into arrays so the range and
+    whole-number checks run in one vectorized pass; a handful of values
+    (a typical /log message) is cheaper to check in a plain loop.
+    """
+    metrics = [REGISTRY[name] for name in names]
+    np = None
+    if len(metrics) >= VECTORIZE_MIN:
+        try:
+            import numpy as np
+        except ImportError:
+            pass
+    if np is None:
+        return [metric.reject(value) for metric, value in zip(metrics, values)]
+
+    array = np.asarray(values, dtype=float)
+    lows = np.fromiter((metric.low for metric in metrics), dtype=float, count=len(metrics))
+    highs = np.fromiter((metric.high for metric in metrics), dtype=float, count=len(metrics))
+    integer = np.fromiter((metric.integer for metric in metrics), dtype=bool, count=len(metrics))
+    bad = (array < lows) | (array > highs) | (integer & (array != np.floor(array)))
+    return [
+        metric.reject(value) if flagged else None
+        for metric, value, flagged in zip(metrics, values, bad.tolist())
+    ]
+
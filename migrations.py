@@ -0,0 +1,628 @@
+"""
+Schema versioning and online migrations for Health Tracker Bot
+Tracks the schema in PRAGMA user_version and runs long rewrites in resumable batches
+"""
+
+import sys
+import time
+import sqlite3
+import logging
+import argparse
+import threading
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Migration:
+    """A single schema step
+
+    `apply` runs once, under the database write lock, and must be
+    idempotent (use IF NOT EXISTS). `bound(conn)` is evaluated in the same
+    transaction, so it sees exactly the rows written before the schema
+    change; `batch(conn, cursor, batch_size, bound)` processes the next
+    chunk of rows after `cursor` up to `bound` and returns
+    `(new_cursor, rows_processed)`, and is called until it processes no
+    rows. `finalize` runs after the last batch. The schema version is
+    bumped as soon as `apply` commits; an online migration's batches then
+    finish in the background after the bot starts, so application code
+    must maintain the new structures for its own writes and must not
+    depend on the backfill having completed.
+    """
+    version: int
+    description: str
+    apply: Optional[Callable[[sqlite3.Connection], None]] = None
+    batch: Optional[Callable[[sqlite3.Connection, int, int, Optional[int]], Tuple[int, int]]] = None
+    total: Optional[Callable[[sqlite3.Connection], int]] = None
+    finalize: Optional[Callable[[sqlite3.Connection], None]] = None
+    online: bool = False
+    bound: Optional[Callable[[sqlite3.Connection], int]] = None
+
+
+def _baseline_schema(conn: sqlite3.Connection):
+    """Version 1: users, health_records and user_preferences"""
+    cursor = conn.cursor()
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            timezone TEXT DEFAULT 'UTC'
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS health_records (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            record_type TEXT NOT NULL,
+            value REAL NOT NULL,
+            unit TEXT,
+            notes TEXT,
+            recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            date_for DATE,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_preferences (
+            user_id INTEGER PRIMARY KEY,
+            reminder_enabled BOOLEAN DEFAULT TRUE,
+            reminder_time TEXT DEFAULT '20:00',
+            weight_unit TEXT DEFAULT 'kg',
+            height_cm INTEGER,
+            age INTEGER,
+            gender TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    """)
+
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_health_records_user_date
+        ON health_records (user_id, date_for)
+    """)
+
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_health_records_type
+        ON health_records (record_type)
+    """)
+
+
+def _scheduler_tables(conn: sqlite3.Connection):
+    """Version 2: leases for single-leader jobs and the per-day reminder log"""
+    cursor = conn.cursor()
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS scheduler_leases (
+            name TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS reminders_sent (
+            user_id INTEGER,
+            reminder_date DATE,
+            sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, reminder_date)
+        )
+    """)
+
+
+def _anomaly_flags(conn: sqlite3.Connection):
+    """Version 3: per-record anomaly flag and the rolling per-metric baselines"""
+    cursor = conn.cursor()
+
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(health_records)")}
+    if 'is_anomaly' not in columns:
+        cursor.execute("ALTER TABLE health_records ADD COLUMN is_anomaly INTEGER NOT NULL DEFAULT 0")
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS metric_baselines (
+            user_id INTEGER,
+            record_type TEXT,
+            recent_values TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, record_type)
+        )
+    """)
+
+
+def _metric_sketches(conn: sqlite3.Connection):
+    """Version 4: per-metric, per-day quantile sketches for the dashboard (slotted since version 10)"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS metric_sketches (
+            record_type TEXT,
+            day DATE,
+            slot INTEGER NOT NULL DEFAULT 0,
+            sketch TEXT NOT NULL,
+            PRIMARY KEY (record_type, day, slot)
+        )
+    """)
+
+
+def _backfill_sketches(conn: sqlite3.Connection, cursor: int, batch_size: int,
+                       bound: int) -> Tuple[int, int]:
+    """Fold existing records into the day sketches, in id order"""
+    from sketches import QuantileSketch, sketch_slot
+
+    rows = conn.execute("""
+        SELECT id, user_id, record_type, date_for, value FROM health_records
+        WHERE id > ? AND id <= ? AND is_anomaly = 0 AND date_for IS NOT NULL
+        ORDER BY id LIMIT ?
+    """, (cursor, bound, batch_size)).fetchall()
+    if not rows:
+        return cursor, 0
+
+    grouped = {}
+    for _, user_id, record_type, day, value in rows:
+        grouped.setdefault((record_type, day, sketch_slot(user_id)), []).append(value)
+    for (record_type, day, slot), values in grouped.items():
+        row = conn.execute(
+            "SELECT sketch FROM metric_sketches WHERE record_type = ? AND day = ? AND slot = ?",
+            (record_type, day, slot)
+        ).fetchone()
+        sketch = QuantileSketch.from_json(row[0] if row else None)
+        for value in values:
+            sketch.add(value)
+        conn.execute(
+            "INSERT OR REPLACE INTO metric_sketches (record_type, day, slot, sketch) VALUES (?, ?, ?, ?)",
+            (record_type, day, slot, sketch.to_json())
+        )
+    return rows[-1][0], len(rows)
+
+
+def _active_user_sketches(conn: sqlite3.Connection):
+    """Version 5: per-day HyperLogLog sketches of users who logged anything"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS active_user_sketches (
+            day DATE PRIMARY KEY,
+            registers BLOB NOT NULL
+        )
+    """)
+
+
+def _backfill_active_users(conn: sqlite3.Connection, cursor: int, batch_size: int,
+                           bound: int) -> Tuple[int, int]:
+    """Add the users of existing records to their day's sketch, in id order"""
+    from sketches import HyperLogLog
+
+    rows = conn.execute("""
+        SELECT id, user_id, date_for FROM health_records
+        WHERE id > ? AND id <= ? AND date_for IS NOT NULL
+        ORDER BY id LIMIT ?
+    """, (cursor, bound, batch_size)).fetchall()
+    if not rows:
+        return cursor, 0
+
+    grouped = {}
+    for _, user_id, day in rows:
+        grouped.setdefault(day, set()).add(user_id)
+    for day, users in grouped.items():
+        row = conn.execute("SELECT registers FROM active_user_sketches WHERE day = ?", (day,)).fetchone()
+        sketch = HyperLogLog.from_bytes(row[0] if row else None)
+        for user_id in users:
+            sketch.add(user_id)
+        conn.execute(
+            "INSERT OR REPLACE INTO active_user_sketches (day, registers) VALUES (?, ?)",
+            (day, sketch.to_bytes())
+        )
+    return rows[-1][0], len(rows)
+
+
+def _keyset_index(conn: sqlite3.Connection):
+    """Version 6: index matching the keyset order of paged record reads
+
+    (user_id, date_for, recorded_at) plus the implicit rowid serves both
+    the date range and the (date_for, recorded_at, id) sort, and replaces
+    the narrower (user_id, date_for) index.
+    """
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_health_records_user_keyset
+        ON health_records (user_id, date_for, recorded_at)
+    """)
+    conn.execute("DROP INDEX IF EXISTS idx_health_records_user_date")
+
+
+def rollup_records(conn: sqlite3.Connection, first_id: int, last_id: int):
+    """Add the records with ids in [first_id, last_id] to their hourly metric rollups
+
+    Used by the backfill below and by every insert, so the rollups are
+    maintained exactly as they were built. Anomalies count as records but
+    not as samples.
+    """
+    conn.execute("""
+        INSERT INTO metric_rollups (record_type, hour, records, samples, total, minimum, maximum)
+        SELECT record_type, strftime('%Y-%m-%d %H:00', recorded_at), COUNT(*),
+               SUM(is_anomaly = 0),
+               TOTAL(CASE WHEN is_anomaly = 0 THEN value END),
+               MIN(CASE WHEN is_anomaly = 0 THEN value END),
+               MAX(CASE WHEN is_anomaly = 0 THEN value END)
+        FROM health_records
+        WHERE id BETWEEN ? AND ? AND recorded_at IS NOT NULL
+        GROUP BY 1, 2
+        ON CONFLICT (record_type, hour) DO UPDATE SET
+            records = records + excluded.records,
+            samples = samples + excluded.samples,
+            total = total + excluded.total,
+            minimum = CASE WHEN minimum IS NULL OR excluded.minimum < minimum
+                           THEN excluded.minimum ELSE minimum END,
+            maximum = CASE WHEN maximum IS NULL OR excluded.maximum > maximum
+                           THEN excluded.maximum ELSE maximum END
+    """, (first_id, last_id))
+
+
+def _metric_rollups(conn: sqlite3.Connection):
+    """Version 7: hourly per-metric rollups behind the dashboard time series"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS metric_rollups (
+            record_type TEXT,
+            hour TEXT,
+            records INTEGER NOT NULL,
+            samples INTEGER NOT NULL,
+            total REAL NOT NULL,
+            minimum REAL,
+            maximum REAL,
+            PRIMARY KEY (record_type, hour)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_metric_rollups_hour ON metric_rollups (hour)")
+
+
+def _backfill_rollups(conn: sqlite3.Connection, cursor: int, batch_size: int,
+                      bound: int) -> Tuple[int, int]:
+    """Roll up existing records, one id range per batch"""
+    last_id, count = conn.execute("""
+        SELECT MAX(id), COUNT(*) FROM (
+            SELECT id FROM health_records WHERE id > ? AND id <= ? ORDER BY id LIMIT ?
+        )
+    """, (cursor, bound, batch_size)).fetchone()
+    if not count:
+        return cursor, 0
+    rollup_records(conn, cursor + 1, last_id)
+    return last_id, count
+
+
+def _daily_summaries(conn: sqlite3.Connection):
+    """Version 8: per-user daily aggregates that outlive pruned raw records"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS daily_summaries (
+            user_id INTEGER,
+            date_for DATE,
+            record_type TEXT,
+            records INTEGER NOT NULL,
+            samples INTEGER NOT NULL,
+            total REAL NOT NULL,
+            minimum REAL,
+            maximum REAL,
+            PRIMARY KEY (user_id, date_for, record_type)
+        )
+    """)
+
+
+def _digests(conn: sqlite3.Connection):
+    """Version 9: precomputed weekly/monthly digests and the progress of the job that builds them"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_digests (
+            user_id INTEGER,
+            period TEXT,
+            period_end DATE NOT NULL,
+            payload TEXT NOT NULL,
+            computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, period)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS digest_progress (
+            period TEXT PRIMARY KEY,
+            period_end DATE NOT NULL,
+            last_user_id INTEGER NOT NULL,
+            completed INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+
+
+def _slotted_metric_sketches(conn: sqlite3.Connection):
+    """Version 10: key the metric sketches by (record_type, day, slot) so writers of different users don't share a row
+
+    Existing day sketches become slot 0; readers merge every slot of a day.
+    """
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(metric_sketches)")]
+    if 'slot' in columns:
+        return
+    conn.execute("ALTER TABLE metric_sketches RENAME TO metric_sketches_unslotted")
+    _metric_sketches(conn)
+    conn.execute("""
+        INSERT INTO metric_sketches (record_type, day, slot, sketch)
+        SELECT record_type, day, 0, sketch FROM metric_sketches_unslotted
+    """)
+    conn.execute("DROP TABLE metric_sketches_unslotted")
+
+
+def _count_records(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT COUNT(*) FROM health_records").fetchone()[0]
+
+
+def _max_record_id(conn: sqlite3.Connection) -> int:
+    """Newest record id; records after it are maintained by the write path itself"""
+    return conn.execute("SELECT COALESCE(MAX(id), 0) FROM health_records").fetchone()[0]
+
+
+# Ordered list of schema steps; append new migrations with the next version number
+MIGRATIONS: List[Migration] = [
+    Migration(1, "baseline schema", apply=_baseline_schema),
+    Migration(2, "scheduler leases and reminder log", apply=_scheduler_tables),
+    Migration(3, "anomaly flags and metric baselines", apply=_anomaly_flags),
+    Migration(4, "per-day metric quantile sketches", apply=_metric_sketches,
+              batch=_backfill_sketches, total=_count_records, bound=_max_record_id, online=True),
+    Migration(5, "per-day active user sketches", apply=_active_user_sketches,
+              batch=_backfill_active_users, total=_count_records, bound=_max_record_id, online=True),
+    Migration(6, "keyset index for paged record reads", apply=_keyset_index),
+    Migration(7, "hourly metric rollups", apply=_metric_rollups,
+              batch=_backfill_rollups, total=_count_records, bound=_max_record_id, online=True),
+    Migration(8, "daily summaries for pruned records", apply=_daily_summaries),
+    Migration(9, "weekly and monthly digests", apply=_digests),
+    Migration(10, "per-slot metric sketches", apply=_slotted_metric_sketches),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1].version
+
+
+class MigrationRunner:
+    """Apply pending migrations to a SQLite file in order
+
+    Every step that changes the schema or a backfill position runs inside
+    BEGIN IMMEDIATE and re-reads the version or cursor after taking the
+    lock, so several processes (cluster workers, the dashboard) can run
+    the same runner against one file without applying a step twice or
+    counting a batch twice.
+    """
+
+    def __init__(self, db_path: str, migrations: List[Migration] = None,
+                 batch_size: int = 5000, pause: float = 0.05):
+        self.db_path = db_path
+        self.migrations = migrations if migrations is not None else MIGRATIONS
+        self.batch_size = batch_size
+        self.pause = pause
+        self._by_version = {m.version: m for m in self.migrations}
+        self._thread: Optional[threading.Thread] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        # Takes effect only while the file is still empty; older files need VACUUM_CONVERT=1 in maintenance
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migration_progress (
+                version INTEGER PRIMARY KEY,
+                cursor INTEGER DEFAULT 0,
+                processed INTEGER DEFAULT 0,
+                total INTEGER,
+                started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(schema_migration_progress)")}
+        if 'bound' not in columns:
+            try:
+                conn.execute("ALTER TABLE schema_migration_progress ADD COLUMN bound INTEGER")
+            except sqlite3.OperationalError:
+                pass  # another process added it first
+        return conn
+
+    def current_version(self) -> int:
+        """Schema version stored in the database file"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            return conn.execute("PRAGMA user_version").fetchone()[0]
+        finally:
+            conn.close()
+
+    def pending(self) -> List[Migration]:
+        """Migrations newer than the file's schema version"""
+        current = self.current_version()
+        return [m for m in self.migrations if m.version > current]
+
+    def pending_backfills(self) -> List[Migration]:
+        """Applied migrations whose batches have not finished yet (no DDL, so cheap on every start)"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_migration_progress'"
+            ).fetchone()
+            if not exists:
+                return []
+            current = conn.execute("PRAGMA user_version").fetchone()[0]
+            versions = [row[0] for row in conn.execute(
+                "SELECT version FROM schema_migration_progress WHERE version <= ? ORDER BY version", (current,)
+            )]
+        finally:
+            conn.close()
+        return [self._by_version[v] for v in versions if v in self._by_version]
+
+    def status(self) -> List[dict]:
+        """Progress of every pending migration and unfinished backfill"""
+        pending = self.pending_backfills() + self.pending()
+        if not pending:
+            return []
+
+        conn = self._connect()
+        try:
+            progress = {row[0]: row[1:] for row in conn.execute(
+                "SELECT version, processed, total, updated_at FROM schema_migration_progress"
+            )}
+        finally:
+            conn.close()
+
+        result = []
+        for migration in pending:
+            processed, total, updated_at = progress.get(migration.version, (0, None, None))
+            result.append({
+                'version': migration.version,
+                'description': migration.description,
+                'online': migration.online,
+                'applied': migration.version <= self.current_version(),
+                'processed': processed,
+                'total': total,
+                'updated_at': updated_at,
+            })
+        return result
+
+    def migrate(self, background_online: bool = False) -> int:
+        """Apply pending migrations and return the resulting schema version
+
+        Schema changes are always applied before this returns. Batched
+        backfills run here too, except that with `background_online` those
+        of online migrations continue in a daemon thread, bounded to the
+        rows that existed when their migration was applied.
+        """
+        for migration in self.pending():
+            self._apply(migration)
+            if migration.batch and not (migration.online and background_online):
+                self._run_batches(migration)
+
+        backfills = self.pending_backfills()
+        if background_online:
+            if backfills:
+                self.migrate_in_background(backfills)
+        else:
+            for migration in backfills:
+                self._run_batches(migration)
+        return self.current_version()
+
+    def migrate_in_background(self, migrations: List[Migration] = None) -> threading.Thread:
+        """Finish the given (or all unfinished) backfills in a daemon thread"""
+        if self._thread is not None and self._thread.is_alive():
+            return self._thread
+
+        def worker():
+            try:
+                for migration in (migrations if migrations is not None else self.pending_backfills()):
+                    self._run_batches(migration)
+            except Exception as e:
+                logger.error("Background migration failed: %s", e)
+
+        self._thread = threading.Thread(target=worker, name="schema-migrations", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def _apply(self, migration: Migration):
+        """Apply one schema step under the write lock; a no-op if another process got there first"""
+        started = time.perf_counter()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= migration.version:
+                conn.execute("ROLLBACK")
+                return
+            logger.info("Applying migration %s: %s", migration.version, migration.description)
+            if migration.apply:
+                migration.apply(conn)
+            if migration.batch:
+                # Rows after the bound are written with the new structures already in place
+                bound = migration.bound(conn) if migration.bound else None
+                total = migration.total(conn) if migration.total else None
+                conn.execute("""
+                    INSERT OR REPLACE INTO schema_migration_progress (version, cursor, processed, total, bound)
+                    VALUES (?, 0, 0, ?, ?)
+                """, (migration.version, total, bound))
+            elif migration.finalize:
+                migration.finalize(conn)
+            conn.execute(f"PRAGMA user_version = {migration.version}")
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        logger.info("Migration %s applied in %.1f s", migration.version, time.perf_counter() - started)
+
+    def _run_batches(self, migration: Migration):
+        """Drive a backfill in bounded transactions, each re-reading and advancing the shared cursor"""
+        started = time.perf_counter()
+        last_report = time.monotonic()
+        conn = self._connect()
+        try:
+            while True:
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute(
+                    "SELECT cursor, processed, total, bound FROM schema_migration_progress WHERE version = ?",
+                    (migration.version,)
+                ).fetchone()
+                if row is None:
+                    # Finished by another process
+                    conn.execute("ROLLBACK")
+                    return
+                cursor, processed, total, bound = row
+                if bound is None:
+                    # Progress saved before bounds existed: that runner blocked writers, so nothing was missed
+                    bound = migration.bound(conn) if migration.bound else None
+
+                cursor, count = migration.batch(conn, cursor, self.batch_size, bound)
+                if count == 0:
+                    if migration.finalize:
+                        migration.finalize(conn)
+                    conn.execute("DELETE FROM schema_migration_progress WHERE version = ?", (migration.version,))
+                    conn.execute("COMMIT")
+                    break
+                processed += count
+                conn.execute("""
+                    UPDATE schema_migration_progress
+                    SET cursor = ?, processed = ?, bound = ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE version = ?
+                """, (cursor, processed, bound, migration.version))
+                conn.execute("COMMIT")
+
+                if time.monotonic() - last_report >= 5:
+                    last_report = time.monotonic()
+                    if total:
+                        logger.info("Migration %s: %s/%s rows (%.1f%%)",
+                                    migration.version, processed, total, 100 * processed / total)
+                    else:
+                        logger.info("Migration %s: %s rows", migration.version, processed)
+
+                # Release the write lock so the bot's own writes get through
+                time.sleep(self.pause)
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        logger.info("Migration %s backfill done in %.1f s", migration.version, time.perf_counter() - started)
+
+
+def main(argv=None):
+    """Command line entry point: python migrations.py [status|migrate] --db PATH"""
+    parser = argparse.ArgumentParser(description="Health Tracker schema migrations")
+    parser.add_argument("command", choices=["status", "migrate"])
+    parser.add_argument("--db", default="health_tracker.db")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--pause", type=float, default=0.05,
+                        help="seconds to sleep between batches")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    runner = MigrationRunner(args.db, batch_size=args.batch_size, pause=args.pause)
+
+    if args.command == "status":
+        print(f"Schema version: {runner.current_version()} (latest {SCHEMA_VERSION})")
+        for item in runner.status():
+            state = "backfilling" if item['applied'] else "pending"
+            print(f"  {state} v{item['version']}: {item['description']} "
+                  f"[{item['processed']}/{item['total'] or '?'} rows]")
+    else:
+        print(f"Schema version: {runner.migrate()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
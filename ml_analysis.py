@@ -2,125 +2,195 @@
 Machine Learning analysis and recommendations for health data
 """
 
+import os
 import logging
-import numpy as np
-from typing import List, Dict, Any
+from array import array
+from typing import List, Dict, Any, Tuple
 from datetime import datetime, timedelta
+from offload import offloader
+from profiler import profiled
+from inference_cache import inference_cache, fingerprint
+from messages import Catalog, catalog
 
 logger = logging.getLogger(__name__)
 
-async def analyze_health_data(recent_data: List[Dict]) -> str:
+# Language of analysis and recommendation texts
+ANALYSIS_LOCALE = os.getenv("ANALYSIS_LOCALE", "uz")
+
+# Bump when the analysis or recommendation output changes so cached texts expire
+ANALYSIS_VERSION = 1
+
+# Daily fields the analysis reads, with the array typecode used to ship them
+# to the offload pool
+DAILY_FIELDS = (
+    ('sleep_time', 'd'),
+    ('activity_time', 'd'),
+    ('mood_level', 'l'),
+    ('aggression_level', 'l'),
+)
+
+def pack_daily_data(data: List[Dict]) -> Tuple[array, ...]:
+    """Convert a list of daily dicts into one compact array per field"""
+    return tuple(array(code, (d[field] for d in data)) for field, code in DAILY_FIELDS)
+
+def unpack_daily_data(columns: Tuple[array, ...]) -> List[Dict]:
+    """Inverse of pack_daily_data"""
+    names = [field for field, _ in DAILY_FIELDS]
+    return [dict(zip(names, row)) for row in zip(*columns)]
+
+def _cache_key(kind: str, locale: str, user_id, last_record_id, columns) -> str:
+    """Key by (user, newest record in the window) when known, else by the data itself"""
+    if user_id is not None and last_record_id is not None:
+        return fingerprint(kind, ANALYSIS_VERSION, locale, user_id, last_record_id)
+    return fingerprint(kind, ANALYSIS_VERSION, locale, *columns)
+
+@profiled("ml_analysis.analyze_health_data")
+async def analyze_health_data(recent_data: List[Dict], user_id: int = None,
+                              last_record_id: int = None, locale: str = ANALYSIS_LOCALE) -> str:
+    """
+    Analyze user's recent health data and provide insights
+    (computed in the offload process pool, memoized per input window)
+    """
+    columns = pack_daily_data(recent_data)
+    key = _cache_key("analysis", locale, user_id, last_record_id, columns)
+    return await inference_cache.get_or_compute(
+        key, lambda: offloader.run(analyze_packed, columns, locale), user_id
+    )
+
+@profiled("ml_analysis.generate_recommendations")
+async def generate_recommendations(recent_data: List[Dict], today_data: Dict, user_id: int = None,
+                                   last_record_id: int = None, locale: str = ANALYSIS_LOCALE) -> str:
+    """
+    Generate personalized recommendations based on health data
+    (computed in the offload process pool, memoized per input window)
+    """
+    columns = pack_daily_data(recent_data)
+    today_columns = pack_daily_data([today_data])
+    key = _cache_key("recommendations", locale, user_id, last_record_id, columns + today_columns)
+    return await inference_cache.get_or_compute(
+        key, lambda: offloader.run(recommend_packed, columns, today_columns, locale), user_id
+    )
+
+def analyze_packed(columns: Tuple[array, ...], locale: str = ANALYSIS_LOCALE) -> str:
+    """Offload entry point for build_health_analysis"""
+    return build_health_analysis(unpack_daily_data(columns), locale)
+
+def recommend_packed(columns: Tuple[array, ...], today_columns: Tuple[array, ...],
+                     locale: str = ANALYSIS_LOCALE) -> str:
+    """Offload entry point for build_recommendations"""
+    return build_recommendations(unpack_daily_data(columns), unpack_daily_data(today_columns)[0], locale)
+
+def build_health_analysis(recent_data: List[Dict], locale: str = ANALYSIS_LOCALE) -> str:
     """
     Analyze user's recent health data and provide insights
     """
+    messages = catalog(locale)
     if len(recent_data) < 2:
-        return "Tahlil uchun kam ma'lumot. Yana bir necha kun ma'lumot kiriting."
-    
-    # Get today's data (first item since data is ordered DESC)
-    today = recent_data[0]
+        return messages.text('analysis.too_little')
     
     analysis_parts = []
     
     # Sleep analysis
-    sleep_analysis = analyze_sleep_pattern(recent_data)
-    analysis_parts.append(f"🛏 **Uyqu:** {sleep_analysis}")
+    sleep_analysis = analyze_sleep_pattern(recent_data, messages)
+    analysis_parts.append(messages.render('analysis.sleep', text=sleep_analysis))
     
     # Activity analysis
-    activity_analysis = analyze_activity_pattern(recent_data)
-    analysis_parts.append(f"🏃‍♂️ **Faollik:** {activity_analysis}")
+    activity_analysis = analyze_activity_pattern(recent_data, messages)
+    analysis_parts.append(messages.render('analysis.activity', text=activity_analysis))
     
     # Mood analysis
-    mood_analysis = analyze_mood_pattern(recent_data)
-    analysis_parts.append(f"😊 **Kayfiyat:** {mood_analysis}")
+    mood_analysis = analyze_mood_pattern(recent_data, messages)
+    analysis_parts.append(messages.render('analysis.mood', text=mood_analysis))
     
     # Aggression analysis
-    aggression_analysis = analyze_aggression_pattern(recent_data)
-    analysis_parts.append(f"😤 **Agressiya:** {aggression_analysis}")
+    aggression_analysis = analyze_aggression_pattern(recent_data, messages)
+    analysis_parts.append(messages.render('analysis.aggression', text=aggression_analysis))
     
     # Overall correlation analysis
-    correlation_analysis = analyze_correlations(recent_data)
+    correlation_analysis = analyze_correlations(recent_data, messages)
     if correlation_analysis:
-        analysis_parts.append(f"🔍 **Bog'liqlik:** {correlation_analysis}")
+        analysis_parts.append(messages.render('analysis.correlation', text=correlation_analysis))
     
     return "\n\n".join(analysis_parts)
 
-def analyze_sleep_pattern(data: List[Dict]) -> str:
+def analyze_sleep_pattern(data: List[Dict], messages: Catalog) -> str:
     """Analyze sleep patterns"""
     sleep_times = [d['sleep_time'] for d in data]
     avg_sleep = sum(sleep_times) / len(sleep_times)
     today_sleep = sleep_times[0]
     
     if today_sleep >= 7.5:
-        sleep_status = "yaxshi"
+        sleep_status = messages.text('analysis.status.good')
     elif today_sleep >= 6:
-        sleep_status = "qoniqarli"
+        sleep_status = messages.text('analysis.status.fair')
     else:
-        sleep_status = "kam"
+        sleep_status = messages.text('analysis.status.low')
     
     trend = ""
     if len(data) >= 3:
         recent_avg = sum(sleep_times[:3]) / 3
         if recent_avg > avg_sleep + 0.5:
-            trend = " So'nggi kunlarda uyqu vaqti yaxshilandi."
+            trend = messages.text('analysis.sleep.improving')
         elif recent_avg < avg_sleep - 0.5:
-            trend = " So'nggi kunlarda uyqu vaqti kamaydi."
+            trend = messages.text('analysis.sleep.declining')
     
-    return f"Bugun {today_sleep} soat uxladingiz ({sleep_status}). O'rtacha: {avg_sleep:.1f} soat.{trend}"
+    return messages.render('analysis.sleep.summary', hours=today_sleep, status=sleep_status,
+                           average=avg_sleep, trend=trend)
 
-def analyze_activity_pattern(data: List[Dict]) -> str:
+def analyze_activity_pattern(data: List[Dict], messages: Catalog) -> str:
     """Analyze physical activity patterns"""
     activity_times = [d['activity_time'] for d in data]
     avg_activity = sum(activity_times) / len(activity_times)
     today_activity = activity_times[0]
     
     if today_activity >= 1.5:
-        activity_status = "yaxshi"
+        activity_status = messages.text('analysis.status.good')
     elif today_activity >= 0.5:
-        activity_status = "o'rtacha"
+        activity_status = messages.text('analysis.status.average')
     else:
-        activity_status = "kam"
+        activity_status = messages.text('analysis.status.low')
     
     comparison = ""
     if today_activity > avg_activity:
-        comparison = f" Bu odatdagidan {today_activity - avg_activity:.1f} soat ko'p."
+        comparison = messages.render('analysis.activity.more', difference=today_activity - avg_activity)
     elif today_activity < avg_activity:
-        comparison = f" Bu odatdagidan {avg_activity - today_activity:.1f} soat kam."
+        comparison = messages.render('analysis.activity.less', difference=avg_activity - today_activity)
     
-    return f"Bugun {today_activity} soat faol bo'ldingiz ({activity_status}).{comparison}"
+    return messages.render('analysis.activity.summary', hours=today_activity, status=activity_status,
+                           comparison=comparison)
 
-def analyze_mood_pattern(data: List[Dict]) -> str:
+def analyze_mood_pattern(data: List[Dict], messages: Catalog) -> str:
     """Analyze mood patterns"""
     mood_levels = [d['mood_level'] for d in data]
     avg_mood = sum(mood_levels) / len(mood_levels)
     today_mood = mood_levels[0]
     
-    mood_names = {1: "juda yomon", 2: "yomon", 3: "normal", 4: "yaxshi", 5: "ajoyib"}
-    
     trend = ""
     if len(data) >= 3:
         if mood_levels[0] > mood_levels[1] > mood_levels[2]:
-            trend = " Kayfiyat tobora yaxshilanmoqda!"
+            trend = messages.text('analysis.mood.improving')
         elif mood_levels[0] < mood_levels[1] < mood_levels[2]:
-            trend = " Kayfiyat pasayib bormoqda, e'tibor bering."
+            trend = messages.text('analysis.mood.declining')
     
-    return f"Bugungi kayfiyat: {mood_names[today_mood]} ({today_mood}/5). O'rtacha: {avg_mood:.1f}/5.{trend}"
+    return messages.render('analysis.mood.summary', name=messages.text(f"analysis.mood.{today_mood}"),
+                           level=today_mood, average=avg_mood, trend=trend)
 
-def analyze_aggression_pattern(data: List[Dict]) -> str:
+def analyze_aggression_pattern(data: List[Dict], messages: Catalog) -> str:
     """Analyze aggression patterns"""
     aggression_levels = [d['aggression_level'] for d in data]
     avg_aggression = sum(aggression_levels) / len(aggression_levels)
     today_aggression = aggression_levels[0]
     
-    aggression_names = {1: "past", 2: "o'rtacha", 3: "yuqori"}
-    
     if today_aggression <= avg_aggression:
-        comparison = "Bu odatdagi darajada yoki undan kam."
+        comparison = messages.text('analysis.aggression.usual')
     else:
-        comparison = "Bu odatdagidan yuqori, sabablarini tahlil qiling."
+        comparison = messages.text('analysis.aggression.higher')
     
-    return f"Bugungi agressiya: {aggression_names[today_aggression]} ({today_aggression}/3). {comparison}"
+    return messages.render('analysis.aggression.summary',
+                           name=messages.text(f"analysis.aggression.{today_aggression}"),
+                           level=today_aggression, comparison=comparison)
 
-def analyze_correlations(data: List[Dict]) -> str:
+def analyze_correlations(data: List[Dict], messages: Catalog) -> str:
     """Analyze correlations between different health metrics"""
     if len(data) < 5:
         return ""
@@ -132,25 +202,25 @@ def analyze_correlations(data: List[Dict]) -> str:
                                           [d['mood_level'] for d in data])
     if abs(sleep_mood_corr) > 0.6:
         if sleep_mood_corr > 0:
-            insights.append("Ko'p uxlagan kunlarda kayfiyatingiz yaxshi bo'ladi.")
+            insights.append(messages.text('analysis.insight.sleep_mood'))
         else:
-            insights.append("Uyqu va kayfiyat o'rtasida teskari bog'liqlik bor.")
+            insights.append(messages.text('analysis.insight.sleep_mood_inverse'))
     
     # Activity-Mood correlation
     activity_mood_corr = calculate_correlation([d['activity_time'] for d in data],
                                              [d['mood_level'] for d in data])
     if abs(activity_mood_corr) > 0.6:
         if activity_mood_corr > 0:
-            insights.append("Faol bo'lgan kunlarda kayfiyatingiz yaxshi.")
+            insights.append(messages.text('analysis.insight.activity_mood'))
         else:
-            insights.append("Jismoniy faollik kayfiyatingizga salbiy ta'sir qilayotganga o'xshaydi.")
+            insights.append(messages.text('analysis.insight.activity_mood_inverse'))
     
     # Sleep-Aggression correlation
     sleep_aggr_corr = calculate_correlation([d['sleep_time'] for d in data],
                                           [d['aggression_level'] for d in data])
     if abs(sleep_aggr_corr) > 0.6:
         if sleep_aggr_corr < 0:
-            insights.append("Kam uxlagan kunlarda agressivroq bo'lasiz.")
+            insights.append(messages.text('analysis.insight.sleep_aggression'))
     
     return " ".join(insights) if insights else ""
 
@@ -177,63 +247,69 @@ def calculate_correlation(x: List[float], y: List[float]) -> float:
     except:
         return 0
 
-async def generate_recommendations(recent_data: List[Dict], today_data: Dict) -> str:
+def build_recommendations(recent_data: List[Dict], today_data: Dict, locale: str = ANALYSIS_LOCALE) -> str:
     """
     Generate personalized recommendations based on health data
     """
+    messages = catalog(locale)
     recommendations = []
     
     # Sleep recommendations
     if today_data['sleep_time'] < 7:
-        recommendations.append("🛏 Ertaga kamida 7-8 soat uxlashga harakat qiling. Yaxshi uyqu kayfiyatni yaxshilaydi.")
+        recommendations.append(messages.text('advice.sleep_more'))
     elif today_data['sleep_time'] > 9:
-        recommendations.append("🛏 Juda ko'p uxlash ham yomon. 7-8 soat uxlash optimal.")
+        recommendations.append(messages.text('advice.sleep_less'))
     
     # Activity recommendations  
     if today_data['activity_time'] < 0.5:
-        recommendations.append("🏃‍♂️ Ertaga kamida 30 daqiqa jismoniy mashq qiling. Yurish ham yetarli.")
+        recommendations.append(messages.text('advice.move'))
     elif today_data['activity_time'] < 1:
-        recommendations.append("🏃‍♂️ Jismoniy faolligingizni oshiring. Kuniga 1 soat faollik ideal.")
+        recommendations.append(messages.text('advice.move_more'))
     
     # Mood recommendations
     if today_data['mood_level'] <= 2:
-        recommendations.append("😊 Kayfiyat pastligini bartaraf etish uchun: do'stlar bilan suhbat, qiziqarli faoliyat, tabiatda yurish.")
+        recommendations.append(messages.text('advice.mood'))
         
         # Check sleep correlation
         if today_data['sleep_time'] < 7:
-            recommendations.append("😴 Kam uyqu kayfiyatga salbiy ta'sir qilishi mumkin.")
+            recommendations.append(messages.text('advice.mood_sleep'))
     
     # Aggression recommendations
     if today_data['aggression_level'] >= 3:
-        recommendations.append("😤 Agressiyani kamaytirishga yordam beradi: chuqur nafas olish, meditatsiya, jismoniy mashqlar.")
+        recommendations.append(messages.text('advice.aggression'))
         
         # Check recent pattern
         if len(recent_data) >= 3:
             recent_aggression = [d['aggression_level'] for d in recent_data[:3]]
             if all(level >= 2 for level in recent_aggression):
-                recommendations.append("⚠️ So'nggi kunlarda agressiya yuqori. Stress manbalarini aniqlashga harakat qiling.")
+                recommendations.append(messages.text('advice.aggression_streak'))
     
     # Weekly pattern recommendations
     if len(recent_data) >= 7:
-        weekly_recommendations = analyze_weekly_patterns(recent_data)
+        weekly_recommendations = analyze_weekly_patterns(recent_data, messages)
         recommendations.extend(weekly_recommendations)
     
     # General health tips
-    recommendations.append("💡 Muntazam rejim: bir xil vaqtda uxlash va turish, muntazam ovqatlanish.")
-    recommendations.append("🥗 Sog'lom ovqatlanish: ko'proq meva-sabzavot, kam qayta ishlangan mahsulotlar.")
+    recommendations.append(messages.text('advice.routine'))
+    recommendations.append(messages.text('advice.diet'))
     
     return "\n\n".join(recommendations)
 
-def analyze_weekly_patterns(data: List[Dict]) -> List[str]:
+def analyze_weekly_patterns(data: List[Dict], messages: Catalog) -> List[str]:
     """Analyze weekly patterns and provide insights"""
     recommendations = []
     
     # Check consistency
     sleep_times = [d['sleep_time'] for d in data[:7]]
-    sleep_std = np.std(sleep_times) if len(sleep_times) > 1 else 0
+    if len(sleep_times) > 1:
+        # Imported here so numpy only loads when a weekly analysis actually runs
+        import numpy as np
+        sleep_std = np.std(sleep_times)
+    else:
+        sleep_std = 0
     
     if sleep_std > 2:
-        recommendations.append("📅 Uyqu rejimi notekis. Muntazam uyqu grafigini shakllantiring.")
+        recommendations.append(messages.text('advice.irregular_sleep'))
     
     # Check weekend patterns (assuming last entry is most recent)
     # This is a simplified approach - in real implementation, you'd use actual date checking
@@ -242,6 +318,6 @@ def analyze_weekly_patterns(data: List[Dict]) -> List[str]:
         weekend_mood = sum(d['mood_level'] for d in data[:2]) / 2   # Sat-Sun approximation
         
         if weekend_mood > weekday_mood + 0.5:
-            recommendations.append("📊 Dam olish kunlari kayfiyatingiz yaxshi. Ish kunlarida ham faolroq bo'ling.")
+            recommendations.append(messages.text('advice.weekday_mood'))
     
     return recommendations
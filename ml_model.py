@@ -0,0 +1,276 @@
+"""
+Trainable mood model for Health Tracker Bot
+Builds daily feature matrices from health_records and trains one global model incrementally
+"""
+
+import os
+import json
+import logging
+import threading
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from storage import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+FEATURES = ('sleep', 'exercise', 'steps', 'water')
+TARGET = 'mood'
+COLUMNS = FEATURES + (TARGET,)
+_COLUMN_INDEX = {name: index for index, name in enumerate(COLUMNS)}
+
+# Predictions are only served once the model has seen this many user-days
+MIN_TRAINING_SAMPLES = int(os.getenv("MODEL_MIN_SAMPLES", "50"))
+TRAINING_CHUNK = 10000
+TRAINING_EPOCHS = 5
+
+
+def build_daily_matrix(rows: Iterable[tuple]) -> Tuple[List[Tuple[int, str]], np.ndarray]:
+    """Pivot (user_id, date_for, record_type, value, recorded_at) rows into one row per user-day
+
+    Returns the (user_id, day) keys and a float matrix with one column per
+    entry of COLUMNS; the latest value of each type wins and missing values
+    are NaN.
+    """
+    keys: List[Tuple[int, str]] = []
+    positions: Dict[Tuple[int, str], int] = {}
+    values: List[List[float]] = []
+    stamps: List[List[str]] = []
+
+    for user_id, day, record_type, value, recorded_at in rows:
+        column = _COLUMN_INDEX.get(record_type)
+        if column is None:
+            continue
+        key = (user_id, str(day))
+        position = positions.get(key)
+        if position is None:
+            position = positions[key] = len(keys)
+            keys.append(key)
+            values.append([np.nan] * len(COLUMNS))
+            stamps.append([""] * len(COLUMNS))
+        stamp = str(recorded_at)
+        if stamp >= stamps[position][column]:
+            values[position][column] = value
+            stamps[position][column] = stamp
+
+    matrix = np.array(values, dtype=np.float64).reshape(len(keys), len(COLUMNS))
+    return keys, matrix
+
+
+class MoodModel:
+    """Standardized features feeding an SGD regressor, both updated with partial_fit"""
+
+    def __init__(self, scaler=None, regressor=None, samples: int = 0,
+                 watermark: Optional[str] = None, trained_through: Optional[str] = None,
+                 version: int = 0):
+        self.scaler = scaler
+        self.regressor = regressor
+        self.samples = samples
+        self.watermark = watermark
+        # Last day (ISO date) whose user-days have been fed; later runs only learn from newer days
+        self.trained_through = trained_through
+        self.version = version
+
+    @classmethod
+    def new(cls) -> 'MoodModel':
+        from sklearn.linear_model import SGDRegressor
+        from sklearn.preprocessing import StandardScaler
+        return cls(StandardScaler(), SGDRegressor(penalty='l2', alpha=1e-4, random_state=0))
+
+    @property
+    def is_ready(self) -> bool:
+        return self.samples >= MIN_TRAINING_SAMPLES
+
+    def _transform(self, features: np.ndarray) -> np.ndarray:
+        # NaN (missing metric) becomes 0 after scaling, i.e. the running mean
+        return np.nan_to_num(self.scaler.transform(features), nan=0.0)
+
+    def partial_fit(self, features: np.ndarray, target: np.ndarray):
+        """Update the scaler and the regressor with a new chunk of samples"""
+        # A metric nobody logged yet is an all-NaN column; the scaler copes
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.scaler.partial_fit(features)
+        scaled = self._transform(features)
+        # A few shuffled passes per batch; a single SGD pass barely moves the intercept
+        rng = np.random.default_rng(self.samples)
+        for _ in range(TRAINING_EPOCHS):
+            order = rng.permutation(len(target))
+            self.regressor.partial_fit(scaled[order], target[order])
+        self.samples += len(target)
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        """Predicted mood on the 1-10 scale, one value per row"""
+        return np.clip(self.regressor.predict(self._transform(features)), 1, 10)
+
+    def to_state(self) -> dict:
+        return {'scaler': self.scaler, 'regressor': self.regressor,
+                'samples': self.samples, 'watermark': self.watermark,
+                'trained_through': self.trained_through}
+
+
+class ModelStore:
+    """Versioned models on disk, described by a small JSON manifest"""
+
+    def __init__(self, directory: str = "models", name: str = "mood", keep: int = 5):
+        self.directory = directory
+        self.name = name
+        self.keep = keep
+        self.manifest_path = os.path.join(directory, f"{name}.manifest.json")
+        self._lock = threading.Lock()
+        self._cached: Optional[MoodModel] = None
+
+    def _read_manifest(self) -> dict:
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'latest': 0, 'versions': []}
+
+    def _path(self, version: int) -> str:
+        return os.path.join(self.directory, f"{self.name}-v{version}.joblib")
+
+    def latest_version(self) -> int:
+        return self._read_manifest()['latest']
+
+    def save(self, model: MoodModel) -> int:
+        """Persist a model as the next version and prune old ones"""
+        import joblib
+
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            manifest = self._read_manifest()
+            version = manifest['latest'] + 1
+            tmp_path = self._path(version) + ".tmp"
+            joblib.dump(model.to_state(), tmp_path)
+            os.replace(tmp_path, self._path(version))
+
+            manifest['latest'] = version
+            manifest['versions'].append({
+                'version': version,
+                'trained_at': datetime.now().isoformat(timespec='seconds'),
+                'samples': model.samples,
+                'watermark': model.watermark,
+            })
+            for old in manifest['versions'][:-self.keep]:
+                try:
+                    os.remove(self._path(old['version']))
+                except OSError:
+                    pass
+            manifest['versions'] = manifest['versions'][-self.keep:]
+
+            tmp_manifest = self.manifest_path + ".tmp"
+            with open(tmp_manifest, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, indent=2)
+            os.replace(tmp_manifest, self.manifest_path)
+
+        model.version = version
+        logger.info("Saved %s model v%s (%s samples)", self.name, version, model.samples)
+        return version
+
+    def load(self, version: int = None, mmap: bool = True) -> Optional[MoodModel]:
+        """Load a model version (latest by default); mmap shares its arrays read-only"""
+        import joblib
+
+        version = version or self.latest_version()
+        if not version:
+            return None
+        state = joblib.load(self._path(version), mmap_mode='r' if mmap else None)
+        return MoodModel(version=version, **state)
+
+    def load_for_inference(self) -> Optional[MoodModel]:
+        """Latest model, memory-mapped and cached until a newer version appears"""
+        version = self.latest_version()
+        cached = self._cached
+        if cached is not None and cached.version == version:
+            return cached
+        if not version:
+            return None
+        self._cached = self.load(version, mmap=True)
+        return self._cached
+
+
+default_store = ModelStore(os.getenv("MODEL_DIR", "models"))
+
+
+def _unflagged_rows(batches: Iterable[List[tuple]], latest: List[str]) -> Iterator[tuple]:
+    """Flatten iter_record_batches output to unflagged metric rows, tracking the latest recorded_at"""
+    for batch in batches:
+        for user_id, day, record_type, value, recorded_at, is_anomaly in batch:
+            if is_anomaly:
+                continue
+            latest[0] = max(latest[0], str(recorded_at))
+            yield user_id, day, record_type, value, recorded_at
+
+
+def train_incremental(storage: StorageBackend, store: ModelStore = None,
+                      full: bool = False) -> Optional[int]:
+    """Update the model with the days completed since the last training run
+
+    Only user-days after the model's last trained day and before today
+    are fed, so each day is learned once, and only once it is over. With
+    `full` the model is rebuilt from every record: from the columnar
+    archive when one has been built, otherwise by streaming the table in
+    batches. The next incremental run picks up whatever was recorded
+    after it. Returns the new version, or None when there was nothing to
+    learn from.
+    """
+    store = store or default_store
+    model = None if full else store.load(mmap=False)
+    since = model.watermark if model else None
+
+    archive = None
+    if since is None:
+        from archive import current_archive
+        archive = current_archive()
+    if archive is not None and archive.watermark:
+        keys, matrix = archive.daily_matrix(COLUMNS)
+        watermark = archive.watermark
+    elif since is None:
+        latest = [""]
+        keys, matrix = build_daily_matrix(_unflagged_rows(storage.iter_record_batches(), latest))
+        watermark = latest[0] or None
+    else:
+        rows = storage.get_metric_rows_touched_since(since)
+        if not rows:
+            return None
+        watermark = max(str(row[4]) for row in rows)
+        keys, matrix = build_daily_matrix(rows)
+
+    # Models saved before trained_through existed fed every day up to their watermark
+    trained_through = (model.trained_through or (since or "")[:10]) if model else ""
+    today = date.today().isoformat()
+    new_days = np.array([trained_through < day < today for _, day in keys], dtype=bool)
+    features, target = matrix[new_days, :-1], matrix[new_days, -1]
+    usable = ~np.isnan(target) & ~np.all(np.isnan(features), axis=1)
+    features, target = features[usable], target[usable]
+    if len(target) == 0:
+        return None
+
+    model = model or MoodModel.new()
+    for start in range(0, len(target), TRAINING_CHUNK):
+        model.partial_fit(features[start:start + TRAINING_CHUNK], target[start:start + TRAINING_CHUNK])
+    model.watermark = watermark
+    model.trained_through = (date.today() - timedelta(days=1)).isoformat()
+    return store.save(model)
+
+
+def predict_mood(storage: StorageBackend, user_ids: List[int], target_date: date = None,
+                 store: ModelStore = None) -> Dict[int, float]:
+    """Predicted mood for many users in one model call; users without data are skipped"""
+    store = store or default_store
+    model = store.load_for_inference()
+    if model is None or not model.is_ready or not user_ids:
+        return {}
+
+    rows = storage.get_metric_rows_for_day(user_ids, target_date or date.today())
+    keys, matrix = build_daily_matrix(rows)
+    features = matrix[:, :-1]
+    usable = ~np.all(np.isnan(features), axis=1)
+    if not usable.any():
+        return {}
+
+    predictions = model.predict(features[usable])
+    users = [user_id for (user_id, _), keep in zip(keys, usable) if keep]
+    return {user_id: round(float(value), 1) for user_id, value in zip(users, predictions)}
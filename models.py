@@ -7,6 +7,8 @@ from datetime import datetime
 from typing import Optional, List
 import logging
 
+from metrics import REGISTRY
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -46,7 +48,7 @@ class User:
             try:
                 user.created_at = datetime.fromisoformat(data["created_at"])
             except ValueError:
-                logger.warning(f"Invalid created_at format: {data['created_at']}")
+                logger.warning("Invalid created_at format: %s", data['created_at'])
         
         return user
 
@@ -102,7 +104,7 @@ class HealthData:
             try:
                 health_data.created_at = datetime.fromisoformat(data["created_at"])
             except ValueError:
-                logger.warning(f"Invalid created_at format: {data['created_at']}")
+                logger.warning("Invalid created_at format: %s", data['created_at'])
         
         return health_data
     
@@ -198,7 +200,7 @@ class HealthAnalysis:
             try:
                 analysis.created_at = datetime.fromisoformat(data["created_at"])
             except ValueError:
-                logger.warning(f"Invalid created_at format: {data['created_at']}")
+                logger.warning("Invalid created_at format: %s", data['created_at'])
         
         return analysis
     
@@ -274,13 +276,9 @@ class UserSession:
 
 # Health metrics validation functions
 def validate_sleep_time(sleep_time: str) -> tuple[bool, float]:
-    """Validate sleep time input"""
+    """Validate sleep time input against the registered sleep limits"""
     try:
-        value = float(sleep_time)
-        if 0 <= value <= 24:
-            return True, value
-        else:
-            return False, 0.0
+        return True, float(REGISTRY['sleep'].parse(sleep_time))
     except ValueError:
         return False, 0.0
 
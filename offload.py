@@ -0,0 +1,111 @@
+"""
+Process-pool offload for CPU-heavy work
+Keeps analysis and export serialization off the bot's event loop
+"""
+
+import os
+import atexit
+import asyncio
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class OffloadBusy(RuntimeError):
+    """Raised when too many offloaded jobs are already queued or running"""
+
+
+class ProcessOffloader:
+    """Bounded, cancellable process pool for async callers
+
+    At most `max_pending` jobs are queued or running at once; further
+    submissions fail fast with OffloadBusy instead of piling up. Awaiting
+    callers time out after `timeout` seconds; a timed-out or cancelled job
+    that has not started yet is removed from the queue, while one already
+    running finishes in its worker and keeps its slot until then, so the
+    bound stays honest. Arguments and results cross the process boundary
+    by pickling, so callers should pass compact arrays rather than lists
+    of dicts. With max_workers=0 jobs run in a single thread instead.
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 32, timeout: float = 30.0):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pool: Optional[Executor] = None
+
+    @classmethod
+    def from_env(cls) -> 'ProcessOffloader':
+        return cls(
+            max_workers=int(os.getenv("OFFLOAD_WORKERS", "2")),
+            max_pending=int(os.getenv("OFFLOAD_QUEUE_SIZE", "32")),
+            timeout=float(os.getenv("OFFLOAD_TIMEOUT", "30"))
+        )
+
+    def _get_pool(self) -> Executor:
+        with self._lock:
+            if self._pool is None:
+                if self.max_workers > 0:
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=multiprocessing.get_context("spawn")
+                    )
+                else:
+                    self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="offload")
+            return self._pool
+
+    def _reset_pool(self):
+        """Drop a broken pool so the next job starts a fresh one"""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    async def run(self, func: Callable, *args, timeout: float = None) -> Any:
+        """Run a picklable top-level function in the pool and await its result"""
+        if not self._slots.acquire(blocking=False):
+            raise OffloadBusy(f"{self.max_pending} offloaded jobs already pending")
+
+        try:
+            future = self._get_pool().submit(func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            future.cancel()
+            logger.warning("Offloaded %s timed out after %.1f s", func.__name__, timeout or self.timeout)
+            raise
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BrokenProcessPool:
+            logger.error("Offload pool broke while running %s; restarting it", func.__name__)
+            self._reset_pool()
+            raise
+
+    def shutdown(self, wait: bool = False):
+        """Stop the pool, cancelling queued jobs; with `wait`, also wait for its workers to exit
+
+        Processes started by multiprocessing skip atexit handlers and
+        instead join their children on exit, so they must shut their pool
+        down with wait=True or hang on its idle workers.
+        """
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=wait, cancel_futures=True)
+                self._pool = None
+
+
+offloader = ProcessOffloader.from_env()
+atexit.register(offloader.shutdown)
@@ -0,0 +1,212 @@
+"""
+Outbound message queue for the Bot API
+Coalesces consecutive replies per chat, sends interactive replies before bulk traffic and paces requests
+"""
+
+import os
+import asyncio
+import logging
+import itertools
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+logger = logging.getLogger(__name__)
+
+# Priorities: lower is sent first
+INTERACTIVE = 0
+BULK = 1
+
+MAX_MESSAGE_LENGTH = 4096
+
+
+@dataclass
+class _Batch:
+    """Texts for one chat that will go out as a single message"""
+    chat_id: int
+    priority: int
+    parse_mode: Optional[str]
+    parts: List[str]
+    reply_markup: Any = None
+    futures: List[asyncio.Future] = field(default_factory=list)
+    closed: bool = False
+
+    def accepts(self, text: str, parse_mode: Optional[str], priority: int, reply_markup: Any) -> bool:
+        """Whether text can be appended without changing how either message renders"""
+        length = sum(len(part) + 2 for part in self.parts) + len(text)
+        return (
+            parse_mode == self.parse_mode
+            and priority == self.priority
+            and length <= MAX_MESSAGE_LENGTH
+            and (reply_markup is None or self.reply_markup is None)
+        )
+
+
+class Outbox:
+    """Coalescing, prioritized, rate-limited sender shared by handlers and the scheduler
+
+    Messages to the same chat that arrive within `coalesce_window` seconds
+    are joined into one sendMessage call (a keyboard, if any, rides along
+    on the combined message). A single worker drains a priority queue at
+    no more than `rate` requests per second and honours RetryAfter. At most
+    `max_pending` bulk messages wait at once; further bulk send() calls
+    block until the worker catches up, which slows producers such as the
+    reminder loop instead of letting the queue grow without bound.
+    Interactive replies are never held back by bulk traffic: they are
+    admitted at once and sent ahead of whatever bulk messages are queued.
+    """
+
+    def __init__(self, bot, rate: float = 25.0, coalesce_window: float = 0.05,
+                 max_pending: int = 500, max_retries: int = 3):
+        self.bot = bot
+        self.rate = rate
+        self.coalesce_window = coalesce_window
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._open: Dict[int, _Batch] = {}
+        self._bulk_slots = asyncio.Semaphore(max_pending)
+        self._sequence = itertools.count()
+        self._task: Optional[asyncio.Task] = None
+        self.requests = 0
+        self.coalesced = 0
+
+    @classmethod
+    def from_env(cls, bot) -> 'Outbox':
+        return cls(
+            bot,
+            rate=float(os.getenv("OUTBOX_RATE", "25")),
+            coalesce_window=float(os.getenv("OUTBOX_COALESCE_MS", "50")) / 1000,
+            max_pending=int(os.getenv("OUTBOX_MAX_PENDING", "500"))
+        )
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> asyncio.Task:
+        """Start the delivery worker on the running event loop"""
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+        return self._task
+
+    async def send(self, chat_id: int, text: str, parse_mode: str = None, reply_markup: Any = None,
+                   priority: int = INTERACTIVE) -> asyncio.Future:
+        """Queue a message; the returned future resolves to the sent Message, or None on failure"""
+        future = asyncio.get_running_loop().create_future()
+
+        batch = self._open.get(chat_id)
+        if batch is not None and batch.accepts(text, parse_mode, priority, reply_markup):
+            batch.parts.append(text)
+            if reply_markup is not None:
+                batch.reply_markup = reply_markup
+            batch.futures.append(future)
+            self.coalesced += 1
+            return future
+
+        if priority >= BULK:
+            await self._bulk_slots.acquire()
+        batch = _Batch(chat_id, priority, parse_mode, [text], reply_markup, [future])
+        self._open[chat_id] = batch
+        asyncio.get_running_loop().call_later(self.coalesce_window, self._close, batch)
+        return future
+
+    def _close(self, batch: _Batch):
+        """Stop accepting texts for a batch and hand it to the worker"""
+        if batch.closed:
+            return
+        batch.closed = True
+        if self._open.get(batch.chat_id) is batch:
+            del self._open[batch.chat_id]
+        self._queue.put_nowait((batch.priority, next(self._sequence), batch))
+
+    async def _run(self):
+        interval = 1.0 / self.rate if self.rate > 0 else 0
+        while True:
+            _, _, batch = await self._queue.get()
+            try:
+                message = await self._deliver(batch)
+            except asyncio.CancelledError:
+                self._resolve(batch, None)
+                raise
+            except Exception as e:
+                # Anything _deliver did not anticipate fails this batch, never the worker
+                logger.error("Unexpected error sending message to %s: %s", batch.chat_id, e)
+                message = None
+            finally:
+                self._release(batch)
+                self._queue.task_done()
+
+            self._resolve(batch, message)
+            await asyncio.sleep(interval)
+
+    def _release(self, batch: _Batch):
+        """Free the bulk slot a batch was admitted with"""
+        if batch.priority >= BULK:
+            self._bulk_slots.release()
+
+    @staticmethod
+    def _resolve(batch: _Batch, message):
+        for future in batch.futures:
+            if not future.done():
+                future.set_result(message)
+
+    async def _deliver(self, batch: _Batch):
+        """Send one batch, waiting out flood limits; None if it could not be delivered"""
+        text = "\n\n".join(batch.parts)
+        for _ in range(self.max_retries + 1):
+            try:
+                self.requests += 1
+                return await self.bot.send_message(
+                    chat_id=batch.chat_id, text=text,
+                    parse_mode=batch.parse_mode, reply_markup=batch.reply_markup
+                )
+            except RetryAfter as e:
+                delay = e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds') else e.retry_after
+                logger.warning("Flood limit hit, pausing outbox for %s s", delay)
+                await asyncio.sleep(delay)
+            except Forbidden:
+                logger.warning("User %s blocked the bot", batch.chat_id)
+                return None
+            except BadRequest as e:
+                logger.warning("Could not send message to %s: %s", batch.chat_id, e)
+                return None
+            except TelegramError as e:
+                logger.error("Error sending message to %s: %s", batch.chat_id, e)
+                await asyncio.sleep(1)
+        logger.error("Giving up on message to %s after %s attempts", batch.chat_id, self.max_retries + 1)
+        return None
+
+    async def stop(self, timeout: float = 10):
+        """Flush open batches, wait for the queue to drain, then stop the worker
+
+        Whatever is still queued after `timeout` is dropped and its futures
+        resolve to None, so no sender is left waiting on a message that
+        will never go out.
+        """
+        for batch in list(self._open.values()):
+            self._close(batch)
+        if self.running:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Outbox stopped with %s messages unsent", self._queue.qsize())
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        while not self._queue.empty():
+            _, _, batch = self._queue.get_nowait()
+            self._resolve(batch, None)
+            self._release(batch)
+            self._queue.task_done()
+
+    def stats(self) -> dict:
+        return {
+            'requests': self.requests,
+            'coalesced': self.coalesced,
+            'queued': self._queue.qsize(),
+            'open': len(self._open),
+        }
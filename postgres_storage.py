@@ -0,0 +1,753 @@
+"""
+PostgreSQL storage backend for Health Tracker Bot
+Uses an asyncpg connection pool driven by a dedicated I/O event loop
+"""
+
+import json
+import time
+import asyncio
+import logging
+import threading
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from storage import StorageBackend, decode_cursor, encode_cursor
+from anomaly import detector
+from sketches import HyperLogLog, QuantileSketch, sketch_slot
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        user_id BIGINT PRIMARY KEY,
+        username TEXT,
+        first_name TEXT,
+        last_name TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        timezone TEXT DEFAULT 'UTC'
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS health_records (
+        id BIGSERIAL PRIMARY KEY,
+        user_id BIGINT REFERENCES users (user_id),
+        record_type TEXT NOT NULL,
+        value DOUBLE PRECISION NOT NULL,
+        unit TEXT,
+        notes TEXT,
+        recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        date_for DATE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS user_preferences (
+        user_id BIGINT PRIMARY KEY REFERENCES users (user_id),
+        reminder_enabled BOOLEAN DEFAULT TRUE,
+        reminder_time TEXT DEFAULT '20:00',
+        weight_unit TEXT DEFAULT 'kg',
+        height_cm INTEGER,
+        age INTEGER,
+        gender TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_health_records_user_keyset ON health_records (user_id, date_for, recorded_at, id)",
+    "DROP INDEX IF EXISTS idx_health_records_user_date",
+    "CREATE INDEX IF NOT EXISTS idx_health_records_type ON health_records (record_type)",
+    """
+    CREATE TABLE IF NOT EXISTS scheduler_leases (
+        name TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        expires_at DOUBLE PRECISION NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS reminders_sent (
+        user_id BIGINT,
+        reminder_date DATE,
+        sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, reminder_date)
+    )
+    """,
+    "ALTER TABLE health_records ADD COLUMN IF NOT EXISTS is_anomaly BOOLEAN NOT NULL DEFAULT FALSE",
+    """
+    CREATE TABLE IF NOT EXISTS metric_sketches (
+        record_type TEXT,
+        day DATE,
+        slot SMALLINT NOT NULL DEFAULT 0,
+        sketch TEXT NOT NULL,
+        PRIMARY KEY (record_type, day, slot)
+    )
+    """,
+    # Tables created before sketches were slotted: existing day sketches become slot 0
+    "ALTER TABLE metric_sketches ADD COLUMN IF NOT EXISTS slot SMALLINT NOT NULL DEFAULT 0",
+    """
+    DO $$
+    BEGIN
+        IF NOT EXISTS (
+            SELECT 1 FROM pg_index i
+            JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY (i.indkey)
+            WHERE i.indrelid = 'metric_sketches'::regclass AND i.indisprimary AND a.attname = 'slot'
+        ) THEN
+            ALTER TABLE metric_sketches DROP CONSTRAINT metric_sketches_pkey,
+                ADD PRIMARY KEY (record_type, day, slot);
+        END IF;
+    END $$
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS active_user_sketches (
+        day DATE PRIMARY KEY,
+        registers BYTEA NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS metric_baselines (
+        user_id BIGINT,
+        record_type TEXT,
+        recent_values TEXT NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, record_type)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS metric_rollups (
+        record_type TEXT,
+        hour TIMESTAMP,
+        records BIGINT NOT NULL,
+        samples BIGINT NOT NULL,
+        total DOUBLE PRECISION NOT NULL,
+        minimum DOUBLE PRECISION,
+        maximum DOUBLE PRECISION,
+        PRIMARY KEY (record_type, hour)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_metric_rollups_hour ON metric_rollups (hour)",
+    """
+    CREATE TABLE IF NOT EXISTS daily_summaries (
+        user_id BIGINT,
+        date_for DATE,
+        record_type TEXT,
+        records BIGINT NOT NULL,
+        samples BIGINT NOT NULL,
+        total DOUBLE PRECISION NOT NULL,
+        minimum DOUBLE PRECISION,
+        maximum DOUBLE PRECISION,
+        PRIMARY KEY (user_id, date_for, record_type)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS user_digests (
+        user_id BIGINT,
+        period TEXT,
+        period_end DATE NOT NULL,
+        payload JSONB NOT NULL,
+        computed_at TIMESTAMPTZ DEFAULT now(),
+        PRIMARY KEY (user_id, period)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS digest_progress (
+        period TEXT PRIMARY KEY,
+        period_end DATE NOT NULL,
+        last_user_id BIGINT NOT NULL,
+        completed BOOLEAN NOT NULL DEFAULT FALSE
+    )
+    """,
+    # One-time backfill: only runs while the rollups are still empty
+    """
+    INSERT INTO metric_rollups (record_type, hour, records, samples, total, minimum, maximum)
+    SELECT record_type, date_trunc('hour', recorded_at), COUNT(*),
+           COUNT(*) FILTER (WHERE NOT is_anomaly),
+           COALESCE(SUM(value) FILTER (WHERE NOT is_anomaly), 0),
+           MIN(value) FILTER (WHERE NOT is_anomaly),
+           MAX(value) FILTER (WHERE NOT is_anomaly)
+    FROM health_records
+    WHERE recorded_at IS NOT NULL AND NOT EXISTS (SELECT 1 FROM metric_rollups)
+    GROUP BY 1, 2
+    """,
+]
+
+# Bucket label per time-series resolution, matching the SQLite backend
+_BUCKET_FORMATS = {'hour': '%Y-%m-%d %H:00', 'day': '%Y-%m-%d', 'week': '%Y-%m-%d', 'month': '%Y-%m-%d'}
+
+PREFERENCE_FIELDS = ['reminder_enabled', 'reminder_time', 'weight_unit', 'height_cm', 'age', 'gender']
+
+
+class PostgresStorage(StorageBackend):
+    """PostgreSQL backend
+
+    The pool lives on its own event loop thread, so it is shared by the bot's
+    loop and the dashboard's threads alike; the public methods keep the same
+    synchronous signatures as the SQLite backend.
+    """
+
+    def __init__(self, dsn: str, min_size: int = 1, max_size: int = 10):
+        try:
+            import asyncpg
+        except ImportError as e:
+            raise RuntimeError("PostgreSQL storage requires the asyncpg package") from e
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="postgres-io", daemon=True)
+        self._thread.start()
+
+        self._pool = self._run(asyncpg.create_pool(dsn, min_size=min_size, max_size=max_size))
+        self._run(self._init_schema())
+        logger.info("PostgreSQL storage initialized (pool %s-%s)", min_size, max_size)
+
+    def _run(self, coro):
+        """Run a coroutine on the I/O loop and wait for its result"""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    async def _init_schema(self):
+        async with self._pool.acquire() as conn:
+            async with conn.transaction():
+                for statement in SCHEMA:
+                    await conn.execute(statement)
+
+    def register_user(self, user_id: int, username: str = None,
+                      first_name: str = None, last_name: str = None) -> bool:
+        async def run():
+            async with self._pool.acquire() as conn:
+                async with conn.transaction():
+                    await conn.execute("""
+                        INSERT INTO users (user_id, username, first_name, last_name)
+                        VALUES ($1, $2, $3, $4)
+                        ON CONFLICT (user_id) DO UPDATE
+                        SET username = $2, first_name = $3, last_name = $4
+                    """, user_id, username, first_name, last_name)
+                    await conn.execute("""
+                        INSERT INTO user_preferences (user_id) VALUES ($1)
+                        ON CONFLICT (user_id) DO NOTHING
+                    """, user_id)
+        try:
+            self._run(run())
+            return True
+        except Exception as e:
+            logger.error("Error registering user %s: %s", user_id, e)
+            return False
+
+    def record_health_data(self, user_id: int, record_type: str, value: float,
+                           unit: str = None, notes: str = None, date_for: date = None) -> bool:
+        return self.record_health_batch(user_id, [(record_type, value, unit)], notes, date_for)
+
+    def record_health_batch(self, user_id: int, records: List[tuple], notes: str = None,
+                            date_for: date = None) -> bool:
+        if date_for is None:
+            date_for = date.today()
+
+        async def run():
+            async with self._pool.acquire() as conn:
+                async with conn.transaction():
+                    # Sorted so concurrent batches take the row locks in the same order
+                    flagged = [
+                        (record_type, value)
+                        for record_type, value, unit in sorted(records, key=lambda r: r[0])
+                        if await self._insert_record(conn, user_id, record_type, float(value),
+                                                     unit, notes, date_for)
+                    ]
+                    await self._mark_active(conn, user_id, date_for)
+                    return flagged
+        try:
+            for record_type, value in self._run(run()):
+                logger.info("Flagged %s=%s for user %s as an anomaly", record_type, value, user_id)
+            return True
+        except Exception as e:
+            logger.error("Error recording health data for user %s: %s", user_id, e)
+            return False
+
+    async def _insert_record(self, conn, user_id: int, record_type: str, value: float,
+                             unit: str, notes: str, date_for: date) -> bool:
+        """Insert one record with its anomaly check and sketch update; True if it was flagged"""
+        # Row lock on the baseline serializes writers of the same metric
+        state = await conn.fetchval("""
+            SELECT recent_values FROM metric_baselines
+            WHERE user_id = $1 AND record_type = $2
+            FOR UPDATE
+        """, user_id, record_type)
+        is_anomaly, recent_values = detector.observe(state, value, record_type)
+        recorded_at = await conn.fetchval("""
+            INSERT INTO health_records (user_id, record_type, value, unit, notes, date_for, is_anomaly)
+            VALUES ($1, $2, $3, $4, $5, $6, $7)
+            RETURNING recorded_at
+        """, user_id, record_type, value, unit, notes, date_for, is_anomaly)
+        sample = None if is_anomaly else value
+        await conn.execute("""
+            INSERT INTO metric_rollups (record_type, hour, records, samples, total, minimum, maximum)
+            VALUES ($1, date_trunc('hour', $2::timestamp), 1, $3, $4, $5, $5)
+            ON CONFLICT (record_type, hour) DO UPDATE SET
+                records = metric_rollups.records + 1,
+                samples = metric_rollups.samples + EXCLUDED.samples,
+                total = metric_rollups.total + EXCLUDED.total,
+                minimum = LEAST(metric_rollups.minimum, EXCLUDED.minimum),
+                maximum = GREATEST(metric_rollups.maximum, EXCLUDED.maximum)
+        """, record_type, recorded_at, 0 if is_anomaly else 1, sample or 0.0, sample)
+        await conn.execute("""
+            INSERT INTO metric_baselines (user_id, record_type, recent_values, updated_at)
+            VALUES ($1, $2, $3, CURRENT_TIMESTAMP)
+            ON CONFLICT (user_id, record_type) DO UPDATE
+            SET recent_values = EXCLUDED.recent_values, updated_at = EXCLUDED.updated_at
+        """, user_id, record_type, recent_values)
+        if not is_anomaly:
+            await self._add_to_sketch(conn, user_id, record_type, date_for, value)
+        return is_anomaly
+
+    async def _add_to_sketch(self, conn, user_id: int, record_type: str, day: date, value: float):
+        """Fold a value into the user's slot of its metric's sketch for the day (inside the caller's transaction)"""
+        # The row lock covers one of SKETCH_SLOTS partial sketches, so writers
+        # of users in other slots are not serialized behind this transaction
+        slot = sketch_slot(user_id)
+        await conn.execute("""
+            INSERT INTO metric_sketches (record_type, day, slot, sketch) VALUES ($1, $2, $3, '')
+            ON CONFLICT DO NOTHING
+        """, record_type, day, slot)
+        state = await conn.fetchval("""
+            SELECT sketch FROM metric_sketches WHERE record_type = $1 AND day = $2 AND slot = $3 FOR UPDATE
+        """, record_type, day, slot)
+        sketch = QuantileSketch.from_json(state)
+        sketch.add(value)
+        await conn.execute("""
+            UPDATE metric_sketches SET sketch = $4 WHERE record_type = $1 AND day = $2 AND slot = $3
+        """, record_type, day, slot, sketch.to_json())
+
+    async def _mark_active(self, conn, user_id: int, day: date):
+        """Raise one register of the day's active-user sketch, atomically and only if needed"""
+        index, rank = HyperLogLog().position(user_id)
+        result = await conn.execute("""
+            UPDATE active_user_sketches SET registers = set_byte(registers, $2, $3)
+            WHERE day = $1 AND get_byte(registers, $2) < $3
+        """, day, index, rank)
+        if result.endswith(" 0"):
+            sketch = HyperLogLog()
+            sketch.add(user_id)
+            await conn.execute("""
+                INSERT INTO active_user_sketches (day, registers) VALUES ($1, $2)
+                ON CONFLICT (day) DO UPDATE
+                SET registers = set_byte(active_user_sketches.registers, $3, $4)
+                WHERE get_byte(active_user_sketches.registers, $3) < $4
+            """, day, sketch.to_bytes(), index, rank)
+
+    def get_user_records(self, user_id: int, record_type: str = None,
+                         days: int = 30) -> List[Dict[str, Any]]:
+        return list(self.iter_user_records(
+            user_id,
+            start_date=date.today() - timedelta(days=days),
+            record_types=[record_type] if record_type else None
+        ))
+
+    def get_records_page(self, user_id: int, start_date: date = None, end_date: date = None,
+                         record_types: Sequence[str] = None, limit: int = 500,
+                         cursor: str = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        conditions = ["user_id = $1"]
+        params: List[Any] = [user_id]
+
+        def placeholder(value) -> str:
+            params.append(value)
+            return f"${len(params)}"
+
+        if start_date is not None:
+            conditions.append(f"date_for >= {placeholder(start_date)}")
+        if end_date is not None:
+            conditions.append(f"date_for <= {placeholder(end_date)}")
+        if record_types:
+            conditions.append(f"record_type = ANY({placeholder(list(record_types))}::text[])")
+        if cursor:
+            date_for, recorded_at, record_id = decode_cursor(cursor)
+            conditions.append("(date_for, recorded_at, id) < ({}, {}, {})".format(
+                placeholder(date.fromisoformat(date_for)),
+                placeholder(datetime.fromisoformat(recorded_at)),
+                placeholder(record_id)
+            ))
+        rows = self._run(self._pool.fetch("""
+            SELECT * FROM health_records
+            WHERE {}
+            ORDER BY date_for DESC, recorded_at DESC, id DESC
+            LIMIT {}
+        """.format(" AND ".join(conditions), placeholder(limit)), *params))
+        records = [dict(row) for row in rows]
+        return records, encode_cursor(records[-1]) if len(records) == limit else None
+
+    def get_daily_summary(self, user_id: int, target_date: date = None) -> Dict[str, Any]:
+        if target_date is None:
+            target_date = date.today()
+        try:
+            rows = self._run(self._pool.fetch("""
+                SELECT DISTINCT ON (record_type) record_type, value, unit, notes, recorded_at
+                FROM health_records
+                WHERE user_id = $1 AND date_for = $2
+                ORDER BY record_type, recorded_at DESC
+            """, user_id, target_date))
+            return {
+                row['record_type']: {
+                    'value': row['value'],
+                    'unit': row['unit'],
+                    'notes': row['notes'],
+                    'recorded_at': row['recorded_at']
+                }
+                for row in rows
+            }
+        except Exception as e:
+            logger.error("Error getting daily summary: %s", e)
+            return {}
+
+    def update_user_preferences(self, user_id: int, **preferences) -> bool:
+        fields = [(field, value) for field, value in preferences.items() if field in PREFERENCE_FIELDS]
+        if not fields:
+            return False
+
+        assignments = ", ".join(f"{field} = ${index}" for index, (field, _) in enumerate(fields, start=1))
+        values = [value for _, value in fields]
+        try:
+            self._run(self._pool.execute(
+                f"UPDATE user_preferences SET {assignments} WHERE user_id = ${len(values) + 1}",
+                *values, user_id
+            ))
+            return True
+        except Exception as e:
+            logger.error("Error updating user preferences: %s", e)
+            return False
+
+    def get_user_preferences(self, user_id: int) -> Dict[str, Any]:
+        try:
+            row = self._run(self._pool.fetchrow(
+                "SELECT * FROM user_preferences WHERE user_id = $1", user_id
+            ))
+            return dict(row) if row else {}
+        except Exception as e:
+            logger.error("Error getting user preferences: %s", e)
+            return {}
+
+    def get_stats(self, user_id: int, days: int = 30) -> Dict[str, Any]:
+        try:
+            rows = self._run(self._pool.fetch("""
+                SELECT record_type, COUNT(*) AS count,
+                AVG(value) FILTER (WHERE NOT is_anomaly) AS avg_value
+                FROM health_records
+                WHERE user_id = $1 AND date_for >= CURRENT_DATE - $2::int
+                GROUP BY record_type
+            """, user_id, days))
+
+            stats = {}
+            total = 0
+            for row in rows:
+                stats[row['record_type']] = {
+                    'count': row['count'],
+                    'average': round(row['avg_value'], 2) if row['avg_value'] else 0
+                }
+                total += row['count']
+            stats['total_records'] = total
+            stats['days_period'] = days
+            return stats
+        except Exception as e:
+            logger.error("Error getting user stats: %s", e)
+            return {}
+
+    def acquire_lease(self, name: str, owner: str, ttl_seconds: float) -> bool:
+        now = time.time()
+        try:
+            result = self._run(self._pool.execute("""
+                INSERT INTO scheduler_leases (name, owner, expires_at)
+                VALUES ($1, $2, $3)
+                ON CONFLICT (name) DO UPDATE
+                SET owner = EXCLUDED.owner, expires_at = EXCLUDED.expires_at
+                WHERE scheduler_leases.owner = EXCLUDED.owner
+                OR scheduler_leases.expires_at < $4
+            """, name, owner, now + ttl_seconds, now))
+            return result.endswith(" 1")
+        except Exception as e:
+            logger.error("Error acquiring lease %s: %s", name, e)
+            return False
+
+    def get_reminder_candidates(self, reminder_time: str, target_date: date) -> List[int]:
+        try:
+            rows = self._run(self._pool.fetch("""
+                SELECT p.user_id FROM user_preferences p
+                WHERE p.reminder_enabled AND p.reminder_time = $1
+                AND NOT EXISTS (
+                    SELECT 1 FROM health_records r
+                    WHERE r.user_id = p.user_id AND r.date_for = $2
+                )
+            """, reminder_time, target_date))
+            return [row['user_id'] for row in rows]
+        except Exception as e:
+            logger.error("Error getting reminder candidates: %s", e)
+            return []
+
+    def claim_reminder(self, user_id: int, target_date: date) -> bool:
+        try:
+            result = self._run(self._pool.execute("""
+                INSERT INTO reminders_sent (user_id, reminder_date) VALUES ($1, $2)
+                ON CONFLICT DO NOTHING
+            """, user_id, target_date))
+            return result.endswith(" 1")
+        except Exception as e:
+            logger.error("Error claiming reminder for user %s: %s", user_id, e)
+            return False
+
+    def get_metric_rows_touched_since(self, since: str = None) -> List[tuple]:
+        if since is None:
+            rows = self._run(self._pool.fetch("""
+                SELECT user_id, date_for, record_type, value, recorded_at
+                FROM health_records
+                WHERE NOT is_anomaly
+            """))
+        else:
+            rows = self._run(self._pool.fetch("""
+                SELECT user_id, date_for, record_type, value, recorded_at
+                FROM health_records
+                WHERE NOT is_anomaly AND (user_id, date_for) IN (
+                    SELECT DISTINCT user_id, date_for FROM health_records
+                    WHERE recorded_at > $1::timestamp
+                )
+            """, datetime.fromisoformat(since)))
+        return [tuple(row) for row in rows]
+
+    def iter_record_batches(self, batch_size: int = 10000) -> Iterator[List[tuple]]:
+        last_id = 0
+        while True:
+            rows = self._run(self._pool.fetch("""
+                SELECT id, user_id, date_for, record_type, value, recorded_at, is_anomaly
+                FROM health_records
+                WHERE id > $1
+                ORDER BY id LIMIT $2
+            """, last_id, batch_size))
+            if not rows:
+                return
+            last_id = rows[-1]['id']
+            yield [tuple(row)[1:] for row in rows]
+
+    def count_records_before(self, before: date) -> int:
+        return self._run(self._pool.fetchval(
+            "SELECT COUNT(*) FROM health_records WHERE date_for < $1", before
+        ))
+
+    def prune_records_batch(self, before: date, limit: int) -> int:
+        # Data-modifying CTEs always run, so the summary insert needs no reference
+        return self._run(self._pool.fetchval("""
+            WITH doomed AS (
+                DELETE FROM health_records WHERE id IN (
+                    SELECT id FROM health_records WHERE date_for < $1 ORDER BY id LIMIT $2
+                )
+                RETURNING user_id, date_for, record_type, value, is_anomaly
+            ), summarized AS (
+                INSERT INTO daily_summaries
+                (user_id, date_for, record_type, records, samples, total, minimum, maximum)
+                SELECT user_id, date_for, record_type, COUNT(*),
+                       COUNT(*) FILTER (WHERE NOT is_anomaly),
+                       COALESCE(SUM(value) FILTER (WHERE NOT is_anomaly), 0),
+                       MIN(value) FILTER (WHERE NOT is_anomaly),
+                       MAX(value) FILTER (WHERE NOT is_anomaly)
+                FROM doomed
+                GROUP BY user_id, date_for, record_type
+                ON CONFLICT (user_id, date_for, record_type) DO UPDATE SET
+                    records = daily_summaries.records + EXCLUDED.records,
+                    samples = daily_summaries.samples + EXCLUDED.samples,
+                    total = daily_summaries.total + EXCLUDED.total,
+                    minimum = LEAST(daily_summaries.minimum, EXCLUDED.minimum),
+                    maximum = GREATEST(daily_summaries.maximum, EXCLUDED.maximum)
+            )
+            SELECT COUNT(*) FROM doomed
+        """, before, limit))
+
+    def count_user_records(self, user_id: int) -> int:
+        return self._run(self._pool.fetchval(
+            "SELECT COUNT(*) FROM health_records WHERE user_id = $1", user_id
+        ))
+
+    def get_last_record_id(self, user_id: int) -> Optional[int]:
+        return self._run(self._pool.fetchval(
+            "SELECT MAX(id) FROM health_records WHERE user_id = $1", user_id
+        ))
+
+    def delete_user_batch(self, user_id: int, limit: int) -> int:
+        async def run():
+            async with self._pool.acquire() as conn:
+                async with conn.transaction():
+                    result = await conn.execute("""
+                        DELETE FROM health_records WHERE id IN (
+                            SELECT id FROM health_records WHERE user_id = $1 LIMIT $2
+                        )
+                    """, user_id, limit)
+                    deleted = int(result.split()[-1])
+                    if deleted == 0:
+                        for table in ('daily_summaries', 'user_digests', 'metric_baselines',
+                                      'reminders_sent', 'user_preferences', 'users'):
+                            await conn.execute(f"DELETE FROM {table} WHERE user_id = $1", user_id)
+                    return deleted
+        return self._run(run())
+
+    def get_metric_rows_for_day(self, user_ids: List[int], target_date: date) -> List[tuple]:
+        if not user_ids:
+            return []
+        rows = self._run(self._pool.fetch("""
+            SELECT user_id, date_for, record_type, value, recorded_at
+            FROM health_records
+            WHERE date_for = $1 AND user_id = ANY($2::bigint[]) AND NOT is_anomaly
+        """, target_date, list(user_ids)))
+        return [tuple(row) for row in rows]
+
+    def get_metric_rows_between(self, user_ids: List[int], start_date: date, end_date: date) -> List[tuple]:
+        if not user_ids:
+            return []
+        rows = self._run(self._pool.fetch("""
+            SELECT user_id, date_for, record_type, value, recorded_at
+            FROM health_records
+            WHERE user_id = ANY($1::bigint[]) AND date_for BETWEEN $2 AND $3 AND NOT is_anomaly
+        """, list(user_ids), start_date, end_date))
+        return [tuple(row) for row in rows]
+
+    def get_active_user_ids(self, start_date: date, end_date: date, after: int = 0,
+                            limit: int = 1000) -> List[int]:
+        rows = self._run(self._pool.fetch("""
+            SELECT DISTINCT user_id FROM health_records
+            WHERE user_id > $1 AND date_for BETWEEN $2 AND $3
+            ORDER BY user_id
+            LIMIT $4
+        """, after, start_date, end_date, limit))
+        return [row['user_id'] for row in rows]
+
+    def save_digests(self, period: str, period_end: date, digests: Dict[int, Dict[str, Any]],
+                     last_user_id: int, completed: bool = False) -> bool:
+        async def run():
+            async with self._pool.acquire() as conn:
+                async with conn.transaction():
+                    await conn.executemany("""
+                        INSERT INTO user_digests (user_id, period, period_end, payload, computed_at)
+                        VALUES ($1, $2, $3, $4::jsonb, now())
+                        ON CONFLICT (user_id, period) DO UPDATE SET
+                            period_end = EXCLUDED.period_end,
+                            payload = EXCLUDED.payload,
+                            computed_at = EXCLUDED.computed_at
+                    """, [
+                        (user_id, period, period_end, json.dumps(digest))
+                        for user_id, digest in digests.items()
+                    ])
+                    await conn.execute("""
+                        INSERT INTO digest_progress (period, period_end, last_user_id, completed)
+                        VALUES ($1, $2, $3, $4)
+                        ON CONFLICT (period) DO UPDATE SET
+                            period_end = EXCLUDED.period_end,
+                            last_user_id = EXCLUDED.last_user_id,
+                            completed = EXCLUDED.completed
+                    """, period, period_end, last_user_id, completed)
+                    if completed:
+                        # Users the finished run did not cover were inactive: drop their older digests
+                        await conn.execute(
+                            "DELETE FROM user_digests WHERE period = $1 AND period_end < $2", period, period_end
+                        )
+
+        try:
+            self._run(run())
+            return True
+        except Exception as e:
+            logger.error("Error saving %s digests: %s", period, e)
+            return False
+
+    def get_digest_progress(self, period: str) -> Optional[Tuple[date, int, bool]]:
+        row = self._run(self._pool.fetchrow(
+            "SELECT period_end, last_user_id, completed FROM digest_progress WHERE period = $1", period
+        ))
+        if row is None:
+            return None
+        return row['period_end'], row['last_user_id'], row['completed']
+
+    def get_digest(self, user_id: int, period: str) -> Optional[Dict[str, Any]]:
+        try:
+            payload = self._run(self._pool.fetchval(
+                "SELECT payload FROM user_digests WHERE user_id = $1 AND period = $2", user_id, period
+            ))
+            return json.loads(payload) if payload else None
+        except Exception as e:
+            logger.error("Error getting %s digest for %s: %s", period, user_id, e)
+            return None
+
+    def get_quantile_sketch(self, record_type: str, start_date: date, end_date: date) -> QuantileSketch:
+        rows = self._run(self._pool.fetch("""
+            SELECT sketch FROM metric_sketches
+            WHERE record_type = $1 AND day BETWEEN $2 AND $3
+        """, record_type, start_date, end_date))
+        return QuantileSketch.merged(QuantileSketch.from_json(row['sketch']) for row in rows)
+
+    def get_active_users_sketch(self, start_date: date, end_date: date) -> HyperLogLog:
+        rows = self._run(self._pool.fetch("""
+            SELECT registers FROM active_user_sketches WHERE day BETWEEN $1 AND $2
+        """, start_date, end_date))
+        return HyperLogLog.union(HyperLogLog.from_bytes(row['registers']) for row in rows)
+
+    def get_dashboard_summary(self) -> Dict[str, Any]:
+        async def run():
+            async with self._pool.acquire() as conn:
+                users = await conn.fetchval("SELECT COUNT(*) FROM users")
+                recent = await conn.fetchval(
+                    "SELECT COUNT(*) FROM health_records WHERE date_for >= CURRENT_DATE - 7"
+                )
+                return {'users': users, 'recent_records': recent}
+        return self._run(run())
+
+    def get_global_stats(self) -> Dict[str, Any]:
+        async def run():
+            async with self._pool.acquire() as conn:
+                total_users = await conn.fetchval("SELECT COUNT(*) FROM users")
+                total_records = await conn.fetchval("SELECT COUNT(*) FROM health_records")
+                rows = await conn.fetch(
+                    "SELECT record_type, COUNT(*) AS count FROM health_records GROUP BY record_type"
+                )
+                # Approximate, from the day sketches instead of a DISTINCT scan
+                today = date.today()
+                registers = await conn.fetch(
+                    "SELECT registers FROM active_user_sketches WHERE day BETWEEN $1 AND $2",
+                    today - timedelta(days=7), today
+                )
+                active_users = HyperLogLog.union(
+                    HyperLogLog.from_bytes(row['registers']) for row in registers
+                ).count()
+                return {
+                    'total_users': total_users,
+                    'total_records': total_records,
+                    'active_users_week': active_users,
+                    'record_types': {row['record_type']: row['count'] for row in rows}
+                }
+        return self._run(run())
+
+    def get_time_series(self, metric: Optional[str], start_date: date, end_date: date,
+                        resolution: str = 'day') -> List[Dict[str, Any]]:
+        if resolution not in _BUCKET_FORMATS:
+            raise KeyError(resolution)
+        rows = self._run(self._pool.fetch("""
+            SELECT date_trunc($1, hour) AS bucket, SUM(records) AS records, SUM(samples) AS samples,
+                   SUM(total) AS total, MIN(minimum) AS min, MAX(maximum) AS max
+            FROM metric_rollups
+            WHERE ($2::text IS NULL OR record_type = $2)
+            AND hour >= $3::date AND hour < $4::date + 1
+            GROUP BY bucket
+            ORDER BY bucket
+        """, resolution, metric, start_date, end_date))
+        return [
+            {'bucket': row['bucket'].strftime(_BUCKET_FORMATS[resolution]), 'records': row['records'],
+             'samples': row['samples'], 'total': row['total'], 'min': row['min'], 'max': row['max']}
+            for row in rows
+        ]
+
+    def run_maintenance(self) -> Dict[str, Any]:
+        """Refresh planner statistics; autovacuum already reclaims dead rows"""
+        started = time.perf_counter()
+        try:
+            self._run(self._pool.execute("ANALYZE health_records"))
+            self._run(self._pool.execute("ANALYZE users"))
+            seconds = round(time.perf_counter() - started, 3)
+            logger.info("Analyzed PostgreSQL tables in %.2f s", seconds)
+            return {'statistics': 'analyze', 'seconds': seconds}
+        except Exception as e:
+            logger.error("Database maintenance failed: %s", e)
+            return {'error': str(e)}
+
+    def run_backup(self) -> Dict[str, Any]:
+        """Not handled in-process: use pg_dump or the server's continuous archiving"""
+        logger.info("Skipping backup: PostgreSQL is backed up with pg_dump or WAL archiving")
+        return {'skipped': 'postgresql'}
+
+    def close(self):
+        """Close the pool and stop the I/O loop"""
+        self._run(self._pool.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
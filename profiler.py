@@ -0,0 +1,273 @@
+"""
+Sampling profiler hooks for Health Tracker Bot
+Profiles handlers and analysis on demand and reports slow operations with stacks
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import functools
+import threading
+import traceback
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Set while a profiled call runs so nested analysis calls inherit the session
+_active_session: contextvars.ContextVar = contextvars.ContextVar("active_session", default=None)
+_active_user: contextvars.ContextVar = contextvars.ContextVar("active_user", default=None)
+
+
+def collapse_stack(frame) -> str:
+    """Render a frame chain as a collapsed stack line (root first)"""
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+
+def format_caller_stack(skip: int = 2, limit: int = 12) -> str:
+    """Format the current call stack for inclusion in a log message"""
+    return "".join(traceback.format_stack(limit=limit + skip)[:-skip])
+
+
+class Profiler:
+    """Runtime-toggleable sampling profiler for handlers and analysis calls"""
+
+    def __init__(self, output_dir: str = "profiles", interval_ms: float = 5.0,
+                 slow_handler_ms: float = 1000.0, slow_query_ms: float = 250.0):
+        self.output_dir = output_dir
+        self.interval = interval_ms / 1000
+        self.slow_handler_ms = slow_handler_ms
+        self.slow_query_ms = slow_query_ms
+
+        self.enabled_all = False
+        self.enabled_targets: Set[str] = set()
+        self.enabled_users: Set[int] = set()
+
+        self._lock = threading.Lock()
+        self._sessions: Dict[int, Dict[str, Any]] = {}
+        self._next_session = 0
+        self._sampler: Optional[threading.Thread] = None
+        self._inflight: Dict[int, tuple] = {}
+        self._next_inflight = 0
+        self._watchdog: Optional[threading.Thread] = None
+
+    def enable(self, target: str = None, user_id: int = None):
+        """Enable profiling for a handler/function name, a user id, or everything"""
+        if target is None and user_id is None:
+            self.enabled_all = True
+        if target:
+            self.enabled_targets.add(target)
+        if user_id is not None:
+            self.enabled_users.add(int(user_id))
+        logger.info("Profiler enabled: target=%s user_id=%s", target, user_id)
+
+    def disable(self, target: str = None, user_id: int = None):
+        """Disable profiling for a target or user; with no arguments disable all"""
+        if target is None and user_id is None:
+            self.enabled_all = False
+            self.enabled_targets.clear()
+            self.enabled_users.clear()
+        if target:
+            self.enabled_targets.discard(target)
+        if user_id is not None:
+            self.enabled_users.discard(int(user_id))
+        logger.info("Profiler disabled: target=%s user_id=%s", target, user_id)
+
+    def status(self) -> Dict[str, Any]:
+        """Current profiler configuration"""
+        return {
+            'enabled_all': self.enabled_all,
+            'targets': sorted(self.enabled_targets),
+            'users': sorted(self.enabled_users),
+            'active_sessions': len(self._sessions),
+            'interval_ms': self.interval * 1000,
+            'slow_handler_ms': self.slow_handler_ms,
+            'slow_query_ms': self.slow_query_ms,
+            'output_dir': self.output_dir,
+        }
+
+    def should_profile(self, name: str, user_id: Optional[int]) -> bool:
+        """Check whether a call should be sampled"""
+        return (self.enabled_all or name in self.enabled_targets
+                or (user_id is not None and user_id in self.enabled_users))
+
+    @contextmanager
+    def track(self, name: str, user_id: Optional[int] = None):
+        """Time a call, sample it when enabled and log it with a stack when slow"""
+        if user_id is None:
+            user_id = _active_user.get()
+        user_token = _active_user.set(user_id)
+
+        session_id = None
+        session_token = None
+        if _active_session.get() is None and self.should_profile(name, user_id):
+            session_id = self._start_session(name)
+            session_token = _active_session.set(session_id)
+
+        start = time.perf_counter()
+        watchdog_stack = []
+        inflight_id = None
+        if self.slow_handler_ms > 0:
+            inflight_id = self._watch(threading.get_ident(), start, watchdog_stack)
+
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if inflight_id is not None:
+                with self._lock:
+                    self._inflight.pop(inflight_id, None)
+
+            samples = None
+            if session_id is not None:
+                _active_session.reset(session_token)
+                samples = self._stop_session(session_id)
+                if samples:
+                    self._write(name, samples)
+            _active_user.reset(user_token)
+
+            if self.slow_handler_ms > 0 and elapsed_ms >= self.slow_handler_ms:
+                self._log_slow(name, user_id, elapsed_ms, watchdog_stack, samples)
+
+    def _watch(self, thread_id: int, start: float, out: list) -> int:
+        """Register an in-flight call with the slow-call watchdog"""
+        with self._lock:
+            self._next_inflight += 1
+            inflight_id = self._next_inflight
+            self._inflight[inflight_id] = (thread_id, start + self.slow_handler_ms / 1000, out)
+            if self._watchdog is None or not self._watchdog.is_alive():
+                self._watchdog = threading.Thread(target=self._run_watchdog,
+                                                  name="profiler-watchdog", daemon=True)
+                self._watchdog.start()
+        return inflight_id
+
+    def _run_watchdog(self):
+        """Snapshot the stack of any call that crosses the slow threshold while running"""
+        period = max(self.slow_handler_ms / 4000, 0.01)
+        while True:
+            time.sleep(period)
+            now = time.perf_counter()
+            with self._lock:
+                if not self._inflight:
+                    self._watchdog = None
+                    return
+                frames = None
+                for thread_id, deadline, out in self._inflight.values():
+                    if out or now < deadline:
+                        continue
+                    if frames is None:
+                        frames = sys._current_frames()
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        out.append(collapse_stack(frame))
+
+    def _log_slow(self, name: str, user_id: Optional[int], elapsed_ms: float,
+                  watchdog_stack: list, samples: Optional[Counter]):
+        """Log a slow call together with the stacks captured while it ran"""
+        if samples:
+            stacks = "\n".join(f"  {count} {stack}" for stack, count in samples.most_common(3))
+        elif watchdog_stack:
+            stacks = f"  {watchdog_stack[0]}"
+        else:
+            stacks = "  (no stack captured)"
+        logger.warning("Slow call %s (user=%s) took %.1f ms\n%s", name, user_id, elapsed_ms, stacks)
+
+    def _start_session(self, name: str) -> int:
+        """Register the current thread for sampling"""
+        with self._lock:
+            self._next_session += 1
+            session_id = self._next_session
+            self._sessions[session_id] = {
+                'name': name,
+                'thread_id': threading.get_ident(),
+                'samples': Counter(),
+            }
+            if self._sampler is None or not self._sampler.is_alive():
+                self._sampler = threading.Thread(target=self._run_sampler,
+                                                 name="profiler-sampler", daemon=True)
+                self._sampler.start()
+        return session_id
+
+    def _stop_session(self, session_id: int) -> Counter:
+        """Unregister a session and return its samples"""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        return session['samples'] if session else Counter()
+
+    def _run_sampler(self):
+        """Background thread sampling every registered thread until no sessions remain"""
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._sessions:
+                    self._sampler = None
+                    return
+                frames = sys._current_frames()
+                for session in self._sessions.values():
+                    frame = frames.get(session['thread_id'])
+                    if frame is not None:
+                        session['samples'][collapse_stack(frame)] += 1
+
+    def _write(self, name: str, samples: Counter):
+        """Append collapsed stacks (flamegraph.pl / speedscope format) to disk"""
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            path = os.path.join(self.output_dir, f"{name}.folded")
+            with open(path, "a", encoding="utf-8") as f:
+                for stack, count in samples.items():
+                    f.write(f"{stack} {count}\n")
+        except OSError as e:
+            logger.error("Failed to write profile for %s: %s", name, e)
+
+
+def _extract_user_id(args) -> Optional[int]:
+    """Find the Telegram user id among handler arguments"""
+    for arg in args:
+        user = getattr(arg, "effective_user", None)
+        if user is not None:
+            return user.id
+    return None
+
+
+def profiled(name: str) -> Callable:
+    """Decorator that routes a sync or async callable through the profiler"""
+    def decorator(func: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with profiler.track(name, _extract_user_id(args)):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with profiler.track(name, _extract_user_id(args)):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _env_set(key: str) -> Set[str]:
+    return {item.strip() for item in os.getenv(key, "").split(",") if item.strip()}
+
+
+profiler = Profiler(
+    output_dir=os.getenv("PROFILE_DIR", "profiles"),
+    interval_ms=float(os.getenv("PROFILE_INTERVAL_MS", "5")),
+    slow_handler_ms=float(os.getenv("SLOW_HANDLER_MS", "1000")),
+    slow_query_ms=float(os.getenv("SLOW_QUERY_MS", "250")),
+)
+
+for _target in _env_set("PROFILE_HANDLERS"):
+    profiler.enable(target=_target)
+for _user in _env_set("PROFILE_USERS"):
+    profiler.enable(user_id=int(_user))
@@ -0,0 +1,157 @@
+"""
+Retention and bulk deletion for Health Tracker Bot
+Deletes records in small, paced transactions so bot writes are never stuck behind one long DELETE
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Callable, Dict, List, Optional
+
+from storage import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+# Raw records older than this many days are rolled up and pruned; 0 keeps them forever
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "0"))
+
+
+@dataclass
+class RetentionJob:
+    """Progress of one prune or user deletion"""
+    kind: str                      # 'prune' or 'delete_user'
+    total: int
+    processed: int = 0
+    batches: int = 0
+    status: str = 'running'        # running, done, paused (time budget spent) or failed
+    started_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {
+            'kind': self.kind,
+            'status': self.status,
+            'processed': self.processed,
+            'total': self.total,
+            'percent': round(100 * self.processed / self.total, 1) if self.total else 100.0,
+            'batches': self.batches,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'error': self.error,
+        }
+
+
+class RetentionEngine:
+    """Runs deletions as many short transactions with a pause between them
+
+    Each batch deletes at most `batch_size` records in its own
+    transaction, then sleeps `pause` seconds so waiting writers get the
+    lock; that also caps the deletion rate at batch_size / pause records
+    per second. A prune stops after `max_seconds` and picks up where it
+    left off on its next run. Call these from a worker thread, never from
+    the event loop.
+    """
+
+    def __init__(self, batch_size: int = 500, pause: float = 0.2, max_seconds: float = 600,
+                 history: int = 20):
+        self.batch_size = batch_size
+        self.pause = pause
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+        self._running: List[RetentionJob] = []
+        self._recent = deque(maxlen=history)
+
+    @classmethod
+    def from_env(cls) -> 'RetentionEngine':
+        return cls(
+            batch_size=int(os.getenv("RETENTION_BATCH", "500")),
+            pause=float(os.getenv("RETENTION_PAUSE", "0.2")),
+            max_seconds=float(os.getenv("RETENTION_MAX_SECONDS", "600"))
+        )
+
+    def prune(self, storage: StorageBackend, before: date) -> RetentionJob:
+        """Roll up and delete every record dated before `before`"""
+        job = RetentionJob('prune', storage.count_records_before(before))
+        return self._drain(job, lambda: storage.prune_records_batch(before, self.batch_size),
+                           deadline=time.monotonic() + self.max_seconds)
+
+    def delete_user(self, storage: StorageBackend, user_id: int) -> RetentionJob:
+        """Delete all of a user's data; runs to completion regardless of the time budget
+
+        Once the stored data is gone, derived copies go too: cached charts
+        and analysis results are evicted and the user is hidden in the
+        columnar archive, whose files drop the rows at the next rebuilds.
+        """
+        job = RetentionJob('delete_user', storage.count_user_records(user_id))
+        self._drain(job, lambda: storage.delete_user_batch(user_id, self.batch_size))
+        if job.status == 'done':
+            forget_derived(user_id)
+        return job
+
+    def _drain(self, job: RetentionJob, step: Callable[[], int],
+               deadline: Optional[float] = None) -> RetentionJob:
+        with self._lock:
+            self._running.append(job)
+        try:
+            while True:
+                deleted = step()
+                job.batches += 1
+                if deleted == 0:
+                    job.status = 'done'
+                    break
+                job.processed += deleted
+                if deadline is not None and time.monotonic() >= deadline:
+                    job.status = 'paused'
+                    break
+                time.sleep(self.pause)
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e)
+            logger.error("Retention %s failed after %s records: %s", job.kind, job.processed, e)
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                self._running.remove(job)
+                self._recent.append(job)
+        logger.info("Retention %s %s: %s/%s records in %s batches, %.1f s",
+                    job.kind, job.status, job.processed, job.total, job.batches,
+                    job.finished_at - job.started_at)
+        return job
+
+    def status(self) -> Dict[str, list]:
+        """Running and recently finished jobs (without user ids)"""
+        with self._lock:
+            return {
+                'running': [job.to_dict() for job in self._running],
+                'recent': [job.to_dict() for job in reversed(self._recent)],
+            }
+
+
+retention = RetentionEngine.from_env()
+
+
+def forget_derived(user_id: int):
+    """Drop a deleted user's charts, cached analysis results and archive rows"""
+    from charts import chart_cache
+    from inference_cache import inference_cache
+    from archive import forget_user
+    try:
+        charts_removed = chart_cache.evict_user(user_id)
+        results_removed = inference_cache.evict_user(user_id)
+        archived = forget_user(user_id)
+        logger.info("Dropped derived data of a deleted user: %s charts, %s cached results%s",
+                    charts_removed, results_removed, ", hidden in the archive" if archived else "")
+    except Exception as e:
+        logger.error("Error dropping derived data of a deleted user: %s", e)
+
+
+def apply_retention(storage: StorageBackend) -> Optional[RetentionJob]:
+    """Prune records older than RETENTION_DAYS (nightly job); None when retention is off"""
+    if RETENTION_DAYS <= 0:
+        return None
+    return retention.prune(storage, date.today() - timedelta(days=RETENTION_DAYS))
@@ -2,118 +2,177 @@
 Scheduler for daily reminders and automated tasks
 """
 
+import os
 import asyncio
 import logging
-from datetime import datetime, time, timedelta
-from aiogram import Bot
-from aiogram.exceptions import TelegramForbiddenError, TelegramNotFound
+import socket
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Set, Tuple
+from telegram import Bot
+from telegram.error import Forbidden, BadRequest
 
-from database import get_all_users, check_today_data_exists
-from config import REMINDER_TIME, DEFAULT_TIMEZONE_OFFSET
+from storage import StorageBackend
+from outbox import Outbox, BULK
+from messages import catalog
 
 logger = logging.getLogger(__name__)
 
-async def send_daily_reminder(bot: Bot, user_telegram_id: int, user_name: str, user_id: int):
-    """Send daily reminder to a specific user"""
-    try:
-        # Use local time for date calculation
-        utc_now = datetime.now()
-        local_time = utc_now + timedelta(hours=DEFAULT_TIMEZONE_OFFSET)
-        today_date = local_time.strftime("%Y-%m-%d")
-        
-        # Check if user already submitted data today
-        data_exists = await check_today_data_exists(user_id, today_date)
-        if data_exists:
-            return  # Don't send reminder if data already exists
-        
-        reminder_message = f"""
-🔔 **Kunlik eslatma!**
+REMINDER_LEASE = "daily_reminders"
+
+# Reminders are sent without an incoming update, so their language is configured
+REMINDER_LOCALE = os.getenv("REMINDER_LOCALE", "uz")
+
+
+class ReminderScheduler:
+    """Sends each user's daily reminder at their chosen time
+
+    Every bot process runs this loop, but only the holder of the
+    database lease sends anything, and each (user, day) reminder is
+    claimed in the database before it is sent, so reminders go out once
+    even with several workers or after a leader change. Minutes missed
+    while the loop was busy, paused or waiting for the lease are caught
+    up (within the same day), so no reminder time is skipped. Daily jobs
+    registered with add_daily_job run on the lease holder too, once per
+    day as soon as their time has passed, in a worker thread.
+    """
 
-Salom {user_name}! Bugungi sog'lik ma'lumotlaringizni kiritish vaqti keldi.
+    def __init__(self, bot: Bot, storage: StorageBackend, lease_ttl: float = 90,
+                 owner: str = None, outbox: Outbox = None):
+        self.bot = bot
+        self.storage = storage
+        self.outbox = outbox
+        self.lease_ttl = lease_ttl
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        self._task = None
+        self._jobs: List[Tuple[str, str, Callable]] = []
+        self._last_minute: Optional[datetime] = None
+        self._started_jobs: Set[str] = set()
+        # The loop only keeps weak references to tasks; running jobs are held here
+        self._job_tasks: Set[asyncio.Task] = set()
+        self.reminder_text = catalog(REMINDER_LOCALE).text('reminder.message')
 
-Quyidagi ma'lumotlarni kiriting:
-🛏 Uyqu vaqti
-🏃‍♂️ Jismoniy faollik vaqti
-😤 Agressiya darajasi
-😊 Kayfiyat
+    def add_daily_job(self, name: str, at: str, func: Callable):
+        """Run func(storage) once a day at the HH:MM time `at`"""
+        datetime.strptime(at, "%H:%M")
+        self._jobs.append((name, at, func))
 
-Ma'lumot kiritish uchun /today buyrug'ini ishlating.
+    def start(self) -> asyncio.Task:
+        """Start the scheduler loop on the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+            logger.info("Reminder scheduler started (%s)", self.owner)
+        return self._task
+
+    async def run(self):
+        """Check for due reminders at the start of every minute"""
+        while True:
+            try:
+                now = datetime.now()
+                if await asyncio.to_thread(self.storage.acquire_lease, REMINDER_LEASE, self.owner,
+                                           self.lease_ttl):
+                    for minute in self.pending_minutes(now):
+                        await self.send_due_reminders(minute)
+                        self._last_minute = minute
+                    await self.run_due_jobs(now)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Error in reminder scheduler: %s", e)
+
+            await asyncio.sleep(60 - datetime.now().second)
+
+    def pending_minutes(self, now: datetime) -> List[datetime]:
+        """Minutes to send reminders for: every one since the last handled, through now
+
+        A new leader (or a fresh process) also looks back over one lease
+        TTL, the longest a previous holder can have been gone unnoticed;
+        reminder claims keep those minutes from sending twice. The
+        catch-up never reaches back past midnight, since claims are per day.
         """
+        current = now.replace(second=0, microsecond=0)
+        if self._last_minute is not None:
+            first = self._last_minute + timedelta(minutes=1)
+        else:
+            first = current - timedelta(minutes=int(self.lease_ttl // 60))
+        first = max(first, current.replace(hour=0, minute=0))
+        return [first + timedelta(minutes=offset)
+                for offset in range(int((current - first).total_seconds() // 60) + 1)]
+
+    async def send_due_reminders(self, now: datetime) -> int:
+        """Send reminders to users whose reminder time is now and who haven't logged today"""
+        reminder_time = now.strftime("%H:%M")
+        today = now.date()
+        users = await asyncio.to_thread(self.storage.get_reminder_candidates, reminder_time, today)
+        if not users:
+            return 0
+
+        logger.info("Sending %s reminders for %s", len(users), reminder_time)
+        if self.outbox is not None and self.outbox.running:
+            # Queued behind interactive replies; send() blocks while the outbox is full
+            deliveries = []
+            for user_id in users:
+                if await asyncio.to_thread(self.storage.claim_reminder, user_id, today):
+                    deliveries.append(await self.outbox.send(
+                        user_id, self.reminder_text, parse_mode="Markdown", priority=BULK
+                    ))
+            results = await asyncio.gather(*deliveries)
+            return sum(message is not None for message in results)
         
-        await bot.send_message(user_telegram_id, reminder_message, parse_mode="Markdown")
-        logger.info(f"Reminder sent to user {user_telegram_id}")
-        
-    except TelegramForbiddenError:
-        logger.warning(f"User {user_telegram_id} blocked the bot")
-    except TelegramNotFound:
-        logger.warning(f"User {user_telegram_id} not found")
-    except Exception as e:
-        logger.error(f"Error sending reminder to {user_telegram_id}: {e}")
-
-async def daily_reminder_task(bot: Bot):
-    """Task to send daily reminders to all users"""
-    logger.info("Starting daily reminder task")
-    
-    try:
-        users = await get_all_users()
-        logger.info(f"Sending reminders to {len(users)} users")
-        
-        for user in users:
-            await send_daily_reminder(
-                bot, 
-                user['telegram_id'], 
-                user['full_name'], 
-                user['id']
-            )
+        sent = 0
+        for user_id in users:
+            if not await asyncio.to_thread(self.storage.claim_reminder, user_id, today):
+                continue
+            if await self.send_reminder(user_id):
+                sent += 1
             # Small delay to avoid rate limiting
-            await asyncio.sleep(0.1)
-        
-        logger.info("Daily reminders sent successfully")
-    
-    except Exception as e:
-        logger.error(f"Error in daily reminder task: {e}")
-
-async def schedule_daily_reminders(bot: Bot):
-    """Schedule daily reminders at specified time"""
-    while True:
+            await asyncio.sleep(0.05)
+        return sent
+
+    async def run_due_jobs(self, now: datetime):
+        """Start daily jobs whose time has passed today and that haven't run today"""
+        current = now.strftime("%H:%M")
+        for name, at, func in self._jobs:
+            lease = f"{name}:{now.date()}"
+            if at > current or lease in self._started_jobs:
+                continue
+            # A day-scoped lease keeps a job from running twice after a leader change
+            if not await asyncio.to_thread(self.storage.acquire_lease, lease, self.owner, 2 * 86400):
+                continue
+            self._started_jobs = {key for key in self._started_jobs if key.endswith(f":{now.date()}")}
+            self._started_jobs.add(lease)
+            task = asyncio.create_task(self._run_job(name, func))
+            self._job_tasks.add(task)
+            task.add_done_callback(self._job_tasks.discard)
+
+    async def stop(self):
+        """Stop the loop, then wait for daily jobs still running so none is left half done"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._job_tasks:
+            logger.info("Waiting for %s running daily job(s) before shutdown", len(self._job_tasks))
+            await asyncio.gather(*self._job_tasks, return_exceptions=True)
+        logger.info("Reminder scheduler stopped (%s)", self.owner)
+
+    async def _run_job(self, name: str, func: Callable):
+        try:
+            logger.info("Running daily job %s", name)
+            await asyncio.to_thread(func, self.storage)
+        except Exception as e:
+            logger.error("Daily job %s failed: %s", name, e)
+
+    async def send_reminder(self, user_id: int) -> bool:
+        """Send the daily reminder to a single user"""
         try:
-            # Use local time for scheduling
-            utc_now = datetime.now()
-            local_now = utc_now + timedelta(hours=DEFAULT_TIMEZONE_OFFSET)
-            target_time = time(21, 0)  # 21:00 local time
-            
-            # Calculate next reminder time in local timezone
-            today_reminder_local = datetime.combine(local_now.date(), target_time)
-            if local_now.time() > target_time:
-                # If it's already past today's reminder time, schedule for tomorrow
-                today_reminder_local += timedelta(days=1)
-            
-            # Convert back to UTC for scheduling
-            today_reminder_utc = today_reminder_local - timedelta(hours=DEFAULT_TIMEZONE_OFFSET)
-            
-            # Calculate sleep duration
-            sleep_seconds = (today_reminder_utc - utc_now).total_seconds()
-            logger.info(f"Next reminder scheduled for: {today_reminder_local} local time ({today_reminder_utc} UTC)")
-            
-            # Sleep until reminder time
-            await asyncio.sleep(sleep_seconds)
-            
-            # Send reminders
-            await daily_reminder_task(bot)
-            
-            # Sleep a bit to avoid multiple executions in the same minute
-            await asyncio.sleep(60)
-            
+            await self.bot.send_message(chat_id=user_id, text=self.reminder_text, parse_mode="Markdown")
+            return True
+        except Forbidden:
+            logger.warning("User %s blocked the bot", user_id)
+        except BadRequest as e:
+            logger.warning("Could not send reminder to %s: %s", user_id, e)
         except Exception as e:
-            logger.error(f"Error in reminder scheduler: {e}")
-            # Wait 5 minutes before retrying
-            await asyncio.sleep(300)
-
-async def start_scheduler(bot: Bot):
-    """Start the reminder scheduler"""
-    logger.info("Starting reminder scheduler")
-    
-    # Create background task for daily reminders
-    asyncio.create_task(schedule_daily_reminders(bot))
-    
-    logger.info("Reminder scheduler started successfully")
+            logger.error("Error sending reminder to %s: %s", user_id, e)
+        return False
@@ -0,0 +1,209 @@
+"""
+Mergeable summary sketches for dashboard statistics
+Small fixed-size structures updated on write and combined across days and shards
+"""
+
+import os
+import json
+import math
+import hashlib
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+# Partial quantile sketches kept per metric and day; writers of different
+# users update different rows, and readers merge the slots
+SKETCH_SLOTS = int(os.getenv("SKETCH_SLOTS", "16"))
+
+
+def sketch_slot(user_id: int) -> int:
+    """Which of a day's partial metric sketches a user's values go into"""
+    return user_id % SKETCH_SLOTS
+
+
+class QuantileSketch:
+    """Relative-error quantile sketch with logarithmic buckets (DDSketch style)
+
+    Positive values fall into buckets whose bounds grow by a factor of
+    gamma = (1 + accuracy) / (1 - accuracy), so any reported quantile is
+    within `accuracy` relative error of a true sample value. Zero and
+    negative values share one bucket. Two sketches with the same accuracy
+    merge by adding bucket counts, which makes per-day, per-shard sketches
+    combinable into any window. When more than `max_buckets` are in use
+    the lowest ones are collapsed, trading accuracy at the low tail only.
+    """
+
+    def __init__(self, accuracy: float = 0.01, max_buckets: int = 2048):
+        self.accuracy = accuracy
+        self.max_buckets = max_buckets
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float, weight: int = 1):
+        """Record a value"""
+        if value > 0:
+            index = math.ceil(math.log(value) / self._log_gamma)
+            self.buckets[index] = self.buckets.get(index, 0) + weight
+            if len(self.buckets) > self.max_buckets:
+                self._collapse()
+        else:
+            self.zero_count += weight
+        self.count += weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def _collapse(self):
+        indexes = sorted(self.buckets)
+        excess = len(indexes) - self.max_buckets
+        carried = sum(self.buckets.pop(index) for index in indexes[:excess])
+        self.buckets[indexes[excess]] += carried
+
+    def merge(self, other: 'QuantileSketch') -> 'QuantileSketch':
+        """Add another sketch's counts into this one"""
+        if other.accuracy != self.accuracy:
+            raise ValueError("Cannot merge quantile sketches with different accuracy")
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        if len(self.buckets) > self.max_buckets:
+            self._collapse()
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Approximate q-quantile (0 <= q <= 1), or None for an empty sketch"""
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                estimate = 2 * self.gamma ** index / (self.gamma + 1)
+                return min(max(estimate, self.min), self.max)
+        return self.max
+
+    def to_json(self) -> str:
+        return json.dumps({
+            'a': self.accuracy,
+            'n': self.count,
+            'z': self.zero_count,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None,
+            'b': self.buckets,
+        }, separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, data: Optional[str]) -> 'QuantileSketch':
+        if not data:
+            return cls()
+        state = json.loads(data)
+        sketch = cls(accuracy=state['a'])
+        sketch.count = state['n']
+        sketch.zero_count = state['z']
+        if state['min'] is not None:
+            sketch.min, sketch.max = state['min'], state['max']
+        sketch.buckets = {int(index): count for index, count in state['b'].items()}
+        return sketch
+
+    @classmethod
+    def merged(cls, sketches: Iterable['QuantileSketch']) -> 'QuantileSketch':
+        result = cls()
+        for sketch in sketches:
+            result.merge(sketch)
+        return result
+
+
+class HyperLogLog:
+    """Approximate distinct counter with 2**precision one-byte registers
+
+    The default precision of 12 uses 4 KB per sketch for a standard error
+    of about 1.6%. Sketches of the same precision union by taking the
+    register-wise maximum, so per-day sketches combine into any window.
+    """
+
+    def __init__(self, precision: int = 12, registers: bytes = None):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers) if registers else bytearray(self.size)
+        if len(self.registers) != self.size:
+            raise ValueError("Register array does not match the sketch precision")
+
+    def position(self, item) -> tuple:
+        """(register index, rank) that item maps to"""
+        hashed = int.from_bytes(
+            hashlib.blake2b(str(item).encode('utf-8'), digest_size=8).digest(), 'big'
+        )
+        index = hashed >> (64 - self.precision)
+        remainder = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - remainder.bit_length() + 1
+        return index, rank
+
+    def add(self, item) -> bool:
+        """Count an item; True if the sketch changed"""
+        index, rank = self.position(item)
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            return True
+        return False
+
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        """Union another sketch into this one"""
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches with different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self) -> int:
+        """Estimated number of distinct items added"""
+        m = self.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        histogram = Counter(self.registers)
+        estimate = alpha * m * m / sum(count * 2.0 ** -rank for rank, count in histogram.items())
+        zeros = histogram.get(0, 0)
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate while many registers are empty
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data: Optional[bytes], precision: int = 12) -> 'HyperLogLog':
+        return cls(precision, data or None)
+
+    @classmethod
+    def union(cls, sketches: Iterable['HyperLogLog'], precision: int = 12) -> 'HyperLogLog':
+        """Union of many sketches (vectorized when numpy is available)"""
+        sketches = list(sketches)
+        if not sketches:
+            return cls(precision)
+        try:
+            import numpy as np
+        except ImportError:
+            result = cls(precision)
+            for sketch in sketches:
+                result.merge(sketch)
+            return result
+        if any(sketch.precision != precision for sketch in sketches):
+            raise ValueError("Cannot merge HyperLogLog sketches with different precision")
+        stacked = np.frombuffer(b"".join(sketch.registers for sketch in sketches), dtype=np.uint8)
+        return cls(precision, stacked.reshape(len(sketches), -1).max(axis=0).tobytes())
+
+
+def percentile_summary(sketch: QuantileSketch, quantiles: List[float]) -> Dict[str, Optional[float]]:
+    """{'p50': ..., 'p90': ...} for the requested quantiles"""
+    return {f"p{q * 100:g}": _round(sketch.quantile(q)) for q in quantiles}
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value, 2)
@@ -0,0 +1,115 @@
+"""
+Startup timing for Health Tracker Bot
+Tracks cold start against a time budget and reports per-module import cost
+"""
+
+import os
+import sys
+import time
+import builtins
+import logging
+import threading
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ImportTimer:
+    """Record self and cumulative import time per module, like `python -X importtime`"""
+
+    def __init__(self):
+        self.records: List[Tuple[str, float, float, int]] = []
+        self._local = threading.local()
+        self._original = None
+
+    def install(self):
+        """Start timing imports made through the import statement"""
+        if self._original is None:
+            self._original = builtins.__import__
+            builtins.__import__ = self._timed_import
+
+    def uninstall(self):
+        """Restore the original import function"""
+        if self._original is not None:
+            builtins.__import__ = self._original
+            self._original = None
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return self._original(name, globals, locals, fromlist, level)
+
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return self._original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            self.records.append((name, (elapsed - children) * 1e6, elapsed * 1e6, len(stack)))
+
+    def report(self, top: int = 15) -> str:
+        """Format the import tree followed by the slowest top-level imports"""
+        lines = ["import time: self [us] | cumulative | imported package"]
+        for name, self_us, cumulative_us, depth in self.records:
+            lines.append(f"import time: {self_us:9.0f} | {cumulative_us:10.0f} | {'  ' * depth}{name}")
+
+        roots = sorted((r for r in self.records if r[3] == 0), key=lambda r: r[2], reverse=True)
+        lines.append("")
+        lines.append(f"Slowest top-level imports (of {len(roots)}):")
+        for name, _, cumulative_us, _ in roots[:top]:
+            lines.append(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+        return "\n".join(lines)
+
+
+class StartupTimer:
+    """Cold start phases measured from the moment this module was first imported"""
+
+    def __init__(self, budget_ms: float):
+        self.budget_ms = budget_ms
+        self.started = time.perf_counter()
+        self.phases: List[Tuple[str, float]] = []
+        self.import_timer: Optional[ImportTimer] = None
+
+    def enable_import_report(self):
+        """Time every subsequent module import for the startup report"""
+        if self.import_timer is None:
+            self.import_timer = ImportTimer()
+            self.import_timer.install()
+
+    def mark(self, phase: str):
+        """Record the elapsed time at the end of a startup phase"""
+        self.phases.append((phase, (time.perf_counter() - self.started) * 1000))
+
+    @property
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def check_budget(self) -> bool:
+        """Log the cold start time and warn when it exceeds the budget"""
+        elapsed = self.elapsed_ms
+        if self.budget_ms > 0 and elapsed > self.budget_ms:
+            logger.warning("Startup took %.0f ms, over the %.0f ms budget", elapsed, self.budget_ms)
+            return False
+        logger.info("Startup took %.0f ms", elapsed)
+        return True
+
+    def report(self) -> str:
+        """Format phase timings and, when enabled, the import report"""
+        lines = [f"Startup report (budget {self.budget_ms:.0f} ms)"]
+        previous = 0.0
+        for phase, at_ms in self.phases:
+            lines.append(f"  {at_ms:8.1f} ms  (+{at_ms - previous:7.1f})  {phase}")
+            previous = at_ms
+        if self.import_timer is not None:
+            self.import_timer.uninstall()
+            lines.append("")
+            lines.append(self.import_timer.report())
+        return "\n".join(lines)
+
+
+startup = StartupTimer(budget_ms=float(os.getenv("STARTUP_BUDGET_MS", "3000")))
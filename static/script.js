@@ -13,6 +13,14 @@ class HealthTrackerDashboard {
     init() {
         console.log('Initializing Health Tracker Dashboard...');
         
+        // Reload the activity chart when its series options change
+        ['series-metric', 'series-range', 'series-resolution'].forEach(id => {
+            const element = document.getElementById(id);
+            if (element) {
+                element.addEventListener('change', () => this.loadActivityChart());
+            }
+        });
+        
         // Load initial data
         this.loadDashboardData();
         
@@ -94,15 +102,37 @@ class HealthTrackerDashboard {
         }
     }
     
+    seriesOptions() {
+        const value = (id, fallback) => {
+            const element = document.getElementById(id);
+            return element ? element.value : fallback;
+        };
+        return {
+            metric: value('series-metric', ''),
+            days: value('series-range', '30'),
+            resolution: value('series-resolution', 'auto')
+        };
+    }
+    
     async loadActivityChart() {
         try {
-            const response = await fetch('/api/recent-activity');
+            const options = this.seriesOptions();
+            const params = new URLSearchParams({
+                days: options.days,
+                resolution: options.resolution,
+                points: '400'
+            });
+            if (options.metric) {
+                params.set('metric', options.metric);
+            }
+            
+            const response = await fetch(`/api/timeseries?${params}`);
             const data = await response.json();
             
             if (response.ok) {
-                this.updateActivityChart(data);
+                this.updateActivityChart(data, options);
             } else {
-                throw new Error('Failed to load activity data');
+                throw new Error(data.error || 'Failed to load activity data');
             }
             
         } catch (error) {
@@ -111,16 +141,34 @@ class HealthTrackerDashboard {
         }
     }
     
-    updateActivityChart(data) {
+    formatBucket(bucket, resolution) {
+        if (resolution === 'hour') {
+            const date = new Date(bucket.replace(' ', 'T') + 'Z');
+            return date.toLocaleString('en-US', { month: 'short', day: 'numeric', hour: '2-digit' });
+        }
+        const date = new Date(bucket + 'T00:00:00Z');
+        if (resolution === 'month') {
+            return date.toLocaleDateString('en-US', { month: 'short', year: 'numeric', timeZone: 'UTC' });
+        }
+        return date.toLocaleDateString('en-US', { month: 'short', day: 'numeric', timeZone: 'UTC' });
+    }
+    
+    updateActivityChart(data, options) {
         const ctx = document.getElementById('activityChart').getContext('2d');
         
-        // Prepare data for Chart.js
-        const labels = data.map(item => {
-            const date = new Date(item.date);
-            return date.toLocaleDateString('en-US', { month: 'short', day: 'numeric' });
-        }).reverse();
+        // Buckets arrive oldest first, one array per field
+        const labels = data.buckets.map(bucket => this.formatBucket(bucket, data.resolution));
+        const counts = data.metric ? data.mean : data.records;
+        const periods = { hour: 'Hourly', day: 'Daily', week: 'Weekly', month: 'Monthly' };
+        const subject = data.metric
+            ? `${data.metric.charAt(0).toUpperCase() + data.metric.slice(1)} (average)`
+            : 'Records';
         
-        const counts = data.map(item => item.count).reverse();
+        const title = document.getElementById('activity-title');
+        if (title) {
+            title.innerHTML = `<i class="fas fa-chart-area me-2"></i>${periods[data.resolution]} ${subject} ` +
+                `(Last ${options.days} Days)`;
+        }
         
         // Destroy existing chart if it exists
         if (this.activityChart) {
@@ -132,8 +180,9 @@ class HealthTrackerDashboard {
             data: {
                 labels: labels,
                 datasets: [{
-                    label: 'Daily Records',
+                    label: `${periods[data.resolution]} ${subject}`,
                     data: counts,
+                    spanGaps: true,
                     borderColor: 'rgb(0, 123, 255)',
                     backgroundColor: 'rgba(0, 123, 255, 0.1)',
                     borderWidth: 2,
@@ -160,7 +209,7 @@ class HealthTrackerDashboard {
                         }
                     },
                     y: {
-                        beginAtZero: true,
+                        beginAtZero: !data.metric,
                         grid: {
                             color: 'rgba(0,0,0,0.1)'
                         }
@@ -0,0 +1,58 @@
+"""
+Tests for the streaming anomaly detector
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from anomaly import AnomalyDetector
+
+
+def feed(detector, record_type, values):
+    """Observe values in order and return the flags"""
+    state, flags = None, []
+    for value in values:
+        flagged, state = detector.observe(state, value, record_type)
+        flags.append(flagged)
+    return flags
+
+
+detector = AnomalyDetector()
+
+
+def test_steady_mood_then_ordinary_change():
+    assert feed(detector, 'mood', [7] * 5 + [3]) == [False] * 6
+    assert feed(detector, 'mood', [7] * 5 + [10]) == [False] * 6
+
+
+def test_steady_sleep_then_short_night():
+    assert feed(detector, 'sleep', [8] * 5 + [5]) == [False] * 6
+
+
+def test_steady_water_then_more():
+    assert feed(detector, 'water', [2000] * 5 + [3000]) == [False] * 6
+
+
+def test_steps_with_small_spread_then_active_day():
+    assert feed(detector, 'steps', [8000, 8100, 7900, 8050, 7950, 13000]) == [False] * 6
+
+
+def test_exercise_after_rest_days():
+    assert feed(detector, 'exercise', [0] * 5 + [30, 45, 60, 40, 90]) == [False] * 10
+
+
+def test_real_outliers_are_still_flagged():
+    assert feed(detector, 'steps', [8000] * 5 + [80000])[-1]
+    assert feed(detector, 'weight', [70] * 5 + [120])[-1]
+    assert feed(detector, 'sleep', [8] * 5 + [20])[-1]
+
+
+def test_nothing_flagged_without_history():
+    assert feed(detector, 'steps', [8000, 90000]) == [False, False]
+
+
+def test_unknown_metric_uses_relative_floor():
+    assert detector.is_anomaly([100] * 5, 104, 'custom') is False
+    assert detector.is_anomaly([100] * 5, 200, 'custom') is True
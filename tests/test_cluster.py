@@ -0,0 +1,39 @@
+"""
+Tests for cluster worker processes
+"""
+
+import sys
+import asyncio
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cluster import ClusterRouter
+
+
+def offload_in_worker(index, queue):
+    """Worker target: run one export through the offload pool and report the outcome"""
+    from export import pack_records, records_to_csv
+    from offload import ProcessOffloader
+
+    offloader = ProcessOffloader(max_workers=1, timeout=60)
+    columns = pack_records([{'date_for': '2026-01-31', 'record_type': 'steps', 'value': 8000.0,
+                             'unit': 'steps', 'notes': None, 'recorded_at': '2026-01-31 20:00:00'}])
+    try:
+        queue.put(asyncio.run(offloader.run(records_to_csv, columns)))
+    except Exception as e:
+        queue.put(repr(e))
+    finally:
+        offloader.shutdown(wait=True)
+
+
+def test_worker_can_offload_to_a_process_pool():
+    router = ClusterRouter("token", 1, target=offload_in_worker)
+    router.start_workers()
+    try:
+        result = router.queues[0].get(timeout=120)
+    finally:
+        router.stop(timeout=30)
+    assert isinstance(result, bytes), result
+    assert result.splitlines()[1] == b"2026-01-31,steps,8000.0,steps,,2026-01-31 20:00:00"
+    assert router.workers[0].exitcode == 0